@@ -0,0 +1,357 @@
+# alarm_rules.py
+
+"""
+流式报警规则引擎: 决定真空度、冷泵温度、液氮液位/压力等读数何时触发报警 (三色灯、短信)。
+
+- 样本以流的形式输入 (feed(通道, 时间戳, 数值))，不保存、也不回扫历史；
+- 每条规则对一个通道的某个 "特征" 做阈值判断。特征在时间窗口上增量维护，每个样本 O(1) (均摊):
+	value       - 最新值
+	mean        - 滑动平均 (窗口内样本的运行和)
+	rate        - 变化率 (窗口内首尾样本的差 / 时间差，单位 每秒)
+	min / max   - 滑动最小/最大值 (单调队列)
+  同一通道上特征和窗口相同的规则共用一个窗口对象；
+- 阈值带回差 (hysteresis): 超过上限 high 报警，回落到 high - hysteresis 以下才解除 (下限同理)，
+  读数在阈值附近抖动时不会反复报警/解除；raise_after 要求连续 N 个样本越限才报警 (去抖)；
+- feed() 只返回状态变化 (报警 / 解除) 的事件，active() 给出当前全部报警。
+"""
+
+import argparse
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from timeseries_store import parse_reading
+from tools import LoggerMixin
+
+FEATURES = ("value", "mean", "rate", "min", "max")
+
+
+# --- 窗口特征 (每个样本 O(1) 均摊) ---
+
+class _Latest:
+	__slots__ = ("value",)
+
+	def __init__(self, window: float):
+		self.value: Optional[float] = None
+
+	def update(self, ts: float, value: float) -> Optional[float]:
+		self.value = value
+		return value
+
+
+class _WindowMean:
+	__slots__ = ("window", "samples", "total")
+
+	def __init__(self, window: float):
+		self.window = window
+		self.samples: Deque[Tuple[float, float]] = deque()
+		self.total = 0.0
+
+	def update(self, ts: float, value: float) -> Optional[float]:
+		self.samples.append((ts, value))
+		self.total += value
+		horizon = ts - self.window
+		samples = self.samples
+		while samples[0][0] <= horizon:
+			self.total -= samples.popleft()[1]
+		if len(samples) == 1:
+			self.total = value  # 窗口只剩一个样本时清掉累积的舍入误差
+		return self.total / len(samples)
+
+
+class _WindowRate:
+	__slots__ = ("window", "samples")
+
+	def __init__(self, window: float):
+		self.window = window
+		self.samples: Deque[Tuple[float, float]] = deque()
+
+	def update(self, ts: float, value: float) -> Optional[float]:
+		samples = self.samples
+		samples.append((ts, value))
+		horizon = ts - self.window
+		while samples[0][0] < horizon:
+			samples.popleft()
+		first_ts, first_value = samples[0]
+		if ts <= first_ts:
+			return None  # 窗口内只有一个样本，变化率未定义
+		return (value - first_value) / (ts - first_ts)
+
+
+class _WindowExtreme:
+	"""单调队列: 队首始终是窗口内的最小值 (sign=1) 或最大值 (sign=-1)"""
+	__slots__ = ("window", "sign", "samples")
+
+	def __init__(self, window: float, sign: int):
+		self.window = window
+		self.sign = sign
+		self.samples: Deque[Tuple[float, float]] = deque()
+
+	def update(self, ts: float, value: float) -> Optional[float]:
+		samples = self.samples
+		key = value * self.sign
+		while samples and samples[-1][1] * self.sign >= key:
+			samples.pop()
+		samples.append((ts, value))
+		horizon = ts - self.window
+		while samples[0][0] <= horizon:
+			samples.popleft()
+		return samples[0][1]
+
+
+def _make_feature(feature: str, window: float):
+	if feature == "value":
+		return _Latest(window)
+	if feature == "mean":
+		return _WindowMean(window)
+	if feature == "rate":
+		return _WindowRate(window)
+	if feature == "min":
+		return _WindowExtreme(window, 1)
+	if feature == "max":
+		return _WindowExtreme(window, -1)
+	raise ValueError(f"未知特征: {feature} (可选: {FEATURES})")
+
+
+# --- 规则 ---
+
+@dataclass
+class AlarmRule:
+	"""
+	对 channel 的 feature (窗口 window 秒) 做阈值判断。high/low 至少给一个。
+	hysteresis 为回差 (与阈值同单位)，raise_after 为连续越限多少个样本才报警。
+	"""
+	name: str
+	channel: str
+	high: Optional[float] = None
+	low: Optional[float] = None
+	feature: str = "value"
+	window: float = 0.0
+	hysteresis: float = 0.0
+	raise_after: int = 1
+	message: str = ""  # 报警文本模板，可用 {name} {channel} {feature} {value} {limit}
+
+	def __post_init__(self):
+		if self.high is None and self.low is None:
+			raise ValueError(f"规则 {self.name} 没有设置 high 或 low")
+		if self.feature not in FEATURES:
+			raise ValueError(f"规则 {self.name}: 未知特征 {self.feature} (可选: {FEATURES})")
+		if self.feature != "value" and self.window <= 0:
+			raise ValueError(f"规则 {self.name}: 特征 {self.feature} 需要 window > 0")
+
+
+@dataclass
+class AlarmEvent:
+	rule: str
+	channel: str
+	ts: float
+	value: float
+	active: bool  # True 为报警，False 为解除
+	message: str
+
+
+class _RuleState:
+	__slots__ = ("rule", "feature", "active", "streak", "limit", "message")
+
+	def __init__(self, rule: AlarmRule, feature):
+		self.rule = rule
+		self.feature = feature
+		self.active = False
+		self.streak = 0  # 连续越限的样本数
+		self.limit: Optional[float] = None  # 触发报警的阈值
+		self.message = ""
+
+
+class RuleEngine(LoggerMixin):
+
+	def __init__(self, rules: Sequence[AlarmRule] = ()):
+		self._by_channel: Dict[str, List[_RuleState]] = {}
+		# (通道, 特征, 窗口) -> 特征对象；同一通道上相同特征的规则共用一个窗口
+		self._features: Dict[Tuple[str, str, float], object] = {}
+		self._names = set()
+		self.samples = 0
+		for rule in rules:
+			self.add(rule)
+
+	def add(self, rule: AlarmRule) -> None:
+		if rule.name in self._names:
+			raise ValueError(f"规则名重复: {rule.name}")
+		self._names.add(rule.name)
+		key = (rule.channel, rule.feature, rule.window if rule.feature != "value" else 0.0)
+		feature = self._features.get(key)
+		if feature is None:
+			feature = self._features[key] = _make_feature(rule.feature, rule.window)
+		self._by_channel.setdefault(rule.channel, []).append(_RuleState(rule, feature))
+
+	@property
+	def rule_count(self) -> int:
+		return len(self._names)
+
+	def channels(self) -> List[str]:
+		return list(self._by_channel)
+
+	def feed(self, channel: str, ts: float, value: Optional[float]) -> List[AlarmEvent]:
+		"""输入一个样本 (时间戳单位为秒)，返回状态发生变化的规则的事件"""
+		states = self._by_channel.get(channel)
+		if states is None or value is None:
+			return []
+		self.samples += 1
+		events = []
+		# 同一个样本对每个窗口只更新一次
+		computed = {}
+		for state in states:
+			feature = state.feature
+			current = computed.get(id(feature), computed)
+			if current is computed:
+				current = computed[id(feature)] = feature.update(ts, value)
+			if current is None:
+				continue
+			event = self._evaluate(state, ts, current)
+			if event is not None:
+				events.append(event)
+		return events
+
+	def feed_readings(self, prefix: str, readings: Mapping[str, object], ts: float) -> List[AlarmEvent]:
+		"""输入一次巡检的全部读数，通道名为 "<prefix>.<读数名>" (与 StoreSink 的序列名一致)"""
+		events = []
+		for name, value in readings.items():
+			events.extend(self.feed(f"{prefix}.{name}", ts, parse_reading(value)))
+		return events
+
+	def _evaluate(self, state: _RuleState, ts: float, current: float) -> Optional[AlarmEvent]:
+		rule = state.rule
+		if state.active:
+			if rule.high is not None and state.limit == rule.high:
+				clear = current <= rule.high - rule.hysteresis
+			else:
+				clear = current >= rule.low + rule.hysteresis
+			if not clear:
+				return None
+			state.active = False
+			state.streak = 0
+			return AlarmEvent(rule.name, rule.channel, ts, current, False, f"已恢复 (当前 {current:g}): {state.message}")
+
+		if rule.high is not None and current > rule.high:
+			limit = rule.high
+		elif rule.low is not None and current < rule.low:
+			limit = rule.low
+		else:
+			state.streak = 0
+			return None
+		state.streak += 1
+		if state.streak < rule.raise_after:
+			return None
+		state.active = True
+		state.limit = limit
+		state.message = self._format(rule, current, limit)
+		return AlarmEvent(rule.name, rule.channel, ts, current, True, state.message)
+
+	@staticmethod
+	def _format(rule: AlarmRule, value: float, limit: Optional[float]) -> str:
+		if rule.message:
+			return rule.message.format(name=rule.name, channel=rule.channel, feature=rule.feature, value=value,
+									   limit=limit)
+		direction = "高于" if limit == rule.high else "低于"
+		feature = "" if rule.feature == "value" else f" ({rule.feature}, {rule.window:g} 秒)"
+		return f"{rule.name}: {rule.channel}{feature} {value:g} {direction} {limit:g}"
+
+	def active(self) -> Dict[str, str]:
+		"""当前处于报警状态的规则: {规则名: 报警时的文本}"""
+		result = {}
+		for states in self._by_channel.values():
+			for state in states:
+				if state.active:
+					result[state.rule.name] = state.message
+		return result
+
+
+# --- 基准测试：数百个通道、数千条规则的样本流 ---
+
+class _NaiveRule:
+	"""对照组: 保存历史，每个样本重新扫描窗口计算特征"""
+
+	def __init__(self, rule: AlarmRule):
+		self.rule = rule
+		self.history: List[Tuple[float, float]] = []
+		self.active = False
+
+	def feed(self, ts: float, value: float) -> bool:
+		self.history.append((ts, value))
+		window = [v for t, v in self.history if t > ts - self.rule.window] if self.rule.window else [value]
+		if self.rule.feature == "mean":
+			current = sum(window) / len(window)
+		elif self.rule.feature == "max":
+			current = max(window)
+		elif self.rule.feature == "min":
+			current = min(window)
+		else:
+			current = value
+		above = self.rule.high is not None and current > self.rule.high
+		changed = above != self.active
+		self.active = above
+		return changed
+
+
+def build_rules(channels: int, window: float) -> List[AlarmRule]:
+	"""每个通道 4 条规则: 瞬时上限 (带回差)、滑动平均上限、变化率上限、滑动最小值下限"""
+	rules = []
+	for i in range(channels):
+		channel = f"ch{i:04d}"
+		rules += [
+			AlarmRule(f"{channel}.high", channel, high=90.0, hysteresis=5.0),
+			AlarmRule(f"{channel}.mean", channel, high=70.0, feature="mean", window=window, hysteresis=2.0),
+			AlarmRule(f"{channel}.rate", channel, high=20.0, feature="rate", window=window / 2),
+			AlarmRule(f"{channel}.min", channel, low=5.0, feature="min", window=window, raise_after=3),
+		]
+	return rules
+
+
+def main():
+	parser = argparse.ArgumentParser(description="流式报警规则引擎吞吐量 (增量窗口 vs 每样本回扫历史)")
+	parser.add_argument("--channels", type=int, default=500, help="通道数")
+	parser.add_argument("--rate", type=float, default=10000, help="总样本率 (样本/秒，决定样本时间戳的间隔)")
+	parser.add_argument("--seconds", type=float, default=30, help="模拟的数据时长 (秒)")
+	parser.add_argument("--window", type=float, default=10, help="滑动窗口 (秒)")
+	parser.add_argument("--naive-seconds", type=float, default=3, help="对照组只跑这么长的数据 (秒)")
+	args = parser.parse_args()
+
+	rng = random.Random(0)
+	rules = build_rules(args.channels, args.window)
+	names = [f"ch{i:04d}" for i in range(args.channels)]
+	levels = [rng.uniform(20, 60) for _ in names]
+	total = int(args.rate * args.seconds)
+	stream = []
+	for n in range(total):
+		i = n % args.channels
+		levels[i] = min(100.0, max(0.0, levels[i] + rng.gauss(0, 3)))
+		stream.append((names[i], n / args.rate, levels[i]))
+
+	engine = RuleEngine(rules)
+	events = 0
+	start_time = time.perf_counter()
+	for channel, ts, value in stream:
+		events += len(engine.feed(channel, ts, value))
+	elapsed = time.perf_counter() - start_time
+	print(f"{args.channels} 个通道, {engine.rule_count} 条规则, 样本 {total} 个 ({args.seconds:g} 秒 @ {args.rate:g}/s)")
+	print(f"增量窗口: {total / elapsed:10.0f} 样本/s ({elapsed / total * 1e6:.2f} us/样本), "
+		  f"状态变化事件 {events}, 当前报警 {len(engine.active())}")
+	print(f"  实时余量: 处理 1 秒数据需要 {args.rate * elapsed / total * 1000:.0f} ms")
+
+	naive_total = int(args.rate * args.naive_seconds)
+	naive = {}
+	for rule in rules:
+		if rule.feature in ("mean", "max", "min", "value"):
+			naive.setdefault(rule.channel, []).append(_NaiveRule(rule))
+	start_time = time.perf_counter()
+	for channel, ts, value in stream[:naive_total]:
+		for rule in naive.get(channel, ()):
+			rule.feed(ts, value)
+	naive_elapsed = time.perf_counter() - start_time
+	print(f"回扫历史 (前 {args.naive_seconds:g} 秒, 不含变化率规则): {naive_total / naive_elapsed:10.0f} 样本/s, "
+		  f"且随历史增长继续变慢")
+
+
+if __name__ == "__main__":
+	main()
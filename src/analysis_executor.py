@@ -0,0 +1,235 @@
+# analysis_executor.py
+
+"""
+多仪表并行分析执行器。
+
+read_Lbar5 的阶段 2 把快门、真空计 OCR、冷泵温度 OCR 依次在一个核上执行。
+这里把每个区域的分析函数 (get_shutter_status_from_image、get_reading_from_preprocessed
+以及以后新增的函数) 作为独立任务分发到工作池，最后汇总成一个结果快照。
+
+三种模式:
+	'serial'  - 在调用线程中依次执行 (基准对照)
+	'thread'  - 线程池；截图对象直接共享，无任何复制。
+				适合 tesserocr 等会释放 GIL 的任务
+	'process' - 进程池；每帧截图只写入一次共享内存 (multiprocessing.shared_memory)，
+				每个工作进程每帧只重建一次图像，而不是每个任务 pickle 一次整张截图
+
+区域任务的函数签名与 read_Lbar5 中的分析函数一致:
+	func(main_screenshot_pil, main_win_coords, panel_coords, *args)
+第一个参数也可以是 frame_preprocess.PreprocessedFrame (process 模式下共享的是其灰度数组)。
+process 模式下 func 必须是模块级函数 (可被 pickle)。
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from frame_preprocess import PreprocessedFrame
+from region_cache import Rect, region_box, snapshot_rect
+from tools import LoggerMixin
+
+EXECUTOR_MODES = ("serial", "thread", "process")
+
+
+@dataclass
+class RegionTask:
+	"""一个区域的分析任务"""
+	name: str
+	func: Callable
+	panel_coords: Any
+	args: Tuple = ()
+
+
+# --- 进程模式: 共享内存中的帧 ---
+
+# 工作进程内缓存最近一帧: (共享内存名, PIL 图像或 PreprocessedFrame)
+_worker_frame: Tuple[Optional[str], Any] = (None, None)
+
+
+def _attach_frame(shm_name: str, shape: Tuple[int, ...], origin: Optional[Tuple[int, int]] = None):
+	"""
+	(工作进程) 从共享内存重建截图；同一帧的多个任务只重建一次。
+	origin 不为 None 时共享的是 PreprocessedFrame 的灰度数组，重建为 PreprocessedFrame。
+	"""
+	global _worker_frame
+	if _worker_frame[0] == shm_name:
+		return _worker_frame[1]
+	shm = shared_memory.SharedMemory(name=shm_name)
+	try:
+		pixels = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+		# 复制出共享内存后即可关闭映射；每个工作进程每帧只复制这一次
+		if origin is None:
+			image = Image.fromarray(pixels.copy())
+		else:
+			image = PreprocessedFrame(None, pixels.copy(), origin)
+	finally:
+		shm.close()
+	_worker_frame = (shm_name, image)
+	return image
+
+
+def _run_tasks(image, main_win_coords, tasks: List[RegionTask]) -> List[Tuple[str, Any]]:
+	"""依次执行一批任务；单个任务的异常作为其结果返回"""
+	results = []
+	for task in tasks:
+		try:
+			results.append((task.name, task.func(image, main_win_coords, task.panel_coords, *task.args)))
+		except Exception as e:
+			results.append((task.name, e))
+	return results
+
+
+def _run_shared_tasks(shm_name: str, shape: Tuple[int, ...], origin, main_win_coords, tasks: List[RegionTask]):
+	results = _run_tasks(_attach_frame(shm_name, shape, origin), main_win_coords, tasks)
+	# 有些异常类型 (例如 pytesseract.TesseractNotFoundError) 无法 pickle 回主进程，统一转为 RuntimeError
+	return [(name, RuntimeError(f"{type(r).__name__}: {r}") if isinstance(r, Exception) else r)
+			for name, r in results]
+
+
+class AnalysisExecutor(LoggerMixin):
+	"""
+	把一帧截图上的区域任务分发到工作池，汇总为 {任务名: 结果}。
+	任务抛出的异常不会中断其他任务，而是作为该任务的结果返回。
+	"""
+
+	def __init__(self, mode: str = "thread", max_workers: Optional[int] = None):
+		if mode not in EXECUTOR_MODES:
+			raise ValueError(f"未知的执行模式: {mode}，可选: {EXECUTOR_MODES}")
+		self.mode = mode
+		self.max_workers = max_workers or os.cpu_count() or 1
+		self._pool = None
+		if mode == "thread":
+			self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="analysis")
+		elif mode == "process":
+			self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+		self.last_elapsed = 0.0
+
+	def analyze(self, main_screenshot_pil, main_win_coords, tasks: Sequence[RegionTask]) -> Dict[str, Any]:
+		start_time = time.perf_counter()
+		main_win_coords = snapshot_rect(main_win_coords)
+		tasks = [RegionTask(t.name, t.func, snapshot_rect(t.panel_coords), tuple(t.args)) for t in tasks]
+
+		if self.mode == "serial":
+			results = dict(_run_tasks(main_screenshot_pil, main_win_coords, tasks))
+		elif self.mode == "thread":
+			futures = [self._pool.submit(_run_tasks, main_screenshot_pil, main_win_coords, batch)
+					   for batch in self._batches(tasks)]
+			results = self._gather(futures)
+		else:
+			results = self._analyze_shared(main_screenshot_pil, main_win_coords, tasks)
+
+		# 保持任务提交时的顺序
+		results = {task.name: results[task.name] for task in tasks}
+		for name, result in results.items():
+			if isinstance(result, Exception):
+				self.logger.error(f"区域任务 '{name}' 执行失败: {result}")
+		self.last_elapsed = time.perf_counter() - start_time
+		return results
+
+	def _batches(self, tasks: List[RegionTask]) -> List[List[RegionTask]]:
+		"""按工作者数量把任务分批，每批只提交一次，减少调度和进程间通信的开销"""
+		count = min(self.max_workers, len(tasks))
+		return [tasks[i::count] for i in range(count)]
+
+	def _analyze_shared(self, image, main_win_coords, tasks: List[RegionTask]) -> Dict[str, Any]:
+		if isinstance(image, PreprocessedFrame):
+			pixels, origin = image.gray, image.origin
+		else:
+			pixels, origin = np.asarray(image), None
+		shm = shared_memory.SharedMemory(create=True, size=max(1, pixels.nbytes))
+		try:
+			np.ndarray(pixels.shape, dtype=np.uint8, buffer=shm.buf)[...] = pixels
+			futures = [self._pool.submit(_run_shared_tasks, shm.name, pixels.shape, origin, main_win_coords, batch)
+					   for batch in self._batches(tasks)]
+			return self._gather(futures)
+		finally:
+			shm.close()
+			shm.unlink()
+
+	def _gather(self, futures) -> Dict[str, Any]:
+		results = {}
+		for future in futures:
+			results.update(future.result())
+		return results
+
+	def close(self) -> None:
+		if self._pool is not None:
+			self._pool.shutdown(wait=True)
+			self._pool = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+
+# --- 基准测试：合成面板上的多仪表分析随核数的扩展情况 ---
+
+_bench_recognizer = None
+
+
+def _bench_gauge_task(main_screenshot_pil, main_win_coords, panel_coords, whitelist):
+	"""(基准测试用) 裁剪 + 对比度增强 + 字形匹配，模拟一次仪表读数"""
+	global _bench_recognizer
+	from PIL import ImageEnhance
+	from glyph_matcher import GlyphAtlas, GlyphRecognizer, render_corpus
+
+	if _bench_recognizer is None:
+		_bench_recognizer = GlyphRecognizer(GlyphAtlas.from_labeled_crops(render_corpus(30, seed=1)))
+	box = region_box(main_win_coords, panel_coords)
+	crop = ImageEnhance.Contrast(main_screenshot_pil.crop(box).convert('L')).enhance(2.0)
+	return _bench_recognizer.match(crop, whitelist).text
+
+
+def build_synthetic_panel(gauges: int):
+	"""生成一张含 gauges 个真空计读数的合成面板截图，返回 (截图, 主窗口坐标, 任务列表)"""
+	from glyph_matcher import render_corpus
+
+	cols = 8
+	rows = (gauges + cols - 1) // cols
+	panel = Image.new('RGB', (cols * 120, rows * 30), color=(235, 235, 235))
+	tasks = []
+	for i, (crop, _) in enumerate(render_corpus(gauges, seed=3)):
+		x, y = (i % cols) * 120, (i // cols) * 30
+		panel.paste(crop.convert('RGB'), (x, y))
+		tasks.append(RegionTask(f"gauge_{i}", _bench_gauge_task, Rect(x, y, x + 110, y + 24), ('0123456789.E-',)))
+	return panel, Rect(0, 0, panel.width, panel.height), tasks
+
+
+def main():
+	parser = argparse.ArgumentParser(description="多仪表并行分析基准测试")
+	parser.add_argument("--gauges", type=int, default=64, help="合成面板上的仪表数量")
+	parser.add_argument("--frames", type=int, default=20, help="每种配置分析的帧数")
+	parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1], help="工作者数量")
+	args = parser.parse_args()
+
+	panel, main_win_coords, tasks = build_synthetic_panel(args.gauges)
+	with AnalysisExecutor("serial") as executor:
+		executor.analyze(panel, main_win_coords, tasks)  # 预热
+		start_time = time.perf_counter()
+		for _ in range(args.frames):
+			executor.analyze(panel, main_win_coords, tasks)
+		baseline = (time.perf_counter() - start_time) / args.frames
+	print(f"serial           : {baseline * 1000:8.2f} ms/帧")
+
+	for mode in ("thread", "process"):
+		for workers in sorted(set(args.workers)):
+			with AnalysisExecutor(mode, max_workers=workers) as executor:
+				executor.analyze(panel, main_win_coords, tasks)  # 预热 (进程池启动、图集生成)
+				start_time = time.perf_counter()
+				for _ in range(args.frames):
+					executor.analyze(panel, main_win_coords, tasks)
+				per_frame = (time.perf_counter() - start_time) / args.frames
+			print(f"{mode:7s} x{workers:<3d}     : {per_frame * 1000:8.2f} ms/帧 (加速比 {baseline / per_frame:.2f})")
+
+
+if __name__ == "__main__":
+	main()
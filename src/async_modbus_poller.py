@@ -0,0 +1,332 @@
+# async_modbus_poller.py
+
+"""
+基于 asyncio 的多 PLC 并发轮询服务。
+
+LN2SeparatorReader 使用阻塞的 ModbusTcpClient (超时 5 秒)，逐台读取时一台慢的或掉线的 PLC
+会拖住所有设备。这里每台设备是一个独立的协程 (pymodbus 的 AsyncModbusTcpClient)：
+
+- 每台设备有自己的采样周期、请求超时和重连退避 (指数增长，上限 backoff_max)；
+- 读取按 RegisterMap 规划的块进行，一台设备的多个块之间无需等待；
+- 采样结果 (带时间戳) 放入一个 asyncio.Queue，队列满时丢弃最旧的样本，消费者跟不上
+  不会反过来阻塞轮询；
+- 一台设备无法连接或超时只影响它自己的协程，其它设备的采样时刻和延迟不受影响。
+
+用法:
+	devices = [DeviceConfig("LN2-1", "192.168.0.200", 502, LN2_REGISTER_MAP, interval=1.0)]
+	poller = AsyncModbusPoller(devices)
+	asyncio.run(poller.run(duration=60))   # 另一个协程从 poller.queue 取样本
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from pymodbus.client import AsyncModbusTcpClient
+
+from modbus_registers import RegisterMap
+from tools import LoggerMixin, setup_logger
+
+
+@dataclass
+class DeviceConfig:
+	"""一台 PLC 的轮询参数"""
+	name: str
+	host: str
+	port: int
+	register_map: RegisterMap
+	device_id: int = 1
+	interval: float = 1.0  # 采样周期 (秒)
+	timeout: float = 1.0  # 单次连接/请求超时 (秒)
+	backoff_initial: float = 0.5  # 第一次重连前的等待 (秒)
+	backoff_max: float = 30.0
+
+
+@dataclass
+class PollSample:
+	"""一次采样: 读取失败时 values 为空、error 为原因"""
+	device: str
+	timestamp: float
+	values: Dict[str, Optional[float]]
+	latency: float
+	error: Optional[str] = None
+
+
+@dataclass
+class DeviceStats:
+	samples: int = 0
+	errors: int = 0
+	reconnects: int = 0
+	overruns: int = 0  # 一次采样耗时超过周期，跳过的采样时刻数
+	latencies: List[float] = field(default_factory=list)
+	connected: bool = False
+
+
+class AsyncModbusPoller(LoggerMixin):
+	"""
+	并发轮询多台 PLC。run() 在当前事件循环中运行，直到 stop() 或 duration 到期。
+	"""
+
+	def __init__(self, devices: Sequence[DeviceConfig], queue: Optional[asyncio.Queue] = None,
+				 queue_size: int = 10000, latency_window: int = 1000):
+		names = [d.name for d in devices]
+		if len(set(names)) != len(names):
+			raise ValueError("设备名重复")
+		self.devices = list(devices)
+		self.queue = queue
+		self.queue_size = queue_size
+		self.latency_window = latency_window
+		self.dropped = 0
+		self.device_stats: Dict[str, DeviceStats] = {d.name: DeviceStats() for d in self.devices}
+		self._stopping: Optional[asyncio.Event] = None
+
+	# --- 单台设备 ---
+
+	async def _connect(self, device: DeviceConfig) -> Optional[AsyncModbusTcpClient]:
+		# reconnect_delay=0 关闭 pymodbus 自带的后台重连，重连节奏由这里的退避统一控制
+		client = AsyncModbusTcpClient(device.host, port=device.port, timeout=device.timeout,
+									  retries=0, reconnect_delay=0)
+		try:
+			connected = await asyncio.wait_for(client.connect(), device.timeout)
+		except (asyncio.TimeoutError, OSError):
+			connected = False
+		if not connected:
+			client.close()
+			return None
+		return client
+
+	async def _read(self, client: AsyncModbusTcpClient, device: DeviceConfig) -> Dict[str, Optional[float]]:
+		values = device.register_map.empty()
+		for block in device.register_map.blocks:
+			result = await asyncio.wait_for(
+				client.read_holding_registers(block.start, count=block.count, device_id=device.device_id),
+				device.timeout)
+			if result.isError():
+				raise IOError(f"块读取失败, 地址: {block.start}, 数量: {block.count}, 错误: {result}")
+			values.update(block.decode(result.registers))
+		return values
+
+	async def _wait(self, seconds: float) -> bool:
+		"""等待 seconds 秒，期间收到 stop() 则返回 True"""
+		try:
+			await asyncio.wait_for(self._stopping.wait(), max(0.0, seconds))
+			return True
+		except asyncio.TimeoutError:
+			return False
+
+	def _publish(self, sample: PollSample) -> None:
+		try:
+			self.queue.put_nowait(sample)
+		except asyncio.QueueFull:
+			self.queue.get_nowait()  # 丢弃最旧的样本
+			self.queue.put_nowait(sample)
+			self.dropped += 1
+
+	async def _poll_device(self, device: DeviceConfig, phase: float = 0.0) -> None:
+		stats = self.device_stats[device.name]
+		client: Optional[AsyncModbusTcpClient] = None
+		backoff = device.backoff_initial
+		loop = asyncio.get_running_loop()
+		next_due = loop.time() + phase
+		try:
+			if await self._wait(phase):
+				return
+			while not self._stopping.is_set():
+				if client is None:
+					client = await self._connect(device)
+					stats.connected = client is not None
+					if client is None:
+						stats.errors += 1
+						self._publish(PollSample(device.name, time.time(), {}, 0.0, "无法连接"))
+						self.logger.warning(f"{device.name}: 无法连接 {device.host}:{device.port}，{backoff:.1f} 秒后重试")
+						if await self._wait(backoff):
+							break
+						backoff = min(backoff * 2, device.backoff_max)
+						stats.reconnects += 1
+						next_due = loop.time()
+						continue
+
+				start_time = loop.time()
+				timestamp = time.time()
+				try:
+					values = await self._read(client, device)
+				except Exception as e:
+					# 超时或连接断开: 关闭连接，按退避等待 (至少到下一个采样时刻) 后重连
+					stats.errors += 1
+					stats.connected = False
+					self._publish(PollSample(device.name, timestamp, {}, loop.time() - start_time,
+											 f"{type(e).__name__}: {e}"))
+					client.close()
+					client = None
+					next_due += device.interval
+					delay = max(backoff, next_due - loop.time())
+					self.logger.warning(f"{device.name}: 读取失败: {type(e).__name__}: {e}，{delay:.1f} 秒后重连")
+					if await self._wait(delay):
+						break
+					backoff = min(backoff * 2, device.backoff_max)
+					stats.reconnects += 1
+					next_due = loop.time()
+					continue
+				# 退避只在成功读到数据后复位: 能连上但读不出数据的设备同样要逐次拉长重连间隔
+				backoff = device.backoff_initial
+				latency = loop.time() - start_time
+				stats.samples += 1
+				stats.latencies.append(latency)
+				if len(stats.latencies) > self.latency_window:
+					del stats.latencies[:len(stats.latencies) - self.latency_window]
+				self._publish(PollSample(device.name, timestamp, values, latency))
+
+				# 固定频率调度: 以计划时刻为基准累加周期，错过的时刻直接跳过
+				next_due += device.interval
+				now = loop.time()
+				if next_due < now:
+					missed = int((now - next_due) // device.interval) + 1
+					stats.overruns += missed
+					next_due += missed * device.interval
+				if await self._wait(next_due - now):
+					break
+		finally:
+			if client is not None:
+				client.close()
+			stats.connected = False
+
+	# --- 服务 ---
+
+	async def run(self, duration: Optional[float] = None) -> None:
+		if self.queue is None:
+			self.queue = asyncio.Queue(self.queue_size)
+		self._stopping = asyncio.Event()
+		# 各设备的采样时刻在一个周期内错开，避免所有请求 (以及它们的解码) 挤在同一时刻
+		n = len(self.devices)
+		tasks = [asyncio.create_task(self._poll_device(d, d.interval * i / n), name=f"poll:{d.name}")
+				 for i, d in enumerate(self.devices)]
+		self.logger.info(f"开始轮询 {len(tasks)} 台设备")
+		try:
+			if duration is not None:
+				await self._wait(duration)
+				self._stopping.set()
+			await asyncio.gather(*tasks)
+		finally:
+			self._stopping.set()
+			for task in tasks:
+				task.cancel()
+			await asyncio.gather(*tasks, return_exceptions=True)
+			self.logger.info("轮询已停止")
+
+	def stop(self) -> None:
+		"""在事件循环线程中调用；其它线程请用 loop.call_soon_threadsafe(poller.stop)"""
+		if self._stopping is not None:
+			self._stopping.set()
+
+	def stats(self) -> Dict[str, Dict[str, float]]:
+		result = {}
+		for name, s in self.device_stats.items():
+			ordered = sorted(s.latencies)
+			result[name] = {
+				"samples": s.samples,
+				"errors": s.errors,
+				"reconnects": s.reconnects,
+				"overruns": s.overruns,
+				"connected": s.connected,
+				"latency_p50_ms": ordered[len(ordered) // 2] * 1000 if ordered else 0.0,
+				"latency_p95_ms": ordered[int(len(ordered) * 0.95)] * 1000 if ordered else 0.0,
+				"latency_max_ms": ordered[-1] * 1000 if ordered else 0.0,
+			}
+		return result
+
+
+# --- 基准测试：1~200 台本地模拟 PLC，附带一台拒绝连接和一台响应超时的设备 ---
+
+async def _benchmark(devices: Sequence[DeviceConfig], duration: float) -> AsyncModbusPoller:
+	poller = AsyncModbusPoller(devices)
+
+	async def consume():
+		while True:
+			await poller.queue.get()
+
+	consumer = asyncio.create_task(consume())
+	await poller.run(duration)
+	consumer.cancel()
+	return poller
+
+
+def main():
+	parser = argparse.ArgumentParser(description="asyncio 多 PLC 并发轮询 (实际设备或本地模拟器基准测试)")
+	parser.add_argument("--hosts", type=str, nargs="*", default=None,
+						help="实际液氮分离器 host[:port] 列表；不给出时运行模拟器基准测试")
+	parser.add_argument("--devices", type=int, nargs="+", default=[1, 10, 50, 200], help="模拟设备数量")
+	parser.add_argument("--interval", type=float, default=0.5, help="采样周期 (秒)")
+	parser.add_argument("--latency", type=float, default=0.005, help="模拟 PLC 的响应时间 (秒)")
+	parser.add_argument("--duration", type=float, default=5.0, help="每种规模的运行时长 (秒)")
+	parser.add_argument("--timeout", type=float, default=0.5, help="请求超时 (秒)")
+	args = parser.parse_args()
+
+	from debug_LN2_reader import LN2_REGISTER_MAP
+
+	if args.hosts:
+		setup_logger()
+		devices = []
+		for i, spec in enumerate(args.hosts):
+			host, _, port = spec.partition(":")
+			devices.append(DeviceConfig(f"LN2-{i + 1}", host, int(port or 502), LN2_REGISTER_MAP,
+										interval=args.interval, timeout=args.timeout))
+		poller = AsyncModbusPoller(devices)
+
+		async def print_samples():
+			while True:
+				s = await poller.queue.get()
+				text = s.error or ", ".join(f"{k}={v}" for k, v in s.values.items())
+				print(f"[{time.strftime('%H:%M:%S', time.localtime(s.timestamp))}] {s.device}: {text} "
+					  f"({s.latency * 1000:.1f} ms)")
+
+		async def run():
+			printer = asyncio.create_task(print_samples())
+			try:
+				await poller.run()
+			finally:
+				printer.cancel()
+
+		try:
+			asyncio.run(run())
+		except KeyboardInterrupt:
+			pass
+		return
+
+	from plc_simulator import PLCSimulator, SimulatorFarm, free_port
+
+	# slow / dead 两台设备会不断超时和重连，基准测试中不输出这些预期内的日志
+	logging.getLogger("pymodbus").setLevel(logging.CRITICAL)
+	logging.getLogger(AsyncModbusPoller.__name__).setLevel(logging.CRITICAL)
+	registers = LN2_REGISTER_MAP.encode({"液位": 1234, "压力": 0.56})
+	for count in args.devices:
+		simulators = [PLCSimulator(registers, latency=args.latency) for _ in range(count)]
+		# 一台响应比超时还慢的 PLC (黑洞) 和一个没有服务监听的端口 (拒绝连接)
+		simulators.append(PLCSimulator(registers, latency=args.timeout * 4))
+		with SimulatorFarm(simulators):
+			devices = [DeviceConfig(f"plc{i}", sim.host, sim.port, LN2_REGISTER_MAP, interval=args.interval,
+									timeout=args.timeout) for i, sim in enumerate(simulators[:-1])]
+			devices.append(DeviceConfig("slow", simulators[-1].host, simulators[-1].port, LN2_REGISTER_MAP,
+										interval=args.interval, timeout=args.timeout))
+			devices.append(DeviceConfig("dead", "127.0.0.1", free_port(), LN2_REGISTER_MAP,
+										interval=args.interval, timeout=args.timeout))
+			start_cpu = time.process_time()
+			poller = asyncio.run(_benchmark(devices, args.duration))
+			cpu = time.process_time() - start_cpu
+
+		stats = poller.stats()
+		healthy = [stats[d.name] for d in devices[:count]]
+		expected = count * args.duration / args.interval
+		samples = sum(s["samples"] for s in healthy)
+		worst_p95 = max(s["latency_p95_ms"] for s in healthy)
+		p50s = sorted(s["latency_p50_ms"] for s in healthy)
+		print(f"{count:4d} 台设备: 采样 {samples}/{expected:.0f} ({samples / expected:6.1%}) | "
+			  f"延迟 p50 {p50s[len(p50s) // 2]:6.2f} ms, 最差 p95 {worst_p95:6.2f} ms | "
+			  f"超限 {sum(s['overruns'] for s in healthy)} | CPU (含模拟器) {cpu / args.duration:5.1%} | "
+			  f"slow 错误 {stats['slow']['errors']}, dead 错误 {stats['dead']['errors']}")
+
+
+if __name__ == "__main__":
+	main()
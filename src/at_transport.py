@@ -0,0 +1,339 @@
+# at_transport.py
+
+"""
+事件驱动的 AT 指令传输层。
+
+GSMController 原来的 send_at_command / send_sms 用 in_waiting 轮询串口，每轮 sleep 0.1~0.2 秒，
+步骤之间还有固定的 0.5 秒等待，每轮都在整个累积缓冲区里查找 OK/ERROR/>。
+一条短信因此要空等好几秒。这里改为:
+
+- 一个读线程阻塞在串口 read 上 (有数据立即返回)，按行增量切分模块输出；
+- 每条指令登记为 "待完成"，读线程一收到它的最终结果码 (OK / ERROR / +CME ERROR / +CMS ERROR …)
+  或 AT+CMGS 的 "> " 提示符就立即唤醒调用方，没有任何固定等待；
+- 主动上报 (URC: +CMTI 新短信、RING 来电、+CREG 网络注册状态等) 不混进指令响应，
+  而是放入单独的 urcs 队列 (也可以注册回调)。
+  指令本身的信息行 (例如 AT+CREG? 的 "+CREG: 0,1") 仍归入该指令的响应。
+
+串口对象只需要 read / write / in_waiting / close，可以是 serial.Serial、pty 或 serial_for_url；
+也可以是 serial_port_manager.ManagedPort (与其它使用者共享同一个串口)。
+"""
+
+import argparse
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence
+
+from serial_port_manager import ManagedPort
+from tools import LoggerMixin
+
+CTRL_Z = b"\x1a"
+
+# 表示指令结束的最终结果码
+FINAL_OK = ("OK", "CONNECT")
+FINAL_ERROR = ("ERROR", "NO CARRIER", "BUSY", "NO ANSWER", "NO DIALTONE")
+FINAL_ERROR_PREFIXES = ("+CME ERROR", "+CMS ERROR")
+
+# 主动上报的前缀
+URC_PREFIXES = ("+CMTI:", "+CMT:", "+CDS:", "+CDSI:", "RING", "+CLIP:", "+CREG:", "+CGREG:", "+CEREG:",
+				"+CUSD:", "+CBM:", "^SYSSTART", "+CPIN:", "+PBREADY", "SMS READY", "SMS Ready", "Call Ready", "RDY")
+
+
+@dataclass
+class ATResponse:
+	"""一条指令的结果: lines 不含回显和最终结果码；final 是最终结果码 (或 ">"、"TIMEOUT")"""
+	command: str
+	ok: bool = False
+	final: str = ""
+	lines: List[str] = field(default_factory=list)
+	raw: bytes = b""
+	elapsed: float = 0.0
+
+	@property
+	def text(self) -> str:
+		"""与原 send_at_command 返回值相近的文本 (信息行 + 最终结果码)"""
+		return "\n".join(self.lines + ([self.final] if self.final else []))
+
+
+class _Pending:
+	def __init__(self, command: str, expect_prompt: bool):
+		self.response = ATResponse(command)
+		self.expect_prompt = expect_prompt
+		self.echo = command.strip()
+		# "AT+CREG?" -> "+CREG"：以此开头的行是本指令的信息行，不是 URC
+		name = command.strip()[2:] if command.strip().upper().startswith("AT") else ""
+		self.info_prefix = name.split("=")[0].rstrip("?") if name.startswith("+") else None
+		self.done = threading.Event()
+		self.started = time.perf_counter()
+
+
+class ATTransport(LoggerMixin):
+	"""
+	一个串口上的 AT 指令通道。同一时刻只有一条指令在途 (调制解调器本身也是串行处理的)，
+	多个线程调用 command() 会按顺序排队。
+	"""
+
+	def __init__(self, serial_conn, urc_prefixes: Sequence[str] = URC_PREFIXES,
+				 on_urc: Optional[Callable[[str], None]] = None, read_size: int = 256):
+		self.serial_conn = serial_conn
+		self.urc_prefixes = tuple(urc_prefixes)
+		self.on_urc = on_urc
+		self.read_size = read_size
+		self.urcs: "queue.Queue[str]" = queue.Queue()
+
+		self._command_lock = threading.Lock()  # 指令排队
+		self._state_lock = threading.Lock()  # 保护 _pending
+		self._pending: Optional[_Pending] = None
+		self._buffer = bytearray()
+		self._running = False
+		self._thread: Optional[threading.Thread] = None
+
+	# --- 读线程 ---
+
+	def start(self) -> "ATTransport":
+		self._running = True
+		if isinstance(self.serial_conn, ManagedPort):
+			# 共享串口: 由端口的所有者线程读取并回调 feed，写入也经由它的事务队列
+			self.serial_conn.set_listener(self.feed)
+			return self
+		self._thread = threading.Thread(target=self._read_loop, name="ATTransportReader", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		self._running = False
+		if isinstance(self.serial_conn, ManagedPort):
+			self.serial_conn.set_listener(None)
+		if self._thread is not None:
+			self._thread.join(2)
+			self._thread = None
+
+	def _read_loop(self) -> None:
+		while self._running:
+			try:
+				# 串口 timeout 决定 read 最多阻塞多久；有数据时立即返回
+				data = self.serial_conn.read(max(1, min(self.read_size, self.serial_conn.in_waiting)))
+			except Exception as e:
+				if self._running:
+					self.logger.error(f"读取串口失败: {e}")
+					self._fail_pending("串口读取失败")
+				break
+			if data:
+				self.feed(data)
+
+	def feed(self, data: bytes) -> None:
+		"""处理从串口收到的一段数据 (读线程调用；也可以在测试中直接喂数据)"""
+		with self._state_lock:
+			pending = self._pending
+			if pending is not None:
+				pending.response.raw += data
+		self._buffer += data
+		while True:
+			cr, lf = self._buffer.find(b"\r"), self._buffer.find(b"\n")
+			cut = min(cr, lf) if cr >= 0 and lf >= 0 else max(cr, lf)
+			if cut < 0:
+				break
+			line = self._buffer[:cut].decode("ascii", "ignore").strip()
+			del self._buffer[:cut + 1]
+			if line:
+				self._handle_line(line)
+		# "> " 提示符后面没有换行，需要单独检查未结束的部分
+		if self._buffer.strip() == b">":
+			with self._state_lock:
+				pending = self._pending
+			if pending is not None and pending.expect_prompt:
+				self._buffer.clear()
+				self._complete(pending, ">", True)
+
+	def _handle_line(self, line: str) -> None:
+		with self._state_lock:
+			pending = self._pending
+		if pending is not None:
+			if line == pending.echo and not pending.response.lines:
+				return  # 模块回显 (ATE1)
+			if line in FINAL_OK:
+				self._complete(pending, line, True)
+				return
+			if line in FINAL_ERROR or line.startswith(FINAL_ERROR_PREFIXES):
+				self._complete(pending, line, False)
+				return
+			if pending.info_prefix and line.startswith(pending.info_prefix):
+				pending.response.lines.append(line)
+				return
+		if line.startswith(self.urc_prefixes):
+			self.urcs.put(line)
+			if self.on_urc is not None:
+				try:
+					self.on_urc(line)
+				except Exception as e:
+					self.logger.error(f"URC 回调异常: {e}", exc_info=True)
+			return
+		if pending is not None:
+			pending.response.lines.append(line)
+		else:
+			self.logger.debug(f"忽略无主的模块输出: {line}")
+
+	def _complete(self, pending: _Pending, final: str, ok: bool) -> None:
+		with self._state_lock:
+			if self._pending is not pending:
+				return
+			self._pending = None
+		pending.response.final = final
+		pending.response.ok = ok
+		pending.response.elapsed = time.perf_counter() - pending.started
+		pending.done.set()
+
+	def _fail_pending(self, reason: str) -> None:
+		with self._state_lock:
+			pending = self._pending
+		if pending is not None:
+			self._complete(pending, reason, False)
+
+	# --- 指令 ---
+
+	def _transact(self, command: str, payload: bytes, timeout: float, expect_prompt: bool) -> ATResponse:
+		pending = _Pending(command, expect_prompt)
+		with self._state_lock:
+			self._pending = pending
+		self.serial_conn.write(payload)
+		if not pending.done.wait(timeout):
+			with self._state_lock:
+				if self._pending is pending:
+					self._pending = None
+			pending.response.final = "TIMEOUT"
+			pending.response.elapsed = time.perf_counter() - pending.started
+			self.logger.warning(f"AT 指令超时 ({timeout:.1f} 秒): {command}")
+		return pending.response
+
+	def command(self, command: str, timeout: float = 5.0, expect_prompt: bool = False) -> ATResponse:
+		"""发送一条 AT 指令，最终结果码 (或 expect_prompt 时的 "> ") 一到立即返回"""
+		with self._command_lock:
+			return self._transact(command, (command + "\r").encode("ascii"), timeout, expect_prompt)
+
+	def send_pdu(self, length: int, pdu: str, prompt_timeout: float = 3.0, timeout: float = 60.0) -> ATResponse:
+		"""AT+CMGS=<length>，收到 "> " 后立即写入 PDU + Ctrl-Z，等待 +CMGS / OK"""
+		with self._command_lock:
+			prompt = self._transact(f"AT+CMGS={length}", f"AT+CMGS={length}\r".encode("ascii"),
+									prompt_timeout, expect_prompt=True)
+			if prompt.final != ">":
+				return prompt
+			result = self._transact("AT+CMGS", pdu.encode("ascii") + CTRL_Z, timeout, expect_prompt=False)
+			result.command = f"AT+CMGS={length}"
+			result.elapsed += prompt.elapsed
+			result.raw = prompt.raw + result.raw
+			return result
+
+	def close(self) -> None:
+		self.stop()
+		self._fail_pending("已关闭")
+
+
+# --- 基准测试：原轮询实现 vs 事件驱动 (pty 上的脚本化模块) ---
+
+def _legacy_send_at_command(serial_conn, command: str, timeout: float = 5.0):
+	"""原 GSMController.send_at_command 的等待逻辑 (去掉了调试打印)"""
+	serial_conn.reset_input_buffer()
+	serial_conn.write((command + '\r').encode('ascii'))
+	response_bytes = b''
+	start_time = time.time()
+	while time.time() - start_time < timeout:
+		if serial_conn.in_waiting > 0:
+			response_bytes += serial_conn.read(serial_conn.in_waiting)
+			if any(terminator in response_bytes for terminator in [b'OK', b'ERROR', b'>']):
+				time.sleep(0.05)
+				if serial_conn.in_waiting > 0:
+					response_bytes += serial_conn.read(serial_conn.in_waiting)
+				break
+		time.sleep(0.1)
+	response_str = response_bytes.decode('ascii', 'ignore')
+	return 'OK' in response_str or '>' in response_str, response_str.strip()
+
+
+def _legacy_send_sms(serial_conn, pdu: str, pdu_length: int) -> bool:
+	"""原 GSMController.send_sms 的步骤和固定等待"""
+	ok, _ = _legacy_send_at_command(serial_conn, "AT+CMGF=0")
+	if not ok:
+		return False
+	time.sleep(0.5)
+	ok, response = _legacy_send_at_command(serial_conn, f"AT+CMGS={pdu_length}", timeout=3.0)
+	if not ok or '>' not in response:
+		return False
+	time.sleep(0.5)
+	serial_conn.write(pdu.encode('ascii'))
+	serial_conn.write(bytes([0x1A]))
+	final_response_bytes = b''
+	start_time = time.time()
+	while time.time() - start_time < 15.0:
+		if serial_conn.in_waiting > 0:
+			final_response_bytes += serial_conn.read(serial_conn.in_waiting)
+			if b'OK' in final_response_bytes or b'ERROR' in final_response_bytes:
+				break
+		time.sleep(0.2)
+	return b'OK' in final_response_bytes
+
+
+def main():
+	parser = argparse.ArgumentParser(description="AT 指令: 原轮询实现 vs 事件驱动传输层 (脚本化模块，需要 pty)")
+	parser.add_argument("--sms", type=int, default=5, help="每种实现发送的短信条数")
+	parser.add_argument("--response-delay", type=float, default=0.01, help="模拟模块处理一条指令的耗时 (秒)")
+	parser.add_argument("--send-delay", type=float, default=0.3, help="模拟短信网络发送耗时 (秒)")
+	args = parser.parse_args()
+
+	import serial
+
+	from debug_gsm_send import GSMController, SMSPDUCodec
+	from modem_simulator import ScriptedModem
+
+	logging.getLogger(GSMController.__name__).setLevel(logging.WARNING)
+	phone, message = "17712689742", "真空度报警: 1.2E-5 Pa"
+	codec = SMSPDUCodec()
+	pdu = codec.encode_sms(phone, message)
+
+	with ScriptedModem(args.response_delay, args.send_delay) as modem:
+		conn = serial.Serial(modem.port, 115200, timeout=5)
+		legacy_at, legacy_sms = [], []
+		for _ in range(args.sms):
+			start_time = time.perf_counter()
+			_legacy_send_at_command(conn, "AT")
+			legacy_at.append(time.perf_counter() - start_time)
+			start_time = time.perf_counter()
+			assert _legacy_send_sms(conn, pdu, codec.get_pdu_length(pdu))
+			legacy_sms.append(time.perf_counter() - start_time)
+		conn.close()
+
+		gsm = GSMController(modem.port, 115200)
+		gsm.connect_gsm()
+		new_at, new_sms = [], []
+		for _ in range(args.sms):
+			start_time = time.perf_counter()
+			gsm.send_at_command("AT")
+			new_at.append(time.perf_counter() - start_time)
+			start_time = time.perf_counter()
+			assert gsm.send_sms(phone, message)
+			new_sms.append(time.perf_counter() - start_time)
+
+		# URC 分流: 指令进行中插入 +CMTI / RING，AT+CREG? 的信息行仍归指令本身
+		modem.script["AT+CSQ"] = '+CMTI: "SM",3\r\n\r\nRING\r\n\r\n+CSQ: 23,99\r\n\r\nOK'
+		ok, csq = gsm.send_at_command("AT+CSQ")
+		ok_creg, creg = gsm.send_at_command("AT+CREG?")
+		modem.inject("+CREG: 5")
+		time.sleep(0.05)
+		urcs = []
+		while not gsm.transport.urcs.empty():
+			urcs.append(gsm.transport.urcs.get())
+		gsm.disconnect_gsm()
+
+	mean = lambda xs: sum(xs) / len(xs) * 1000
+	print(f"模拟模块: 指令处理 {args.response_delay * 1000:.0f} ms, 短信发送 {args.send_delay * 1000:.0f} ms")
+	print(f"  AT 指令: 原实现 {mean(legacy_at):7.1f} ms | 事件驱动 {mean(new_at):7.1f} ms")
+	print(f"  每条短信: 原实现 {mean(legacy_sms):7.1f} ms | 事件驱动 {mean(new_sms):7.1f} ms "
+		  f"(节省 {mean(legacy_sms) - mean(new_sms):.0f} ms)")
+	print(f"  AT+CSQ 响应: {csq!r}")
+	print(f"  AT+CREG? 响应: {creg!r}")
+	print(f"  URC 通道: {urcs}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,301 @@
+# control_locator.py
+
+"""
+带失效检测的控件定位缓存。
+
+read_Lbar5 每次运行都要重新解析 child_window(class_name="Static", found_index=10) 这类定位参数，
+再逐个调用 .rectangle()。在 win32 后端上，每次解析都会遍历整棵控件树。
+
+ControlLocator 只在第一次 (或界面发生变化后) 遍历控件树，记住每个控件的句柄及其相对主窗口
+左上角的偏移量。之后每一帧只做两件很便宜的检查：
+1.  主窗口句柄和矩形：只是移动时直接平移偏移量；尺寸变化或句柄变化则重新遍历；
+2.  控件句柄是否仍然存在 (IsWindow)：有控件被销毁重建时重新遍历。
+
+GUI 访问都经过 GuiBackend 接口：PywinautoBackend 对接真实窗口，FakeGuiBackend
+是内存中的假窗口，可以在 Linux 上无界面地测试命中率和延迟。
+"""
+
+import argparse
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from region_cache import Rect, snapshot_rect
+from tools import LoggerMixin
+
+
+@dataclass
+class ControlSpec:
+	"""一个控件的定位参数，criteria 即传给 child_window() 的关键字参数"""
+	name: str
+	criteria: Dict[str, Any] = field(default_factory=dict)
+
+
+# --- GUI 后端接口 ---
+
+class GuiBackend:
+	"""
+	ControlLocator 需要的最小 GUI 接口
+	"""
+
+	def main_window_handle(self) -> int:
+		raise NotImplementedError
+
+	def main_window_rect(self) -> Rect:
+		raise NotImplementedError
+
+	def resolve(self, criteria: Dict[str, Any]) -> int:
+		"""遍历控件树，返回匹配控件的句柄 (昂贵)"""
+		raise NotImplementedError
+
+	def is_alive(self, handle: int) -> bool:
+		raise NotImplementedError
+
+	def control_rect(self, handle: int) -> Rect:
+		raise NotImplementedError
+
+	def control_texts(self, handle: int) -> List[str]:
+		raise NotImplementedError
+
+
+class PywinautoBackend(GuiBackend):
+	"""
+	基于 pywinauto win32 后端的实现。main_window 是 app.window(...) 返回的 WindowSpecification。
+	"""
+
+	def __init__(self, main_window):
+		from pywinauto import handleprops
+
+		self._handleprops = handleprops
+		self._main_spec = main_window
+		self._main = main_window.wrapper_object()
+		self._wrappers: Dict[int, Any] = {}
+
+	def main_window_handle(self) -> int:
+		# 缓存的主窗口已被销毁 (程序重启、窗口重建) 时按定位参数重新解析，返回新句柄，
+		# ControlLocator 据此发现句柄变化并重新遍历控件树
+		if not self._handleprops.iswindow(self._main.handle):
+			self._main = self._main_spec.wrapper_object()
+			self._wrappers.clear()
+		return self._main.handle
+
+	def main_window_rect(self) -> Rect:
+		return snapshot_rect(self._main.rectangle())
+
+	def resolve(self, criteria: Dict[str, Any]) -> int:
+		wrapper = self._main_spec.child_window(**criteria).wrapper_object()
+		self._wrappers[wrapper.handle] = wrapper
+		return wrapper.handle
+
+	def is_alive(self, handle: int) -> bool:
+		return bool(self._handleprops.iswindow(handle))
+
+	def control_rect(self, handle: int) -> Rect:
+		return snapshot_rect(self._handleprops.rectangle(handle))
+
+	def control_texts(self, handle: int) -> List[str]:
+		return self._wrappers[handle].texts()
+
+
+class FakeGuiBackend(GuiBackend):
+	"""
+	内存中的假窗口。controls: {名称: (定位参数, 相对主窗口的矩形, 文本列表)}。
+	walk_delay 模拟一次控件树遍历的耗时，walks 记录遍历次数。
+	"""
+
+	def __init__(self, main_rect: Rect, controls: Dict[str, Tuple[Dict[str, Any], Rect, List[str]]],
+				 walk_delay: float = 0.0):
+		self.main_rect = main_rect
+		self.main_handle = 1
+		self.walk_delay = walk_delay
+		self.walks = 0
+		self._next_handle = 100
+		self._controls: Dict[int, Tuple[Dict[str, Any], Rect, List[str]]] = {}
+		self._by_name: Dict[str, int] = {}
+		for name, control in controls.items():
+			self._add(name, control)
+
+	def _add(self, name: str, control) -> None:
+		self._next_handle += 1
+		self._controls[self._next_handle] = control
+		self._by_name[name] = self._next_handle
+
+	# --- 模拟界面变化 ---
+
+	def move_window(self, dx: int, dy: int) -> None:
+		r = self.main_rect
+		self.main_rect = Rect(r.left + dx, r.top + dy, r.right + dx, r.bottom + dy)
+
+	def resize_window(self, width: int, height: int) -> None:
+		r = self.main_rect
+		self.main_rect = Rect(r.left, r.top, r.left + width, r.top + height)
+
+	def recreate_control(self, name: str) -> None:
+		"""销毁并重建控件 (句柄改变)"""
+		control = self._controls.pop(self._by_name[name])
+		self._add(name, control)
+
+	def restart(self) -> None:
+		"""模拟程序重启：主窗口和所有控件都换了新句柄"""
+		self.main_handle += 1
+		for name in list(self._by_name):
+			self.recreate_control(name)
+
+	# --- GuiBackend ---
+
+	def main_window_handle(self) -> int:
+		return self.main_handle
+
+	def main_window_rect(self) -> Rect:
+		return self.main_rect
+
+	def resolve(self, criteria: Dict[str, Any]) -> int:
+		self.walks += 1
+		if self.walk_delay:
+			time.sleep(self.walk_delay)
+		for handle, (control_criteria, _, _) in self._controls.items():
+			if control_criteria == criteria:
+				return handle
+		raise LookupError(f"找不到控件: {criteria}")
+
+	def is_alive(self, handle: int) -> bool:
+		return handle in self._controls
+
+	def control_rect(self, handle: int) -> Rect:
+		rel = self._controls[handle][1]
+		m = self.main_rect
+		return Rect(m.left + rel.left, m.top + rel.top, m.left + rel.right, m.top + rel.bottom)
+
+	def control_texts(self, handle: int) -> List[str]:
+		return list(self._controls[handle][2])
+
+
+# --- 定位缓存 ---
+
+class ControlLocator(LoggerMixin):
+	"""
+	控件句柄与偏移量缓存
+	"""
+
+	def __init__(self, backend: GuiBackend, specs: Sequence[ControlSpec], refresh_interval: Optional[float] = None):
+		"""
+		refresh_interval: 可选，超过该秒数后即使没有检测到变化也重新遍历一次
+		"""
+		self.backend = backend
+		self.specs = list(specs)
+		self.refresh_interval = refresh_interval
+		self.hits = 0
+		self.misses = 0
+		self.last_latency = 0.0
+		self._total_latency = 0.0
+		self._main_handle: Optional[int] = None
+		self._main_rect: Optional[Rect] = None
+		self._handles: Dict[str, int] = {}
+		self._offsets: Dict[str, Rect] = {}
+		self._resolved_at = 0.0
+
+	def _resolve_all(self, main_handle: int, main_rect: Rect) -> None:
+		handles, offsets = {}, {}
+		for spec in self.specs:
+			handle = self.backend.resolve(spec.criteria)
+			r = self.backend.control_rect(handle)
+			handles[spec.name] = handle
+			offsets[spec.name] = Rect(r.left - main_rect.left, r.top - main_rect.top,
+									  r.right - main_rect.left, r.bottom - main_rect.top)
+		self._handles, self._offsets = handles, offsets
+		self._main_handle, self._main_rect = main_handle, main_rect
+		self._resolved_at = time.monotonic()
+
+	def _is_valid(self, main_handle: int, main_rect: Rect) -> bool:
+		if self._main_rect is None or main_handle != self._main_handle:
+			return False
+		if (main_rect.width(), main_rect.height()) != (self._main_rect.width(), self._main_rect.height()):
+			return False
+		if self.refresh_interval is not None and time.monotonic() - self._resolved_at > self.refresh_interval:
+			return False
+		return all(self.backend.is_alive(h) for h in self._handles.values())
+
+	def rectangles(self) -> Tuple[Rect, Dict[str, Rect]]:
+		"""返回 (主窗口矩形, {控件名: 控件绝对矩形})；必要时才重新遍历控件树"""
+		start_time = time.perf_counter()
+		main_handle = self.backend.main_window_handle()
+		main_rect = self.backend.main_window_rect()
+		if self._is_valid(main_handle, main_rect):
+			self.hits += 1
+		else:
+			self.misses += 1
+			self.logger.debug("主窗口或控件发生变化，重新遍历控件树")
+			self._resolve_all(main_handle, main_rect)
+		self._main_rect = main_rect
+
+		rects = {name: Rect(main_rect.left + o.left, main_rect.top + o.top,
+							main_rect.left + o.right, main_rect.top + o.bottom)
+				 for name, o in self._offsets.items()}
+		self.last_latency = time.perf_counter() - start_time
+		self._total_latency += self.last_latency
+		return main_rect, rects
+
+	def texts(self, name: str) -> List[str]:
+		"""读取控件文本 (需先调用 rectangles() 以保证句柄有效)"""
+		return self.backend.control_texts(self._handles[name])
+
+	def invalidate(self) -> None:
+		self._main_rect = None
+
+	def stats(self) -> Dict[str, float]:
+		total = self.hits + self.misses
+		return {
+			"hits": self.hits,
+			"misses": self.misses,
+			"hit_rate": self.hits / total if total else 0.0,
+			"mean_latency_ms": self._total_latency / total * 1000 if total else 0.0,
+		}
+
+
+# --- 基准测试：假窗口上的命中率和延迟 ---
+
+def build_fake_molly(walk_delay: float = 0.02) -> Tuple[FakeGuiBackend, List[ControlSpec]]:
+	"""按 read_Lbar5 中的控件布局生成一个假 Molly 窗口"""
+	specs = [
+		ControlSpec("reactor", {"class_name": "ListView20WndClass", "found_index": 3}),
+		ControlSpec("shutter", {"title": "Shutter", "found_index": 0}),
+		ControlSpec("vacuum", {"class_name": "Static", "found_index": 10}),
+		ControlSpec("temp", {"class_name": "Static", "found_index": 12}),
+	]
+	layout = [Rect(10, 40, 410, 240), Rect(420, 40, 520, 70), Rect(166, 300, 316, 331), Rect(166, 340, 316, 371)]
+	controls = {spec.name: (spec.criteria, rect, [f"{spec.name} text"]) for spec, rect in zip(specs, layout)}
+	return FakeGuiBackend(Rect(100, 100, 1380, 900), controls, walk_delay), specs
+
+
+def main():
+	parser = argparse.ArgumentParser(description="控件定位缓存基准测试 (假窗口，无需GUI)")
+	parser.add_argument("--frames", type=int, default=200, help="模拟的帧数")
+	parser.add_argument("--walk-delay", type=float, default=0.02, help="模拟一次控件树遍历的耗时 (秒)")
+	parser.add_argument("--move-every", type=int, default=50, help="每隔多少帧移动一次窗口")
+	parser.add_argument("--resize-every", type=int, default=100, help="每隔多少帧改变一次窗口尺寸")
+	args = parser.parse_args()
+
+	backend, specs = build_fake_molly(args.walk_delay)
+	start_time = time.perf_counter()
+	for _ in range(args.frames):
+		main_rect = backend.main_window_rect()
+		for spec in specs:
+			backend.control_rect(backend.resolve(spec.criteria))
+	uncached = (time.perf_counter() - start_time) / args.frames
+	print(f"不使用缓存: 平均 {uncached * 1000:.3f} ms/帧, 遍历 {backend.walks} 次")
+
+	backend, specs = build_fake_molly(args.walk_delay)
+	locator = ControlLocator(backend, specs)
+	for i in range(args.frames):
+		if i and i % args.move_every == 0:
+			backend.move_window(5, 3)
+		if i and i % args.resize_every == 0:
+			backend.resize_window(1200, 800)
+		locator.rectangles()
+	s = locator.stats()
+	print(f"使用缓存:   平均 {s['mean_latency_ms']:.3f} ms/帧, 遍历 {backend.walks} 次, "
+		  f"命中率 {s['hit_rate']:.1%} (命中 {s['hits']}, 未命中 {s['misses']})")
+
+
+if __name__ == "__main__":
+	main()
@@ -2,112 +2,125 @@
 
 import argparse
 import time
-from typing import Dict, Optional
-
-from pymodbus.client import ModbusTcpClient
-from PySide6.QtCore import QObject  # pymodbus internally may use Qt, so keep it for compatibility
+from typing import TYPE_CHECKING, Dict, Optional
 
+from modbus_registers import RegisterField, RegisterMap
+from modbus_session import ModbusSession
 from tools import LoggerMixin, setup_logger
 
+if TYPE_CHECKING:
+	from pymodbus.client import ModbusTcpClient
+
+# 液氮分离器 PLC 的默认地址 (本脚本和 inspection_daemon 共用)
+LN2_DEFAULT_HOST = "192.168.0.200"
+
+# 液位和压力是相邻的两个保持寄存器，规划为一次块读取
+LN2_REGISTER_MAP = RegisterMap([
+	RegisterField("液位", 0, "uint16", unit="mm"),  # 40001
+	RegisterField("压力", 1, "uint16", scale=0.01, unit="MPa"),  # 40002, 原始值 /100 为 MPa
+])
+
 
-class LN2SeparatorReader(QObject, LoggerMixin):
+class LN2SeparatorReader(LoggerMixin):
 	"""
 	从 external_data_source.py 提取的液氮分离器数据读取器类
 	"""
-	LIQUID_LEVEL_ADDRESS = 0  # 40001 对应的实际地址
-	PRESSURE_ADDRESS = 1  # 40002 对应的实际地址
 
-	def __init__(self, host: str, port: int, unit_id: int = 1):
-		super().__init__()
+	def __init__(self, host: str, port: int, unit_id: int = 1, register_map: RegisterMap = LN2_REGISTER_MAP,
+				 timeout: float = 1.0, probe_interval: float = 10.0):
 		self.host = host
 		self.port = port
 		self.unit_id = unit_id
-		self.client: Optional[ModbusTcpClient] = None
-		self.is_connected = False
+		self.register_map = register_map
+		# 长连接会话: 连接在多次读取之间复用，断开后按抖动退避自动重连
+		self.session = ModbusSession(host, port, unit_id=unit_id, timeout=timeout, probe_interval=probe_interval,
+									 probe_address=register_map.blocks[0].start)
 		self.logger.info(f"液氮分离器读取器初始化: {host}:{port}")
 
+	@property
+	def client(self) -> Optional["ModbusTcpClient"]:
+		return self.session.client
+
+	@property
+	def is_connected(self) -> bool:
+		return self.session.is_connected
+
 	def connect_LN2(self) -> bool:
 		try:
-			self.client = ModbusTcpClient(host=self.host, port=self.port, timeout=5)
-			if self.client.connect():
-				self.is_connected = True
-				self.logger.info(f"成功连接到 PLC: {self.host}:{self.port}")
-				return True
-			else:
-				self.is_connected = False
-				self.logger.error(f"无法连接到 PLC: {self.host}:{self.port}")
-				return False
+			return self.session.connect()
 		except Exception as e:
-			self.is_connected = False
 			self.logger.error(f"连接 PLC 时发生错误: {e}", exc_info=True)
 			return False
 
 	def disconnect_LN2(self) -> None:
 		try:
-			if self.client:
-				self.client.close()
-			self.is_connected = False
-			self.logger.info("已断开 PLC 连接")
+			self.session.close()
 		except Exception as e:
 			self.logger.error(f"断开 PLC 连接时发生错误: {e}")
 
-	def read_holding_register(self, address: int) -> Optional[int]:
-		if not self.is_connected or not self.client:
-			return None
-		try:
-			result = self.client.read_holding_registers(address, count=1, device_id=self.unit_id)
-			if result.isError():
-				self.logger.error(f"读取寄存器失败, 地址: {address}, 错误: {result}")
-				return None
-			return result.registers[0]
-		except Exception as e:
-			self.logger.error(f"读取寄存器时发生异常, 地址: {address}: {e}")
-			return None
-
 	def read_current_data(self) -> Dict[str, Optional[float]]:
-		if not self.is_connected:
-			return {"液位": None, "压力": None}
+		"""
+		按寄存器表读取全部数据，相邻的寄存器合并为一次请求 (液位+压力只需一次往返)。
+		连接断开时会话会透明地重连；处于重连退避期间时返回全 None
+		"""
+		self.logger.debug("开始读取数据...")
+		return self.register_map.read_with(self.session.read_holding_registers)
 
-		self.logger.info("开始读取数据...")
-		liquid_level_raw = self.read_holding_register(self.LIQUID_LEVEL_ADDRESS)
-		time.sleep(0.1)  # 短暂延时避免 PLC 响应不及
-		pressure_raw = self.read_holding_register(self.PRESSURE_ADDRESS)
 
-		liquid_level = float(liquid_level_raw) if liquid_level_raw is not None else None
-		pressure = float(pressure_raw) / 100.0 if pressure_raw is not None else None  # 转换为 MPa
+def print_data(data: Dict[str, Optional[float]]) -> None:
+	print("\n" + "=" * 20 + " 读取结果 " + "=" * 20)
+	if data["液位"] is not None:
+		print(f"  液氮分离器液位: {data['液位']} mm")
+	else:
+		print("  液氮分离器液位: 读取失败")
 
-		return {"液位": liquid_level, "压力": pressure}
+	if data["压力"] is not None:
+		print(f"  液氮分离器压力: {data['压力']:.2f} MPa")
+	else:
+		print("  液氮分离器压力: 读取失败")
+	print("=" * 52 + "\n")
 
 
 def main():
 	parser = argparse.ArgumentParser(description="调试液氮分离器数据读取功能")
-	parser.add_argument("--host", type=str, default="192.168.0.200", help="PLC的IP地址")
+	parser.add_argument("--host", type=str, default=LN2_DEFAULT_HOST, help="PLC的IP地址")
 	parser.add_argument("--port", type=int, default=502, help="Modbus TCP 端口")
+	parser.add_argument("--store", type=str, default=None, help="把读数写入该时序数据库 (见 timeseries_store.py)")
+	parser.add_argument("--count", type=int, default=1, help="读取次数 (复用同一个连接)，0 表示一直读到 Ctrl+C")
+	parser.add_argument("--interval", type=float, default=1.0, help="多次读取时的间隔 (秒)")
 	args = parser.parse_args()
 
 	setup_logger()
 
 	reader = LN2SeparatorReader(host=args.host, port=args.port)
+	store = None
+	if args.store:
+		from timeseries_store import TimeSeriesStore
+
+		store = TimeSeriesStore(args.store)
 
 	try:
-		if reader.connect_LN2():
-			data = reader.read_current_data()
-			print("\n" + "=" * 20 + " 读取结果 " + "=" * 20)
-			if data["液位"] is not None:
-				print(f"  液氮分离器液位: {data['液位']} mm")
-			else:
-				print("  液氮分离器液位: 读取失败")
-
-			if data["压力"] is not None:
-				print(f"  液氮分离器压力: {data['压力']:.2f} MPa")
-			else:
-				print("  液氮分离器压力: 读取失败")
-			print("=" * 52 + "\n")
-		else:
+		if not reader.connect_LN2():
 			print("\n错误：无法连接到设备，请检查网络和IP地址。\n")
-
+			if args.count == 1:
+				return
+		n = 0
+		while args.count == 0 or n < args.count:
+			if n:
+				time.sleep(args.interval)
+			data = reader.read_current_data()
+			if store is not None:
+				store.append_readings(data, prefix="LN2.")
+			print_data(data)
+			n += 1
+	except KeyboardInterrupt:
+		pass
 	finally:
 		reader.disconnect_LN2()
+		if store is not None:
+			store.close()
+		if args.count != 1:
+			print(f"连接统计: {reader.session.stats()}")
 
 
 if __name__ == "__main__":
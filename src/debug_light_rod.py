@@ -1,39 +1,40 @@
 # debug_traffic_light.py
 
 import argparse
-import time
-
-import serial
-from PySide6.QtCore import QObject  # For compatibility
+from typing import Optional
 
+from light_rtu import ALL_OFF_ADDRESS, CHANNELS, MODES, TrafficLightDriver, build_write_coil
+from serial_port_manager import get_port, release_port
 from tools import LoggerMixin, setup_logger
 
 
-class TrafficLightController(QObject, LoggerMixin):
+class TrafficLightController(LoggerMixin):
 	# 从 alarm_manager.py 提取的三色灯控制器
+	# 由 light_rtu 按 (线圈, 模式) 生成，不再手写 CRC
 	COMMANDS = {
-		'red_on': bytes.fromhex('01 05 00 00 ff 00 8C 3A'),
-		'green_on': bytes.fromhex('01 05 00 02 ff 00 2D FA'),
-		'buzzer_on': bytes.fromhex('01 05 00 03 ff 00 7C 3A'),
-		'all_off': bytes.fromhex('01 05 00 EF FF 00 BD CF'),
-		'red_flash_1hz': bytes.fromhex('01 05 00 00 f1 00 88 5A'),
-		'buzzer_1hz': bytes.fromhex('01 05 00 03 f1 00 78 5A'),
+		'red_on': build_write_coil(1, CHANNELS['red'], MODES['on']),
+		'green_on': build_write_coil(1, CHANNELS['green'], MODES['on']),
+		'buzzer_on': build_write_coil(1, CHANNELS['buzzer'], MODES['on']),
+		'all_off': build_write_coil(1, ALL_OFF_ADDRESS, MODES['on']),
+		'red_flash_1hz': build_write_coil(1, CHANNELS['red'], MODES['flash_1hz']),
+		'buzzer_1hz': build_write_coil(1, CHANNELS['buzzer'], MODES['flash_1hz']),
 	}
+	NORMAL_STATE = {'green': 'on'}
+	ALARM_STATE = {'red': 'flash_1hz'}
 
 	def __init__(self, port: str, baudrate: int):
-		super().__init__()
 		self.port = port
 		self.baudrate = baudrate
 		self.serial_conn = None
+		self.driver: Optional[TrafficLightDriver] = None
 		self.is_connected = False
 
 	def connect_serial(self) -> bool:
-	#注意QObject本身有connect方法（信号和槽），所以不要命名为connect
+	#不命名为connect: 需要接入 Qt 界面时可以再混入 QObject，而 QObject 本身有connect方法（信号和槽）
 		try:
-			self.serial_conn = serial.Serial(
-				port=self.port,
-				baudrate=self.baudrate,
-				timeout=1)
+			# 串口由端口管理器共享，每条指令作为一个事务在端口的所有者线程上执行
+			self.serial_conn = get_port(self.port, baudrate=self.baudrate)
+			self.driver = TrafficLightDriver(self.serial_conn)
 			self.is_connected = True
 			self.logger.info(f"三色灯连接成功: {self.port}")
 			return True
@@ -43,8 +44,9 @@ class TrafficLightController(QObject, LoggerMixin):
 			return False
 
 	def disconnect_serial(self) -> None:
-		if self.serial_conn and self.serial_conn.is_open:
-			self.serial_conn.close()
+		if self.serial_conn is not None:
+			release_port(self.port)
+			self.serial_conn = None
 		self.is_connected = False
 		self.logger.info("三色灯已断开连接")
 
@@ -55,28 +57,34 @@ class TrafficLightController(QObject, LoggerMixin):
 			self.logger.error(f"未知指令: {command_name}")
 			return False
 		try:
-			self.serial_conn.write(command)
 			self.logger.debug(f"发送指令: {command_name} -> {command.hex()}")
-			return True
+			# 绕过状态跟踪直接发送的帧会让记录的灯状态失效
+			self.driver.invalidate()
+			return self.driver.transact(command)
 		except Exception as e:
 			self.logger.error(f"发送指令失败: {e}")
 			return False
 
+	def set_state(self, target: dict) -> bool:
+		"""只发送与当前灯状态不同的通道，并校验每一帧的应答"""
+		if not self.is_connected: return False
+		try:
+			return self.driver.apply(target)
+		except Exception as e:
+			self.logger.error(f"设置三色灯状态失败: {e}")
+			return False
+
 	def set_normal_status(self) -> bool:
 		self.logger.info("设置状态为 [正常]: 绿灯常亮")
-		self.send_command('all_off')
-		time.sleep(0.1)
-		return self.send_command('green_on')
+		return self.set_state(self.NORMAL_STATE)
 
 	def set_alarm_status(self) -> bool:
 		self.logger.info("设置状态为 [报警]: 红灯闪烁")
-		self.send_command('all_off')
-		time.sleep(0.1)
-		return self.send_command('red_flash_1hz')
+		return self.set_state(self.ALARM_STATE)
 
 	def all_off(self) -> bool:
 		self.logger.info("设置状态为 [全部关闭]")
-		return self.send_command('all_off')
+		return self.set_state({})
 
 
 def main():
@@ -0,0 +1,273 @@
+# glyph_matcher.py
+
+"""
+固定字体仪表读数的免 OCR 字形模板匹配识别器。
+
+Molly 2000 面板上的真空计 (0123456789.E-) 和冷泵温度 (0123456789Kk.) 读数
+永远是同一种字体、同一个字号，用完整的 Tesseract 识别是大材小用。这里的做法：
+
+1.  **二值化**: 以 (最亮+最暗)/2 为阈值，少数像素一侧视为笔画；
+2.  **列投影分割**: 对二值图按列求和，连续的非空列即为一个字符；
+3.  **模板匹配**: 每个字符以列中心对齐放入固定大小的单元格 (不缩放宽度，
+	保留 '.'、'-'、'1' 的形状差异)，与字形图集做归一化互相关 (一次矩阵乘法)。
+
+每个字符都返回一个置信度 (0~1)，最低置信度低于阈值时由调用方回退到 Tesseract。
+
+字形图集由已标注的裁剪图生成:
+	atlas = GlyphAtlas.from_labeled_crops([(crop_image, "1.23E-9"), ...])
+	atlas.save("glyphs/vacuum.npz")
+"""
+
+import argparse
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 默认单元格大小 (像素)，应略大于字体中最宽字符的宽度和字高
+DEFAULT_CELL_SIZE = (20, 14)
+
+
+def to_gray_array(image) -> np.ndarray:
+	"""Pillow 图像或 numpy 数组 -> 二维 uint8 灰度数组 (已是灰度数组时不复制)"""
+	if isinstance(image, np.ndarray):
+		if image.ndim == 3:
+			# ITU-R 601-2 luma，与 Pillow convert('L') 一致
+			return (image[..., 0] * 0.299 + image[..., 1] * 0.587 + image[..., 2] * 0.114).astype(np.uint8)
+		return image
+	if image.mode != 'L':
+		image = image.convert('L')
+	return np.asarray(image)
+
+
+def binarize(gray: np.ndarray) -> np.ndarray:
+	"""自动判断极性的二值化，返回布尔笔画掩码"""
+	lo, hi = int(gray.min()), int(gray.max())
+	if hi - lo < 32:  # 几乎没有对比度，视为空白
+		return np.zeros(gray.shape, dtype=bool)
+	threshold = (lo + hi) / 2
+	ink = gray < threshold
+	# 笔画应是少数像素；否则为亮字暗底
+	if ink.mean() > 0.5:
+		ink = ~ink
+	return ink
+
+
+def segment_columns(mask: np.ndarray) -> List[Tuple[int, int]]:
+	"""按列投影分割字符，返回 [(x0, x1), ...] (x1 不包含)"""
+	cols = mask.any(axis=0).astype(np.int8)
+	edges = np.diff(np.concatenate(([0], cols, [0])))
+	starts = np.flatnonzero(edges == 1)
+	ends = np.flatnonzero(edges == -1)
+	return list(zip(starts.tolist(), ends.tolist()))
+
+
+def extract_cells(mask: np.ndarray, segments: List[Tuple[int, int]],
+				  cell_size: Tuple[int, int] = DEFAULT_CELL_SIZE) -> np.ndarray:
+	"""
+	将每个字符放入 (h, w) 单元格，返回 (k, h*w) 的 float32 特征矩阵。
+	竖直方向使用整行的笔画范围 (保留 '.' 与 '-' 的高低位置)，水平方向以字符中心对齐。
+	"""
+	cell_h, cell_w = cell_size
+	if not segments:
+		return np.zeros((0, cell_h * cell_w), dtype=np.float32)
+
+	rows = np.flatnonzero(mask.any(axis=1))
+	band = mask[rows[0]:rows[-1] + 1]
+	# 行方向: 最近邻映射到 cell_h 行 (字号固定时通常是恒等映射)
+	row_idx = ((np.arange(cell_h) + 0.5) * band.shape[0] / cell_h).astype(np.intp)
+	band = band[row_idx]
+
+	seg = np.asarray(segments, dtype=np.intp)
+	x0, x1 = seg[:, 0:1], seg[:, 1:2]
+	col_idx = (x0 + x1) // 2 - cell_w // 2 + np.arange(cell_w)  # (k, w)
+	valid = (col_idx >= x0) & (col_idx < x1)
+	np.clip(col_idx, 0, band.shape[1] - 1, out=col_idx)
+
+	cells = band[:, col_idx] & valid  # (h, k, w)
+	return cells.transpose(1, 0, 2).reshape(len(segments), -1).astype(np.float32)
+
+
+def _normalize_rows(features: np.ndarray) -> np.ndarray:
+	"""零均值、单位范数，使矩阵乘法直接得到归一化互相关系数"""
+	centered = features - features.mean(axis=1, keepdims=True)
+	norms = np.linalg.norm(centered, axis=1, keepdims=True)
+	norms[norms == 0] = 1.0
+	return centered / norms
+
+
+@dataclass
+class GlyphReading:
+	"""一次识别的结果"""
+	text: str
+	confidences: List[float] = field(default_factory=list)
+
+	@property
+	def min_confidence(self) -> float:
+		return min(self.confidences) if self.confidences else 0.0
+
+
+class GlyphAtlas:
+	"""
+	字形图集: labels[i] 对应 templates[i] (已归一化的特征向量)
+	"""
+
+	def __init__(self, labels: List[str], templates: np.ndarray, cell_size: Tuple[int, int] = DEFAULT_CELL_SIZE):
+		self.labels = list(labels)
+		self.cell_size = tuple(cell_size)
+		self.templates = _normalize_rows(np.asarray(templates, dtype=np.float32))
+		self._subset_cache: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+	@classmethod
+	def from_labeled_crops(cls, samples: Iterable[Tuple[object, str]],
+						   cell_size: Tuple[int, int] = DEFAULT_CELL_SIZE) -> "GlyphAtlas":
+		"""
+		由 (裁剪图, 读数文本) 样本生成图集。文本中的空格会被忽略；
+		分割出的字符数与文本长度不一致的样本会被跳过。同一字符的多个样本取平均。
+		"""
+		sums: Dict[str, np.ndarray] = {}
+		counts: Dict[str, int] = {}
+		for image, text in samples:
+			text = text.replace(' ', '')
+			mask = binarize(to_gray_array(image))
+			segments = segment_columns(mask)
+			if len(segments) != len(text):
+				continue
+			for char, feature in zip(text, extract_cells(mask, segments, cell_size)):
+				if char in sums:
+					sums[char] += feature
+					counts[char] += 1
+				else:
+					sums[char] = feature.copy()
+					counts[char] = 1
+		if not sums:
+			raise ValueError("没有可用的标注样本 (字符分割数量均与文本不符)")
+		labels = sorted(sums)
+		templates = np.stack([sums[c] / counts[c] for c in labels])
+		return cls(labels, templates, cell_size)
+
+	@classmethod
+	def load(cls, path: str) -> "GlyphAtlas":
+		data = np.load(path)
+		return cls(list(str(data['labels'])), data['templates'], tuple(int(v) for v in data['cell_size']))
+
+	def save(self, path: str) -> None:
+		np.savez_compressed(path, labels=np.array(''.join(self.labels)),
+							templates=self.templates, cell_size=np.array(self.cell_size))
+
+	def subset(self, whitelist: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+		"""返回白名单内字符的 (标签数组, 模板矩阵)"""
+		key = whitelist or ''
+		if key not in self._subset_cache:
+			keep = [i for i, c in enumerate(self.labels) if not whitelist or c in whitelist]
+			self._subset_cache[key] = (np.array(self.labels)[keep], self.templates[keep])
+		return self._subset_cache[key]
+
+
+class GlyphRecognizer:
+	"""
+	基于字形图集的单行读数识别器。最低字符置信度低于 min_confidence 时调用 fallback。
+	"""
+
+	def __init__(self, atlas: GlyphAtlas, min_confidence: float = 0.8,
+				 fallback: Optional[Callable[[], str]] = None):
+		self.atlas = atlas
+		self.min_confidence = min_confidence
+		self.fallback = fallback
+		self.fallback_count = 0
+
+	def match(self, image, whitelist: Optional[str] = None) -> GlyphReading:
+		"""只做模板匹配，不回退。图集中没有白名单内的字符时返回空读数 (置信度为 0，read() 会回退)"""
+		labels, templates = self.atlas.subset(whitelist)
+		if not len(labels):
+			return GlyphReading("")
+		mask = binarize(to_gray_array(image))
+		segments = segment_columns(mask)
+		if not segments:
+			return GlyphReading("")
+		features = _normalize_rows(extract_cells(mask, segments, self.atlas.cell_size))
+		scores = features @ templates.T  # (k, n)
+		best = scores.argmax(axis=1)
+		confidences = np.clip(scores[np.arange(len(best)), best], 0.0, 1.0)
+		return GlyphReading(''.join(labels[best]), confidences.tolist())
+
+	def read(self, image, whitelist: Optional[str] = None,
+			 fallback: Optional[Callable[[], str]] = None) -> str:
+		"""识别读数；置信度不足时调用 fallback (参数优先于构造时传入的 fallback)"""
+		reading = self.match(image, whitelist)
+		fallback = fallback or self.fallback
+		if reading.min_confidence < self.min_confidence and fallback is not None:
+			self.fallback_count += 1
+			return fallback()
+		return reading.text
+
+
+# --- 基准测试：在渲染语料上比较模板匹配与 Tesseract ---
+
+def _load_font(font_size: int):
+	from PIL import ImageFont
+
+	for name in ("consola.ttf", "DejaVuSansMono.ttf", "arial.ttf"):
+		try:
+			return ImageFont.truetype(name, font_size)
+		except IOError:
+			continue
+	return ImageFont.load_default()
+
+
+def render_corpus(count: int, kind: str = "vacuum", seed: int = 0, font_size: int = 16):
+	"""生成 count 张 (灰度裁剪图, 文本) 样本，kind 为 'vacuum' 或 'temp'"""
+	from PIL import Image, ImageDraw
+
+	rng = np.random.default_rng(seed)
+	font = _load_font(font_size)
+	samples = []
+	for _ in range(count):
+		if kind == "vacuum":
+			text = f"{rng.uniform(1, 10):.2f}E-{rng.integers(1, 12)}"
+		else:
+			text = f"{rng.uniform(10, 300):.1f}{'K' if rng.random() < 0.5 else 'k'}"
+		img = Image.new('L', (110, 24), color=235)
+		ImageDraw.Draw(img).text((3, 2), text, fill=20, font=font)
+		samples.append((img, text))
+	return samples
+
+
+def main():
+	parser = argparse.ArgumentParser(description="字形模板匹配 vs Tesseract 读数识别基准测试")
+	parser.add_argument("--train", type=int, default=50, help="用于生成图集的样本数")
+	parser.add_argument("--test", type=int, default=500, help="测试样本数")
+	parser.add_argument("--tesseract", action="store_true", help="同时测试 Tesseract (需要已安装)")
+	args = parser.parse_args()
+
+	for kind, whitelist in (("vacuum", '0123456789.E-'), ("temp", '0123456789Kk.')):
+		atlas = GlyphAtlas.from_labeled_crops(render_corpus(args.train, kind, seed=1))
+		recognizer = GlyphRecognizer(atlas)
+		corpus = render_corpus(args.test, kind, seed=2)
+		arrays = [(to_gray_array(img), text) for img, text in corpus]
+
+		correct, low_conf = 0, 0
+		start_time = time.perf_counter()
+		for gray, text in arrays:
+			reading = recognizer.match(gray, whitelist)
+			correct += reading.text == text
+			low_conf += reading.min_confidence < recognizer.min_confidence
+		elapsed = time.perf_counter() - start_time
+		print(f"[{kind}] 模板匹配: 正确 {correct}/{len(arrays)}, 低置信度 {low_conf}, "
+			  f"平均 {elapsed / len(arrays) * 1000:.3f} ms/次")
+
+		if args.tesseract:
+			from ocr_engine import get_default_pool
+
+			pool = get_default_pool()
+			correct = 0
+			start_time = time.perf_counter()
+			for img, text in corpus:
+				correct += pool.recognize(img, whitelist) == text
+			elapsed = time.perf_counter() - start_time
+			print(f"[{kind}] Tesseract: 正确 {correct}/{len(corpus)}, 平均 {elapsed / len(corpus) * 1000:.3f} ms/次")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,289 @@
+# indicator_classifier.py
+
+"""
+向量化的批量指示灯状态识别。
+
+get_shutter_status_from_image 用 getpixel 读取单个像素并套用硬编码的 RGB 阈值，
+而且只能处理一个快门。腔体上有十几个快门和阀门指示灯，这里改为声明式的指示灯表：
+
+	Indicator(名称, 所在面板, 相对面板左上角的偏移, 采样半径, 颜色类别)
+
+每个指示灯取一个 (2r+1)x(2r+1) 的采样块求平均颜色 (比单个像素更抗噪)，所有指示灯
+在一次 NumPy 运算中完成取样、求均值和颜色分类。传入 Pillow 截图时只把采样点所在的行带
+转成数组 (crop_sample_rows)，不会每次复制整张截图。
+
+面板上实际只有几个指示灯 (read_Lbar5.INDICATORS 目前只有一个快门)，这时 NumPy 每次调用的
+固定开销 (约 0.1 ms) 比取样本身还贵：指示灯和采样像素都很少 (SCALAR_MAX_COST) 时，Pillow 截图
+改为逐像素取样、纯 Python 分类，结果与向量化路径相同。
+
+颜色类别是平均颜色的 RGB 闭区间，按顺序取第一个匹配的类别；默认的 LED_CLASSES
+与原 get_shutter_status_from_image 的阈值完全一致。
+"""
+
+import argparse
+import time
+from dataclasses import dataclass
+from typing import Dict, Mapping, Sequence, Tuple
+
+import numpy as np
+
+Color = Tuple[int, int, int]
+
+
+@dataclass(frozen=True)
+class ColorClass:
+	"""一个颜色类别：平均颜色落在 [lo, hi] (RGB，含端点) 内即属于该类别"""
+	name: str
+	lo: Color
+	hi: Color
+
+
+# 与 get_shutter_status_from_image 相同: 绿 (G>200, R<80, B<80) -> Open；红 (R>200, G<80, B<80) -> Closed
+LED_CLASSES = (
+	ColorClass("Open", (0, 201, 0), (79, 255, 79)),
+	ColorClass("Closed", (201, 0, 0), (255, 79, 79)),
+)
+
+
+@dataclass(frozen=True)
+class Indicator:
+	"""
+	一个指示灯。panel 是控件名 (对应 ControlLocator 返回的矩形)，
+	offset 是指示灯中心相对该面板左上角的偏移，patch_radius=0 时退化为单像素。
+	"""
+	name: str
+	panel: str
+	offset: Tuple[int, int]
+	patch_radius: int = 1
+	classes: Tuple[ColorClass, ...] = LED_CLASSES
+
+
+def to_rgb_array(image) -> np.ndarray:
+	"""Pillow 图像或 numpy 数组 -> (H, W, 3) uint8 数组"""
+	if isinstance(image, np.ndarray):
+		return image[..., :3] if image.ndim == 3 else np.repeat(image[..., None], 3, axis=2)
+	if image.mode != 'RGB':
+		image = image.convert('RGB')
+	return np.asarray(image)
+
+
+# Pillow 截图上逐像素取样的估计开销 (每个指示灯记 采样像素数 + 4) 不超过此值时不走 NumPy，
+# 约为半径 1 时 9 个、半径 0 时 24 个指示灯 (再多时 NumPy 的固定开销已被摊薄)
+SCALAR_MAX_COST = 120
+
+# 采样行之间的空隙不超过这么多行时合并成同一条带，避免一行一次 crop
+BAND_MERGE_GAP = 16
+
+
+def crop_sample_rows(image, xs: np.ndarray, ys: np.ndarray):
+	"""
+	Pillow 图像只把采样点所在的行带 (横向限于采样点的范围) 转成数组，
+	而不是每次把整张截图复制一遍；返回 (像素数组, 换算到该数组内的 xs, ys)
+	"""
+	width, height = image.size
+	sampled = np.zeros(height, dtype=bool)
+	sampled[ys] = True
+	rows = np.flatnonzero(sampled)
+	breaks = np.flatnonzero(np.diff(rows) > BAND_MERGE_GAP + 1) + 1
+	tops = np.concatenate(([rows[0]], rows[breaks]))
+	bottoms = np.concatenate((rows[breaks - 1], [rows[-1]])) + 1
+	left, right = int(xs.min()), int(xs.max()) + 1
+	if breaks.size == 0:
+		return to_rgb_array(image.crop((left, int(tops[0]), right, int(bottoms[0])))), xs - left, ys - tops[0]
+
+	strips = [to_rgb_array(image.crop((left, int(top), right, int(bottom)))) for top, bottom in zip(tops, bottoms)]
+	pixels = np.concatenate(strips, axis=0)
+	# 条带按行号顺序拼接: 原行号 -> 拼接后的行号
+	kept = np.zeros(height + 1, dtype=np.intp)
+	kept[tops] = 1  # 条带之间至少隔 BAND_MERGE_GAP 行，起止行不会重合
+	kept[bottoms] = -1
+	row_map = np.cumsum(np.cumsum(kept)[:height]) - 1
+	return pixels, xs - left, row_map[ys]
+
+
+class IndicatorTable:
+	"""
+	指示灯表。构造时把所有静态信息 (采样块偏移、颜色区间) 预先整理成数组，
+	classify() 时只剩一次取样和几次广播比较。
+	"""
+
+	def __init__(self, indicators: Sequence[Indicator]):
+		self.indicators = list(indicators)
+		self.names = [ind.name for ind in self.indicators]
+		self.panels = sorted({ind.panel for ind in self.indicators})
+		self._panel_index = np.array([self.panels.index(ind.panel) for ind in self.indicators], dtype=np.intp)
+		n = len(self.indicators)
+
+		# 采样块: 所有指示灯统一使用最大半径，半径较小的用权重 0 屏蔽多余的像素
+		radius = max((ind.patch_radius for ind in self.indicators), default=0)
+		d = np.arange(-radius, radius + 1)
+		self._patch_dy = np.repeat(d, d.size)  # (P,)
+		self._patch_dx = np.tile(d, d.size)
+		reach = np.maximum(np.abs(self._patch_dx), np.abs(self._patch_dy))
+		radii = np.array([ind.patch_radius for ind in self.indicators]).reshape(n, 1)
+		weights = (reach <= radii).astype(np.float32)  # (N, P)
+		self._weights = weights / weights.sum(axis=1, keepdims=True)
+		self._offsets = np.array([ind.offset for ind in self.indicators], dtype=np.intp).reshape(n, 2)
+		self._scalar_cost = sum((2 * ind.patch_radius + 1) ** 2 + 4 for ind in self.indicators)
+
+		# 颜色类别: 汇总为全局列表 (C 个)，每个指示灯用掩码标记自己可用的类别
+		classes = []
+		for ind in self.indicators:
+			for cls in ind.classes:
+				if cls not in classes:
+					classes.append(cls)
+		self._class_labels = np.array([cls.name for cls in classes], dtype=object)
+		self._lo = np.array([cls.lo for cls in classes], dtype=np.float32).reshape(-1, 3)  # (C, 3)
+		self._hi = np.array([cls.hi for cls in classes], dtype=np.float32).reshape(-1, 3)
+		self._allowed = np.array([[cls in ind.classes for cls in classes] for ind in self.indicators],
+								 dtype=bool).reshape(n, len(classes))  # (N, C)
+
+	def sample(self, image, main_win_coords, panel_coords: Mapping[str, object]) -> np.ndarray:
+		"""返回每个指示灯采样块的平均颜色 (N, 3)"""
+		panel_origins = np.array([(panel_coords[name].left - main_win_coords.left,
+								   panel_coords[name].top - main_win_coords.top)
+								  for name in self.panels], dtype=np.intp).reshape(-1, 2)
+		centers = panel_origins[self._panel_index] + self._offsets  # (N, 2) 截图内坐标 (x, y)
+		if isinstance(image, np.ndarray):
+			height, width = image.shape[:2]
+		else:
+			width, height = image.size
+		xs = np.clip(centers[:, 0:1] + self._patch_dx, 0, width - 1)  # (N, P)
+		ys = np.clip(centers[:, 1:2] + self._patch_dy, 0, height - 1)
+		if isinstance(image, np.ndarray):
+			pixels = to_rgb_array(image)
+		else:
+			pixels, xs, ys = crop_sample_rows(image, xs, ys)
+		patches = pixels[ys, xs].astype(np.float32)  # (N, P, 3)
+		return np.matmul(self._weights[:, None, :], patches)[:, 0, :]
+
+	def _classify_pixels(self, image, main_win_coords, panel_coords: Mapping[str, object]) -> Dict[str, str]:
+		"""逐像素取样 (PixelAccess)、纯 Python 分类；采样点很少时比 NumPy 的固定开销便宜"""
+		width, height = image.size
+		pixels = image.load()
+		states = {}
+		for ind in self.indicators:
+			panel = panel_coords[ind.panel]
+			cx = panel.left - main_win_coords.left + ind.offset[0]
+			cy = panel.top - main_win_coords.top + ind.offset[1]
+			r = ind.patch_radius
+			total_r = total_g = total_b = 0
+			for y in range(cy - r, cy + r + 1):
+				y = min(max(y, 0), height - 1)
+				for x in range(cx - r, cx + r + 1):
+					pr, pg, pb = pixels[min(max(x, 0), width - 1), y]
+					total_r += pr
+					total_g += pg
+					total_b += pb
+			count = (2 * r + 1) ** 2
+			rgb = (round(total_r / count), round(total_g / count), round(total_b / count))
+			for cls in ind.classes:
+				if all(lo <= v <= hi for lo, v, hi in zip(cls.lo, rgb, cls.hi)):
+					states[ind.name] = cls.name
+					break
+			else:
+				states[ind.name] = f"Unknown (R={rgb[0]}, G={rgb[1]}, B={rgb[2]})"
+		return states
+
+	def classify(self, image, main_win_coords, panel_coords: Mapping[str, object]) -> Dict[str, str]:
+		"""一次性识别所有指示灯，返回 {指示灯名: 状态}"""
+		if not self.indicators:
+			return {}
+		if self._scalar_cost <= SCALAR_MAX_COST and not isinstance(image, np.ndarray) and image.mode == 'RGB':
+			return self._classify_pixels(image, main_win_coords, panel_coords)
+		means = self.sample(image, main_win_coords, panel_coords)
+		rounded = np.rint(means)
+		inside = ((rounded[:, None, :] >= self._lo) & (rounded[:, None, :] <= self._hi)).all(axis=2)
+		matches = inside & self._allowed  # (N, C)
+		first = matches.argmax(axis=1)
+		found = matches[np.arange(len(first)), first]
+
+		labels = self._class_labels[first]
+		for i in np.flatnonzero(~found):
+			r, g, b = (int(v) for v in rounded[i])
+			labels[i] = f"Unknown (R={r}, G={g}, B={b})"
+		return dict(zip(self.names, labels.tolist()))
+
+
+# --- 基准测试：与逐个 getpixel 的对比 ---
+
+def _classify_getpixel(image, main_win_coords, panel_coords, indicators) -> Dict[str, str]:
+	"""原 get_shutter_status_from_image 的做法，逐个指示灯调用 getpixel"""
+	states = {}
+	for ind in indicators:
+		panel = panel_coords[ind.panel]
+		x = panel.left + ind.offset[0] - main_win_coords.left
+		y = panel.top + ind.offset[1] - main_win_coords.top
+		r, g, b = image.getpixel((x, y))
+		if g > 200 and r < 80 and b < 80:
+			states[ind.name] = "Open"
+		elif r > 200 and g < 80 and b < 80:
+			states[ind.name] = "Closed"
+		else:
+			states[ind.name] = f"Unknown (R={r}, G={g}, B={b})"
+	return states
+
+
+def build_synthetic_leds(count: int, seed: int = 0):
+	"""
+	生成一张 1280x1024 主窗口截图，指示灯面板 (每行 50 个，共 count 个红/绿指示灯) 位于窗口中部，
+	返回 (截图, 主窗口坐标, 面板坐标, 指示灯列表)
+	"""
+	from PIL import Image, ImageDraw
+	from region_cache import Rect
+
+	rng = np.random.default_rng(seed)
+	cols = 50
+	panel_width, panel_height = cols * 20, ((count + cols - 1) // cols) * 20
+	panel_left, panel_top = 140, 200
+	width, height = max(1280, panel_left + panel_width), max(1024, panel_top + panel_height)
+	image = Image.new('RGB', (width, height), color=(192, 192, 192))
+	draw = ImageDraw.Draw(image)
+	indicators = []
+	for i in range(count):
+		x, y = (i % cols) * 20 + 10, (i // cols) * 20 + 10
+		color = (30, 230, 30) if rng.random() < 0.5 else (230, 30, 30)
+		cx, cy = panel_left + x, panel_top + y
+		draw.ellipse((cx - 4, cy - 4, cx + 4, cy + 4), fill=color)
+		indicators.append(Indicator(f"led_{i}", "panel", (x, y)))
+	main_win_coords = Rect(0, 0, width, height)
+	panel = Rect(panel_left, panel_top, panel_left + panel_width, panel_top + panel_height)
+	return image, main_win_coords, {"panel": panel}, indicators
+
+
+def main():
+	parser = argparse.ArgumentParser(description="批量指示灯识别 vs 逐像素 getpixel 基准测试")
+	parser.add_argument("--counts", type=int, nargs="+", default=[1, 5, 10, 100, 1000], help="指示灯数量")
+	parser.add_argument("--rounds", type=int, default=200, help="每种规模的重复次数")
+	args = parser.parse_args()
+
+	for count in args.counts:
+		image, main_win_coords, panel_coords, indicators = build_synthetic_leds(count)
+		table = IndicatorTable(indicators)
+		assert table.classify(image, main_win_coords, panel_coords) == \
+			   _classify_getpixel(image, main_win_coords, panel_coords, indicators)
+
+		start_time = time.perf_counter()
+		for _ in range(args.rounds):
+			_classify_getpixel(image, main_win_coords, panel_coords, indicators)
+		per_pixel = (time.perf_counter() - start_time) / args.rounds
+
+		start_time = time.perf_counter()
+		for _ in range(args.rounds):
+			table.classify(image, main_win_coords, panel_coords)
+		vectorized = (time.perf_counter() - start_time) / args.rounds
+
+		pixels = np.asarray(image)
+		start_time = time.perf_counter()
+		for _ in range(args.rounds):
+			table.classify(pixels, main_win_coords, panel_coords)
+		preconverted = (time.perf_counter() - start_time) / args.rounds
+
+		path = "逐像素" if table._scalar_cost <= SCALAR_MAX_COST else "NumPy"
+		print(f"{count:5d} 个指示灯: 单像素 getpixel {per_pixel * 1000:8.3f} ms | "
+			  f"IndicatorTable (Pillow 截图, {path}) {vectorized * 1000:8.3f} ms "
+			  f"(已转为数组时 {preconverted * 1000:8.3f} ms)")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,482 @@
+# inspection_daemon.py
+
+"""
+点检守护进程: 在一个 asyncio 事件循环上调度全部数据源 (Molly 面板、液氮分离器) 和输出
+(时序存储、三色灯、报警短信)，取代 run.bat 里手工逐个运行的调试脚本。
+
+- 每个数据源是一个阻塞的 read() -> 读数字典 (pywinauto 截图 + OCR、Modbus 读取等)，
+  在该数据源专属的单线程执行器中运行: 阻塞调用不会卡住事件循环，同一个后端
+  (例如 pywinauto 的窗口句柄) 也始终在同一个线程里使用；
+- 每个数据源有自己的周期 (固定频率，以计划时刻为基准累加) 和截止时间。超过截止时间的
+  读取记为 deadline_miss，上一次调用仍卡在执行器里时跳过本周期 (skipped)，
+  一次读取跨过了下一个计划时刻时跳过错过的时刻并记为 overrun；
+- 读取结果 (SourceResult) 进入一个有界队列，由一个输出线程按顺序交给各个 sink，
+  sink 慢或出错不影响采样节奏 (队列满时丢弃最旧的结果)；
+- 数据源和 sink 都只是可调用对象，--fake 时全部换成本地模拟器
+  (PLCSimulator、SimulatedLightSlave、ScriptedModem 和一个假的面板读数)，整个守护进程
+  可以在 Linux 上无界面运行。
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from log_pipeline import log_sample
+from metrics import MetricsReporter, MetricsServer, stage_timer
+from tools import LoggerMixin, setup_logger
+
+Readings = Dict[str, Any]
+
+
+@dataclass
+class SourceSpec:
+	"""一个数据源: read 是阻塞调用，在该数据源专属的执行器线程中运行"""
+	name: str
+	read: Callable[[], Readings]
+	interval: float = 1.0  # 采样周期 (秒)
+	deadline: Optional[float] = None  # 单次读取的截止时间 (秒)，默认等于周期
+
+
+@dataclass
+class SourceResult:
+	"""一次读取: 失败时 readings 为空、error 为原因"""
+	source: str
+	timestamp: float
+	readings: Readings
+	latency: float
+	error: Optional[str] = None
+
+
+@dataclass
+class SourceStats:
+	cycles: int = 0
+	errors: int = 0
+	deadline_misses: int = 0
+	skipped: int = 0  # 上一次读取仍未返回，跳过的周期数
+	overruns: int = 0  # 读取跨过下一个计划时刻，跳过的计划时刻数
+	lag_max: float = 0.0  # 实际开始时刻相对计划时刻的最大延后
+	latencies: List[float] = field(default_factory=list)
+
+
+class InspectionDaemon(LoggerMixin):
+	"""
+	sinks 为 sink(result) 可调用对象，在同一个输出线程中按顺序调用。
+	run() 在当前事件循环中运行，直到 stop() 或 duration 到期。
+	"""
+
+	def __init__(self, sources: Sequence[SourceSpec], sinks: Sequence[Callable[[SourceResult], None]] = (),
+				 queue_size: int = 1000, latency_window: int = 1000, report_interval: float = 0.0):
+		names = [s.name for s in sources]
+		if len(set(names)) != len(names):
+			raise ValueError("数据源名称重复")
+		self.sources = list(sources)
+		self.sinks = list(sinks)
+		self.queue_size = queue_size
+		self.latency_window = latency_window
+		self.report_interval = report_interval
+		self.dropped = 0
+		self.sink_errors = 0
+		self.source_stats: Dict[str, SourceStats] = {s.name: SourceStats() for s in self.sources}
+		self._executors = {s.name: ThreadPoolExecutor(1, thread_name_prefix=f"source-{s.name}") for s in self.sources}
+		self._sink_executor = ThreadPoolExecutor(1, thread_name_prefix="sinks")
+		self._queue: Optional[asyncio.Queue] = None
+		self._stopping: Optional[asyncio.Event] = None
+
+	async def _wait(self, seconds: float) -> bool:
+		"""等待 seconds 秒，期间收到 stop() 则返回 True"""
+		try:
+			await asyncio.wait_for(self._stopping.wait(), max(0.0, seconds))
+			return True
+		except asyncio.TimeoutError:
+			return False
+
+	def _publish(self, result: SourceResult) -> None:
+		try:
+			self._queue.put_nowait(result)
+		except asyncio.QueueFull:
+			self._queue.get_nowait()  # 丢弃最旧的结果
+			self._queue.put_nowait(result)
+			self.dropped += 1
+
+	# --- 数据源 ---
+
+	async def _run_source(self, spec: SourceSpec, phase: float) -> None:
+		stats = self.source_stats[spec.name]
+		executor = self._executors[spec.name]
+		deadline = spec.deadline or spec.interval
+		loop = asyncio.get_running_loop()
+		next_due = loop.time() + phase
+		in_flight: Optional[asyncio.Future] = None
+		read_timer = stage_timer(self.__class__.__name__, f"read_{spec.name}")
+		if await self._wait(phase):
+			return
+		while not self._stopping.is_set():
+			start_time = loop.time()
+			stats.lag_max = max(stats.lag_max, start_time - next_due)
+			timestamp = time.time()
+			if in_flight is not None and not in_flight.done():
+				# 超时的调用无法从执行器线程中取消，等它返回前不再排队新的调用
+				stats.skipped += 1
+			else:
+				stats.cycles += 1
+				in_flight = loop.run_in_executor(executor, spec.read)
+				try:
+					readings = await asyncio.wait_for(asyncio.shield(in_flight), deadline)
+				except asyncio.TimeoutError:
+					stats.deadline_misses += 1
+					stats.errors += 1
+					self._publish(SourceResult(spec.name, timestamp, {}, loop.time() - start_time,
+											   f"超过截止时间 {deadline:.2f} 秒"))
+					self.logger.warning(f"{spec.name}: 读取超过截止时间 ({deadline:.2f} 秒)")
+				except Exception as e:
+					stats.errors += 1
+					self._publish(SourceResult(spec.name, timestamp, {}, loop.time() - start_time,
+											   f"{type(e).__name__}: {e}"))
+					self.logger.warning(f"{spec.name}: 读取失败: {type(e).__name__}: {e}")
+				else:
+					latency = loop.time() - start_time
+					read_timer.observe(latency)
+					stats.latencies.append(latency)
+					if len(stats.latencies) > self.latency_window:
+						del stats.latencies[:len(stats.latencies) - self.latency_window]
+					self._publish(SourceResult(spec.name, timestamp, readings, latency))
+
+			# 固定频率调度: 以计划时刻为基准累加周期，错过的时刻直接跳过
+			next_due += spec.interval
+			now = loop.time()
+			if next_due < now:
+				missed = int((now - next_due) // spec.interval) + 1
+				stats.overruns += missed
+				next_due += missed * spec.interval
+			if await self._wait(next_due - now):
+				break
+
+	# --- 输出 ---
+
+	def _deliver(self, result: SourceResult) -> None:
+		for sink in self.sinks:
+			try:
+				sink(result)
+			except Exception as e:
+				self.sink_errors += 1
+				self.logger.error(f"输出 {getattr(sink, '__name__', type(sink).__name__)} 失败: {e}", exc_info=True)
+
+	async def _run_sinks(self) -> None:
+		loop = asyncio.get_running_loop()
+		while True:
+			result = await self._queue.get()
+			await loop.run_in_executor(self._sink_executor, self._deliver, result)
+
+	async def _report(self) -> None:
+		while not await self._wait(self.report_interval):
+			for name, s in self.stats().items():
+				self.logger.info(f"[{name}] {s}")
+
+	# --- 服务 ---
+
+	async def run(self, duration: Optional[float] = None) -> None:
+		self._queue = asyncio.Queue(self.queue_size)
+		self._stopping = asyncio.Event()
+		# 各数据源的第一次采样在一个周期内错开
+		n = len(self.sources)
+		tasks = [asyncio.create_task(self._run_source(s, s.interval * i / n), name=f"source:{s.name}")
+				 for i, s in enumerate(self.sources)]
+		sink_task = asyncio.create_task(self._run_sinks(), name="sinks")
+		if self.report_interval > 0:
+			tasks.append(asyncio.create_task(self._report(), name="report"))
+		self.logger.info(f"点检守护进程启动: {len(self.sources)} 个数据源, {len(self.sinks)} 个输出")
+		try:
+			if duration is not None:
+				await self._wait(duration)
+				self._stopping.set()
+			await asyncio.gather(*tasks)
+			await self._drain()
+		finally:
+			self._stopping.set()
+			for task in tasks + [sink_task]:
+				task.cancel()
+			await asyncio.gather(*tasks, sink_task, return_exceptions=True)
+			for executor in self._executors.values():
+				executor.shutdown(wait=False)
+			self._sink_executor.shutdown(wait=True)
+			self.logger.info("点检守护进程已停止")
+
+	async def _drain(self, timeout: float = 5.0) -> None:
+		"""停止前把队列中剩余的结果交给 sink"""
+		loop = asyncio.get_running_loop()
+		deadline = loop.time() + timeout
+		while not self._queue.empty() and loop.time() < deadline:
+			await asyncio.sleep(0.01)
+
+	def stop(self) -> None:
+		"""在事件循环线程中调用；其它线程请用 loop.call_soon_threadsafe(daemon.stop)"""
+		if self._stopping is not None:
+			self._stopping.set()
+
+	def stats(self) -> Dict[str, Dict[str, float]]:
+		result = {}
+		for name, s in self.source_stats.items():
+			ordered = sorted(s.latencies)
+			result[name] = {
+				"cycles": s.cycles,
+				"errors": s.errors,
+				"deadline_misses": s.deadline_misses,
+				"skipped": s.skipped,
+				"overruns": s.overruns,
+				"lag_max_ms": s.lag_max * 1000,
+				"latency_p50_ms": ordered[len(ordered) // 2] * 1000 if ordered else 0.0,
+				"latency_p95_ms": ordered[int(len(ordered) * 0.95)] * 1000 if ordered else 0.0,
+				"latency_max_ms": ordered[-1] * 1000 if ordered else 0.0,
+			}
+		return result
+
+
+# --- 输出 (sink) ---
+
+class StoreSink:
+	"""把读数写入时序存储，序列名为 "<数据源>.<读数名>" """
+
+	def __init__(self, store):
+		self.store = store
+
+	def __call__(self, result: SourceResult) -> None:
+		if result.readings:
+			self.store.append_readings(result.readings, int(result.timestamp * 1000), prefix=f"{result.source}.")
+
+
+class SampleLogSink:
+	"""每次成功的读取写一行采样日志 (JSON lines，见 log_pipeline.log_sample)"""
+
+	def __call__(self, result: SourceResult) -> None:
+		if result.readings:
+			log_sample(result.source, result.timestamp, result.readings)
+
+
+class AlarmSink(LoggerMixin):
+	"""
+	把成功的读数送入报警规则引擎 (alarm_rules.RuleEngine，通道名为 "<数据源>.<读数名>")，
+	连续 max_failures 次读取失败也算报警。任一报警存在时三色灯切到报警状态，
+	全部恢复后切回正常；新出现的报警通过短信调度器发给 phones。
+	"""
+
+	def __init__(self, engine, light=None, dispatcher=None, phones: Sequence[str] = (), max_failures: int = 3):
+		self.engine = engine  # alarm_rules.RuleEngine
+		self.light = light  # TrafficLightController
+		self.dispatcher = dispatcher  # sms_dispatcher.SMSDispatcher
+		self.phones = list(phones)
+		self.max_failures = max_failures
+		self._failure_alarms: Dict[str, str] = {}
+		self._failures: Dict[str, int] = {}
+		self._alarm_lit: Optional[bool] = None
+
+	@property
+	def active(self) -> Dict[str, str]:
+		"""当前全部报警: {规则名或 "<数据源>:读取失败": 报警文本}"""
+		return {**self.engine.active(), **self._failure_alarms}
+
+	def __call__(self, result: SourceResult) -> None:
+		if result.error is not None:
+			failures = self._failures.get(result.source, 0) + 1
+			self._failures[result.source] = failures
+			key = f"{result.source}:读取失败"
+			# 连续失败的次数会变化，只在刚达到阈值时报警一次
+			if failures >= self.max_failures and key not in self._failure_alarms:
+				self._failure_alarms[key] = f"{result.source} 连续 {failures} 次读取失败: {result.error}"
+				self._raise(key, self._failure_alarms[key])
+		else:
+			self._failures[result.source] = 0
+			previous = self._failure_alarms.pop(f"{result.source}:读取失败", None)
+			if previous is not None:
+				self.logger.info(f"报警解除: {previous}")
+			for event in self.engine.feed_readings(result.source, result.readings, result.timestamp):
+				if event.active:
+					self._raise(event.rule, event.message)
+				else:
+					self.logger.info(f"报警解除: {event.message}")
+
+		alarm = bool(self._failure_alarms) or bool(self.engine.active())
+		if self.light is not None and alarm != self._alarm_lit:
+			ok = self.light.set_alarm_status() if alarm else self.light.set_normal_status()
+			self._alarm_lit = alarm if ok else None  # 失败时下一次结果再试
+
+	def _raise(self, key: str, message: str) -> None:
+		self.logger.warning(f"报警: {message}")
+		if self.dispatcher is not None and self.phones:
+			self.dispatcher.submit(message, self.phones, key=key)
+
+
+# --- 运行：真实后端或 --fake 的本地模拟器 ---
+
+class FakePanel:
+	"""假的 Molly 面板读数: 模拟截图 + OCR 的耗时，slow_every 次读取中有一次卡住 slow_latency 秒"""
+
+	def __init__(self, latency: float = 0.15, slow_every: int = 0, slow_latency: float = 3.0):
+		self.latency = latency
+		self.slow_every = slow_every
+		self.slow_latency = slow_latency
+		self.vacuum = 1.2e-6
+		self.count = 0
+
+	def read(self) -> Readings:
+		self.count += 1
+		slow = self.slow_every and self.count % self.slow_every == 0
+		time.sleep(self.slow_latency if slow else self.latency)
+		return {"reactor_texts": ["Ga 950.0", "In 780.0"], "shutter": "Open",
+				"vacuum": f"{self.vacuum:.1E}", "temp": "15.2K"}
+
+
+def main():
+	from debug_LN2_reader import LN2_DEFAULT_HOST, LN2SeparatorReader
+
+	parser = argparse.ArgumentParser(description="点检守护进程 (面板 + 液氮分离器 + 三色灯 + 报警短信)")
+	parser.add_argument("--fake", action="store_true", help="全部后端使用本地模拟器 (Linux 无界面运行，需要 pty)")
+	parser.add_argument("--duration", type=float, default=0, help="运行时长 (秒)，0 表示一直运行到 Ctrl+C")
+	parser.add_argument("--panel-interval", type=float, default=1.0, help="面板采样周期 (秒)")
+	parser.add_argument("--ln2-interval", type=float, default=1.0, help="液氮分离器采样周期 (秒)")
+	parser.add_argument("--ln2-host", type=str, default=LN2_DEFAULT_HOST, help="液氮分离器 PLC 地址")
+	parser.add_argument("--ln2-port", type=int, default=502, help="液氮分离器 PLC 端口")
+	parser.add_argument("--light-port", type=str, default=None, help="三色灯串口，不指定则不控制三色灯")
+	parser.add_argument("--gsm-port", type=str, default=None, help="GSM 模块串口，不指定则不发短信")
+	parser.add_argument("--phones", type=str, default="", help="报警短信接收号码，逗号分隔")
+	parser.add_argument("--min-level", type=float, default=200, help="液氮液位下限 (mm)")
+	parser.add_argument("--max-pressure", type=float, default=0.5, help="液氮压力上限 (MPa)")
+	parser.add_argument("--max-vacuum", type=float, default=1e-5, help="真空度上限 (读数数值)")
+	parser.add_argument("--max-level-drop", type=float, default=20, help="液氮液位下降速率上限 (mm/s)")
+	parser.add_argument("--store", type=str, default=None, help="把读数写入该时序数据库 (见 timeseries_store.py)")
+	parser.add_argument("--sample-log", type=str, default=None, help="采样日志 (JSON lines) 文件名，写在 logs/ 下")
+	parser.add_argument("--sync-log", action="store_true", help="在调用线程上同步写日志 (原方式)")
+	parser.add_argument("--metrics-port", type=int, default=None, help="在 localhost 的该端口提供 /metrics (Prometheus)")
+	parser.add_argument("--metrics-interval", type=float, default=60.0, help="指标摘要日志间隔 (秒)，0 为不写")
+	parser.add_argument("--report-interval", type=float, default=10.0, help="统计日志间隔 (秒)")
+	args = parser.parse_args()
+
+	from contextlib import ExitStack
+
+	# 日志写入在后台线程完成，数据源线程和事件循环不等待磁盘和控制台
+	log_pipeline = setup_logger(queued=not args.sync_log, sample_log=args.sample_log)
+	logging.getLogger("pymodbus").setLevel(logging.CRITICAL)
+	phones = [p for p in args.phones.split(",") if p]
+
+	with ExitStack() as stack:
+		if args.metrics_port is not None:
+			stack.callback(MetricsServer(port=args.metrics_port).start().stop)
+		if args.metrics_interval > 0:
+			stack.callback(MetricsReporter(interval=args.metrics_interval).start().stop)
+
+		panel = None
+		if args.fake:
+			from light_simulator import SimulatedLightSlave
+			from modem_simulator import ScriptedModem
+			from plc_simulator import PLCSimulator
+
+			plc = stack.enter_context(PLCSimulator({0: 850, 1: 25}))
+			args.ln2_host, args.ln2_port = plc.host, plc.port
+			args.light_port = stack.enter_context(SimulatedLightSlave()).port
+			modem = stack.enter_context(ScriptedModem(response_delay=0.005, send_delay=0.05))
+			args.gsm_port = modem.port
+			phones = phones or ["17712689742"]
+			panel = FakePanel(slow_every=7, slow_latency=args.panel_interval * 2.5)
+			read_panel = panel.read
+		else:
+			import read_Lbar5
+
+			molly = read_Lbar5.MollyAttachment()
+			stack.callback(molly.close)
+
+			def read_panel() -> Readings:
+				# pywinauto 的连接在该数据源的执行器线程中建立，Molly 重启或窗口失效时下一次自动重新连接
+				readings = read_Lbar5.analyze_frame(molly.capture())
+				readings.update(molly.sample())  # Molly 进程自身的 CPU / 内存，一起存储和报警
+				return readings
+
+		ln2 = LN2SeparatorReader(args.ln2_host, args.ln2_port)
+		stack.callback(ln2.disconnect_LN2)
+
+		light = None
+		if args.light_port:
+			from debug_light_rod import TrafficLightController
+
+			light = TrafficLightController(args.light_port, 9600)
+			if light.connect_serial():
+				stack.callback(light.disconnect_serial)
+			else:
+				light = None
+
+		dispatcher = None
+		if args.gsm_port and phones:
+			from debug_gsm_send import GSMController
+			from sms_dispatcher import SMSDispatcher
+
+			gsm = GSMController(args.gsm_port, 115200)
+			if gsm.connect_gsm():
+				stack.callback(gsm.disconnect_gsm)
+				dispatcher = SMSDispatcher(gsm, min_interval=0.2 if args.fake else 3.0).start()
+				stack.callback(dispatcher.stop)
+
+		sinks: List[Callable[[SourceResult], None]] = []
+		if args.store:
+			from timeseries_store import TimeSeriesStore
+
+			store = TimeSeriesStore(args.store)
+			stack.callback(store.close)
+			sinks.append(StoreSink(store))
+		if args.sample_log:
+			sinks.append(SampleLogSink())
+		from alarm_rules import AlarmRule, RuleEngine
+
+		engine = RuleEngine([
+			AlarmRule("液氮液位低", "ln2.液位", low=args.min_level, hysteresis=args.min_level * 0.05),
+			AlarmRule("液氮压力高", "ln2.压力", high=args.max_pressure, hysteresis=args.max_pressure * 0.05),
+			AlarmRule("真空度高", "panel.vacuum", high=args.max_vacuum, raise_after=2),
+			# 液位下降过快 (泄漏)，看 30 秒窗口的变化率
+			AlarmRule("液氮液位下降过快", "ln2.液位", low=-args.max_level_drop, feature="rate", window=30),
+		])
+		alarms = AlarmSink(engine, light=light, dispatcher=dispatcher, phones=phones)
+		sinks.append(alarms)
+
+		daemon = InspectionDaemon([
+			SourceSpec("panel", read_panel, args.panel_interval),
+			SourceSpec("ln2", ln2.read_current_data, args.ln2_interval, deadline=args.ln2_interval * 0.8),
+		], sinks, report_interval=args.report_interval)
+
+		async def scenario():
+			# --fake: 运行中途液位跌破下限，之后恢复，观察三色灯和短信
+			third = args.duration / 3
+			await asyncio.sleep(third)
+			plc.set_registers(0, [120])
+			await asyncio.sleep(third)
+			plc.set_registers(0, [850])
+
+		async def run():
+			tasks = [asyncio.create_task(daemon.run(args.duration or None))]
+			if args.fake and args.duration:
+				tasks.append(asyncio.create_task(scenario()))
+			await asyncio.gather(*tasks)
+
+		try:
+			asyncio.run(run())
+		except KeyboardInterrupt:
+			pass
+		finally:
+			if dispatcher is not None:
+				dispatcher.join(10)
+
+		print("\n" + "=" * 20 + " 守护进程统计 " + "=" * 20)
+		for name, s in daemon.stats().items():
+			print(f"  {name}: {s}")
+		print(f"  输出: 丢弃 {daemon.dropped}, sink 错误 {daemon.sink_errors}, 当前报警 {alarms.active or '无'}")
+		if dispatcher is not None:
+			print(f"  短信: {dispatcher.stats()}")
+		if log_pipeline is not None:
+			print(f"  日志队列: {log_pipeline.stats()}")
+		if args.fake:
+			print(f"  三色灯最终状态: {light.driver.state if light is not None else '未连接'}")
+			print(f"  模拟 GSM 模块收到短信 {len(modem.sent_pdus)} 条")
+
+
+if __name__ == "__main__":
+	main()
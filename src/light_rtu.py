@@ -0,0 +1,254 @@
+# light_rtu.py
+
+"""
+三色报警灯 (Modbus RTU, 功能码 05 写单个线圈) 驱动。
+
+原 TrafficLightController 只会发送 COMMANDS 里写死的几条十六进制帧，每次切换状态都先发
+all_off 再 time.sleep(0.1)，也从不读取设备的应答；完整的线圈 / 闪烁频率表只以字符串常量的
+形式存在于 three_color_light_demo.py 中。这里:
+
+- build_write_coil() 按 "从站地址 + 05 + 线圈地址 + 值 + CRC16" 生成任意线圈、任意模式的帧，
+  CRC16 (Modbus, 多项式 0xA001) 用 256 项查表计算；
+- TrafficLightDriver 记录每个通道当前的模式，apply() 只发送到达目标状态所需的帧
+  (全部关闭再逐个打开更省帧时才使用 all_off)，状态未变化时一帧都不发；
+- 每帧都等待设备应答 (功能码 05 的正常应答是请求原样回显) 并校验，超时或异常应答时
+  重试，仍失败则把状态置为未知，下一次 apply() 会完整地重新下发，不依赖盲等。
+"""
+
+import argparse
+import time
+from typing import Dict, List, Optional, Tuple
+
+from serial_port_manager import PRIORITY_HIGH, ManagedPort
+from tools import LoggerMixin
+
+CHANNELS = {"red": 0x0000, "yellow": 0x0001, "green": 0x0002, "buzzer": 0x0003}
+MODES = {
+	"off": 0x0000,
+	"on": 0xFF00,
+	"flash_2hz": 0xF000,
+	"flash_1hz": 0xF100,
+	"flash_0.5hz": 0xF200,
+	"flash_0.25hz": 0xF300,
+}
+ALL_ON_ADDRESS = 0x00FF  # 写 FF00 打开全部通道
+ALL_OFF_ADDRESS = 0x00EF  # 写 FF00 关闭全部通道
+
+WRITE_COIL = 0x05
+FRAME_LENGTH = 8  # 请求和正常应答都是 8 字节
+EXCEPTION_LENGTH = 5
+
+
+def _build_crc_table() -> List[int]:
+	table = []
+	for byte in range(256):
+		crc = byte
+		for _ in range(8):
+			crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+		table.append(crc)
+	return table
+
+
+_CRC_TABLE = _build_crc_table()
+
+
+def crc16(data: bytes) -> int:
+	"""Modbus RTU CRC16 (初值 0xFFFF)，查表实现"""
+	crc = 0xFFFF
+	for byte in data:
+		crc = (crc >> 8) ^ _CRC_TABLE[(crc ^ byte) & 0xFF]
+	return crc
+
+
+def with_crc(body: bytes) -> bytes:
+	"""追加 CRC (低字节在前)"""
+	return body + crc16(body).to_bytes(2, "little")
+
+
+def check_crc(frame: bytes) -> bool:
+	return len(frame) >= 4 and crc16(frame[:-2]) == int.from_bytes(frame[-2:], "little")
+
+
+def build_write_coil(slave: int, address: int, value: int) -> bytes:
+	return with_crc(bytes([slave, WRITE_COIL]) + address.to_bytes(2, "big") + value.to_bytes(2, "big"))
+
+
+def parse_write_coil(frame: bytes) -> Optional[Tuple[int, int, int]]:
+	"""解析写单个线圈帧，返回 (从站地址, 线圈地址, 值)；长度、功能码或 CRC 不对时返回 None"""
+	if len(frame) != FRAME_LENGTH or frame[1] != WRITE_COIL or not check_crc(frame):
+		return None
+	return frame[0], int.from_bytes(frame[2:4], "big"), int.from_bytes(frame[4:6], "big")
+
+
+class LightRTUError(Exception):
+	pass
+
+
+class TrafficLightDriver(LoggerMixin):
+	"""
+	serial_conn 只需提供 write / read / reset_input_buffer 和可写的 timeout 属性 (serial.Serial)，
+	也可以是 serial_port_manager.ManagedPort (按 priority 排队)。
+	"""
+
+	def __init__(self, serial_conn, slave: int = 1, reply_timeout: float = 0.2, retries: int = 1,
+				 priority: int = PRIORITY_HIGH):
+		self.serial_conn = serial_conn
+		self.priority = priority
+		self.slave = slave
+		self.reply_timeout = reply_timeout
+		self.retries = retries
+		self.state: Optional[Dict[str, str]] = None  # None 表示设备状态未知
+		self.frames_sent = 0
+		self.reply_failures = 0
+
+	# --- 帧 ---
+
+	def frame(self, channel: str, mode: str) -> bytes:
+		if channel not in CHANNELS:
+			raise LightRTUError(f"未知通道: {channel}")
+		if mode not in MODES:
+			raise LightRTUError(f"未知模式: {mode}")
+		return build_write_coil(self.slave, CHANNELS[channel], MODES[mode])
+
+	def all_off_frame(self) -> bytes:
+		return build_write_coil(self.slave, ALL_OFF_ADDRESS, MODES["on"])
+
+	def all_on_frame(self) -> bytes:
+		return build_write_coil(self.slave, ALL_ON_ADDRESS, MODES["on"])
+
+	def _read_reply(self, conn) -> bytes:
+		conn.timeout = self.reply_timeout
+		head = conn.read(2)
+		if len(head) < 2:
+			return head
+		# 异常应答: 功能码最高位置 1，总长 5 字节
+		remaining = (EXCEPTION_LENGTH if head[1] & 0x80 else FRAME_LENGTH) - 2
+		return head + conn.read(remaining)
+
+	def transact(self, frame: bytes) -> bool:
+		"""发送一帧并校验应答 (写单个线圈的正常应答与请求完全相同)"""
+		if isinstance(self.serial_conn, ManagedPort):
+			# 共享串口: 整个 "写入-等待应答-重试" 作为一个事务在端口的所有者线程上执行
+			return self.serial_conn.call(lambda conn: self._transact_on(conn, frame), self.priority)
+		return self._transact_on(self.serial_conn, frame)
+
+	def _transact_on(self, conn, frame: bytes) -> bool:
+		for attempt in range(self.retries + 1):
+			conn.reset_input_buffer()  # 丢掉之前超时后迟到的应答
+			conn.write(frame)
+			self.frames_sent += 1
+			reply = self._read_reply(conn)
+			if reply == frame:
+				return True
+			self.reply_failures += 1
+			if len(reply) == EXCEPTION_LENGTH and reply[1] & 0x80 and check_crc(reply):
+				self.logger.error(f"三色灯返回异常应答: 指令 {frame.hex(' ')}, 异常码 {reply[2]:02X}")
+				return False  # 设备明确拒绝，重试无意义
+			self.logger.warning(f"三色灯应答无效 (第 {attempt + 1} 次): 指令 {frame.hex(' ')}, "
+								f"应答 {reply.hex(' ') if reply else '超时'}")
+		return False
+
+	# --- 状态 ---
+
+	def plan(self, target: Dict[str, str]) -> List[bytes]:
+		"""计算从当前状态到 target 需要发送的帧；target 中未列出的通道视为 off"""
+		full = {channel: target.get(channel, "off") for channel in CHANNELS}
+		for channel, mode in full.items():
+			if mode not in MODES:
+				raise LightRTUError(f"未知模式: {channel}={mode}")
+		unknown = [channel for channel in target if channel not in CHANNELS]
+		if unknown:
+			raise LightRTUError(f"未知通道: {unknown}")
+
+		lit = [(channel, mode) for channel, mode in full.items() if mode != "off"]
+		via_all_off = [self.all_off_frame()] + [self.frame(channel, mode) for channel, mode in lit]
+		if self.state is None:
+			changed = list(full.items())
+		else:
+			changed = [(channel, mode) for channel, mode in full.items() if self.state.get(channel) != mode]
+		direct = [self.frame(channel, mode) for channel, mode in changed]
+		return direct if len(direct) <= len(via_all_off) else via_all_off
+
+	def apply(self, target: Dict[str, str]) -> bool:
+		frames = self.plan(target)
+		for frame in frames:
+			if not self.transact(frame):
+				self.state = None  # 设备实际状态不确定，下次完整下发
+				return False
+		self.state = {channel: target.get(channel, "off") for channel in CHANNELS}
+		if frames:
+			self.logger.debug(f"三色灯状态: {self.state} ({len(frames)} 帧)")
+		return True
+
+	def invalidate(self) -> None:
+		"""设备断电或被其它程序改动后调用"""
+		self.state = None
+
+
+# --- 基准测试 / 故障测试：模拟 RTU 从站 (pty) ---
+
+def main():
+	parser = argparse.ArgumentParser(description="原三色灯控制 (all_off + sleep, 不读应答) vs 状态差分驱动 (需要 pty)")
+	parser.add_argument("--cycles", type=int, default=20, help="状态切换次数")
+	parser.add_argument("--baudrate", type=int, default=9600, help="模拟线路波特率")
+	args = parser.parse_args()
+
+	import logging
+
+	import serial
+
+	from light_simulator import SimulatedLightSlave
+
+	logging.getLogger(TrafficLightDriver.__name__).setLevel(logging.ERROR)
+	normal = {"green": "on"}
+	alarm = {"red": "flash_1hz", "buzzer": "flash_1hz"}
+	# 轮询循环里每个周期都会 "设置" 一次状态，大多数周期状态并没有变化
+	sequence = [alarm if (i // 5) % 2 else normal for i in range(args.cycles)]
+	if sequence[-1] is alarm:
+		sequence.append(normal)
+
+	with SimulatedLightSlave(baudrate=args.baudrate) as slave:
+		conn = serial.Serial(slave.port, args.baudrate, timeout=1)
+		start_time = time.perf_counter()
+		for target in sequence:
+			conn.write(build_write_coil(1, ALL_OFF_ADDRESS, MODES["on"]))
+			time.sleep(0.1)
+			for channel, mode in target.items():
+				conn.write(build_write_coil(1, CHANNELS[channel], MODES[mode]))
+		legacy = time.perf_counter() - start_time
+		time.sleep(0.2)  # 等从站处理完缓冲区里剩余的帧
+		legacy_frames = slave.frames
+		conn.close()
+		print(f"原实现:   {legacy_frames:3d} 帧, {legacy:.2f} s, 未读取应答")
+
+	with SimulatedLightSlave(baudrate=args.baudrate) as slave:
+		conn = serial.Serial(slave.port, args.baudrate, timeout=1)
+		driver = TrafficLightDriver(conn)
+		start_time = time.perf_counter()
+		ok = all(driver.apply(target) for target in sequence)
+		elapsed = time.perf_counter() - start_time
+		matches = slave.lamp_state() == {c: sequence[-1].get(c, "off") for c in CHANNELS}
+		print(f"差分驱动: {slave.frames:3d} 帧, {elapsed:.2f} s, 全部应答校验{'通过' if ok else '失败'}, "
+			  f"从站最终状态{'一致' if matches else '不一致'}")
+		assert ok and matches, "差分驱动的应答校验失败或从站最终状态不一致"
+
+		# 故障: 从站丢一次应答 -> 重试成功；连续丢应答 -> apply 失败、状态置为未知、恢复后完整下发
+		slave.drop_replies = 1
+		ok_retry = driver.apply(alarm)
+		slave.drop_replies = 10
+		ok_fail = driver.apply(normal)
+		unknown = driver.state is None
+		slave.drop_replies = 0
+		time.sleep(0.2)
+		frames_before = slave.frames
+		ok_recover = driver.apply(normal)
+		print(f"丢一次应答: {'成功' if ok_retry else '失败'} | 持续无应答: {'成功' if ok_fail else '失败'} "
+			  f"(状态未知: {unknown}) | 恢复后: {'成功' if ok_recover else '失败'}, "
+			  f"重新下发 {slave.frames - frames_before} 帧, 状态 {slave.lamp_state()}")
+		assert ok_retry and not ok_fail and unknown and ok_recover, "故障场景的重试/恢复结果不符合预期"
+		assert slave.lamp_state() == {c: normal.get(c, "off") for c in CHANNELS}, "恢复后从站状态不一致"
+		conn.close()
+
+
+if __name__ == "__main__":
+	main()
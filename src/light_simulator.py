@@ -0,0 +1,113 @@
+# light_simulator.py
+
+"""
+模拟的三色灯 Modbus RTU 从站，挂在一对伪终端 (pty) 的主端上，被测代码像打开真实串口一样
+打开从端 (serial.Serial(slave.port))。只能在 Linux / macOS 上使用 (依赖 os.openpty)。
+
+只实现功能码 05 (写单个线圈): 线圈 0-3 对应红/黄/绿/蜂鸣器，00EF / 00FF 为全关 / 全开。
+CRC 错误的数据按字节滑动重新对齐，未知地址或值返回异常应答 (非法数据地址 / 非法数据值)。
+按 baudrate 模拟请求和应答在线路上的传输时间；drop_replies 可以让从站 "吞掉" 接下来若干个应答。
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from light_rtu import (ALL_OFF_ADDRESS, ALL_ON_ADDRESS, CHANNELS, FRAME_LENGTH, MODES, WRITE_COIL, check_crc,
+					   parse_write_coil, with_crc)
+from tools import LoggerMixin
+
+_MODE_NAMES = {value: name for name, value in MODES.items()}
+_CHANNEL_NAMES = {address: name for name, address in CHANNELS.items()}
+
+
+class SimulatedLightSlave(LoggerMixin):
+
+	def __init__(self, slave: int = 1, baudrate: int = 9600, response_delay: float = 0.002):
+		self.slave = slave
+		self.baudrate = baudrate
+		self.response_delay = response_delay  # 从站处理一帧的耗时
+		self.coils: Dict[int, int] = {address: 0 for address in CHANNELS.values()}
+		self.frames = 0  # 收到的有效帧数
+		self.crc_errors = 0
+		self.drop_replies = 0
+
+		self._master, self._slave = os.openpty()
+		self.port = os.ttyname(self._slave)
+		self._running = False
+		self._thread: Optional[threading.Thread] = None
+		import tty
+
+		tty.setraw(self._slave)
+
+	def start(self) -> "SimulatedLightSlave":
+		self._running = True
+		self._thread = threading.Thread(target=self._run, name="SimulatedLightSlave", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		self._running = False
+		for fd in (self._master, self._slave):
+			try:
+				os.close(fd)
+			except OSError:
+				pass
+		if self._thread is not None:
+			self._thread.join(2)
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.stop()
+
+	def lamp_state(self) -> Dict[str, str]:
+		return {_CHANNEL_NAMES[address]: _MODE_NAMES.get(value, f"{value:04X}") for address, value in self.coils.items()}
+
+	def _wire_time(self, length: int) -> float:
+		return length * 10 / self.baudrate  # 8N1: 每字节 10 位
+
+	def _handle(self, frame: bytes) -> bytes:
+		_, address, value = parse_write_coil(frame)
+		if value not in _MODE_NAMES:
+			return with_crc(bytes([self.slave, WRITE_COIL | 0x80, 0x03]))
+		if address == ALL_OFF_ADDRESS and value == MODES["on"]:
+			self.coils = {a: MODES["off"] for a in self.coils}
+		elif address == ALL_ON_ADDRESS and value == MODES["on"]:
+			self.coils = {a: MODES["on"] for a in self.coils}
+		elif address in self.coils:
+			self.coils[address] = value
+		else:
+			return with_crc(bytes([self.slave, WRITE_COIL | 0x80, 0x02]))
+		return frame
+
+	def _run(self) -> None:
+		buffer = bytearray()
+		while self._running:
+			try:
+				data = os.read(self._master, 256)
+			except OSError:
+				break
+			if not data:
+				break
+			buffer += data
+			while len(buffer) >= FRAME_LENGTH:
+				candidate = bytes(buffer[:FRAME_LENGTH])
+				if candidate[0] != self.slave or candidate[1] != WRITE_COIL or not check_crc(candidate):
+					self.crc_errors += 1
+					del buffer[0]
+					continue
+				del buffer[:FRAME_LENGTH]
+				self.frames += 1
+				time.sleep(self._wire_time(FRAME_LENGTH) + self.response_delay)
+				reply = self._handle(candidate)
+				if self.drop_replies > 0:
+					self.drop_replies -= 1
+					continue
+				time.sleep(self._wire_time(len(reply)))
+				try:
+					os.write(self._master, reply)
+				except OSError:
+					return
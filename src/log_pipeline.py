@@ -0,0 +1,250 @@
+# log_pipeline.py
+
+"""
+非阻塞日志管线。
+
+tools.setup_logger 原来把 RotatingFileHandler 和 StreamHandler 直接挂在根日志器上:
+写文件、写控制台 (Windows 控制台尤其慢) 和日志轮转都发生在调用 logger.info() 的线程里，
+轮询循环里每条日志都要等这些 I/O 完成。这里改为:
+
+- 生产者一侧只有 BoundedQueueHandler: 在调用线程上合并 msg % args (参数可能随后被修改)，
+  然后放入有界队列，格式化和写入都由后台的 QueueListener 线程完成；
+- 队列满时按 overflow 策略处理: "drop_new" 丢弃新记录 (默认，调用方永不阻塞)、
+  "drop_oldest" 丢弃队列中最旧的记录、"block" 最多等待 block_timeout 秒；丢弃条数计入 stats()，
+  WARNING 及以上级别的记录在 drop_new 下会挤掉一条最旧的记录而不是被丢弃；
+- 可选的采样日志 (JSON lines): log_sample(数据源, 时间戳, 读数) 每次巡检写一行紧凑的 JSON，
+  经同一个队列写到单独的文件，不进入普通日志。
+"""
+
+import argparse
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+OVERFLOW_POLICIES = ("drop_new", "drop_oldest", "block")
+SAMPLE_LOGGER = "samples"
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+	"""放入有界队列的 QueueHandler，队列满时按 overflow 策略处理"""
+
+	def __init__(self, log_queue: queue.Queue, overflow: str = "drop_new", block_timeout: float = 0.05):
+		if overflow not in OVERFLOW_POLICIES:
+			raise ValueError(f"未知的溢出策略: {overflow} (可选: {OVERFLOW_POLICIES})")
+		super().__init__(log_queue)
+		self.overflow = overflow
+		self.block_timeout = block_timeout
+		self.dropped = 0
+		self.max_depth = 0
+
+	def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+		# 记录只在进程内传递，不需要基类那样先完整格式化一遍再清掉 exc_info:
+		# 调用线程上只合并 msg % args，异常堆栈留给监听线程上的 Formatter 格式化
+		record = logging.makeLogRecord(record.__dict__)
+		record.msg = record.getMessage()
+		record.args = None
+		return record
+
+	def enqueue(self, record: logging.LogRecord) -> None:
+		try:
+			if self.overflow == "block":
+				self.queue.put(record, timeout=self.block_timeout)
+			else:
+				self.queue.put_nowait(record)
+		except queue.Full:
+			if self.overflow == "drop_new" and record.levelno < logging.WARNING:
+				self.dropped += 1
+				return
+			# drop_oldest，或者重要的记录: 挤掉一条最旧的再放入
+			try:
+				self.queue.get_nowait()
+				self.dropped += 1
+			except queue.Empty:
+				pass
+			try:
+				self.queue.put_nowait(record)
+			except queue.Full:
+				self.dropped += 1  # 其它线程抢先填满了队列
+				return
+		depth = self.queue.qsize()
+		if depth > self.max_depth:
+			self.max_depth = depth
+
+
+class SampleFormatter(logging.Formatter):
+	"""采样日志: {"t": 时间戳, "src": 数据源, 读数名: 读数, ...}，读数来自 record.sample"""
+
+	def format(self, record: logging.LogRecord) -> str:
+		sample = getattr(record, "sample", None)
+		if sample is None:
+			return json.dumps({"t": round(record.created, 3), "msg": record.getMessage()}, ensure_ascii=False,
+							  separators=(",", ":"))
+		return json.dumps(sample, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def log_sample(source: str, ts: float, readings: Mapping[str, Any]) -> None:
+	"""写一行采样日志；没有配置采样日志 (setup_logger(sample_log=None)) 时什么也不做"""
+	logger = logging.getLogger(SAMPLE_LOGGER)
+	if logger.isEnabledFor(logging.INFO):
+		logger.info("", extra={"sample": {"t": round(ts, 3), "src": source, **readings}})
+
+
+class _Listener(logging.handlers.QueueListener):
+
+	def enqueue_sentinel(self) -> None:
+		# 基类用 put_nowait，有界队列满时停止会抛 queue.Full；这里等监听线程腾出位置
+		self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+	"""根日志器上的 BoundedQueueHandler + 后台 QueueListener，handlers 在监听线程上执行"""
+
+	def __init__(self, handlers: Sequence[logging.Handler], queue_size: int = 10000, overflow: str = "drop_new",
+				 block_timeout: float = 0.05):
+		self.queue: queue.Queue = queue.Queue(queue_size)
+		self.handler = BoundedQueueHandler(self.queue, overflow, block_timeout)
+		self.handlers = list(handlers)
+		self.listener = _Listener(self.queue, *self.handlers, respect_handler_level=True)
+		self._started = False
+		self._lock = threading.Lock()
+
+	def start(self) -> "LogPipeline":
+		with self._lock:
+			if not self._started:
+				self.listener.start()
+				self._started = True
+		return self
+
+	def stop(self) -> None:
+		"""写完队列里剩余的记录后停止监听线程 (程序退出时由 atexit 调用)"""
+		with self._lock:
+			if not self._started:
+				return
+			self._started = False
+			self.listener.stop()
+		for handler in self.handlers:
+			try:
+				handler.flush()
+			except Exception:
+				pass
+
+	def stats(self) -> Dict[str, float]:
+		return {
+			"queue_depth": self.queue.qsize(),
+			"max_depth": self.handler.max_depth,
+			"dropped": self.handler.dropped,
+		}
+
+
+# --- 基准测试：轮询线程一侧的日志调用耗时 ---
+
+class _SlowStream:
+	"""模拟慢速控制台: 每次 write 耗时 delay 秒"""
+
+	def __init__(self, delay: float):
+		self.delay = delay
+		self.writes = 0
+
+	def write(self, text: str) -> None:
+		self.writes += 1
+		if self.delay:
+			time.sleep(self.delay)
+
+	def flush(self) -> None:
+		pass
+
+
+def main():
+	parser = argparse.ArgumentParser(description="同步日志 vs 队列日志: 调用方一侧的日志耗时")
+	parser.add_argument("--threads", type=int, default=4, help="并发记录日志的轮询线程数")
+	parser.add_argument("--messages", type=int, default=5000, help="每个线程记录的日志条数")
+	parser.add_argument("--console-delay", type=float, default=0.0002, help="模拟控制台每次写入的耗时 (秒)")
+	parser.add_argument("--max-bytes", type=int, default=256 * 1024, help="日志文件轮转大小 (字节)，调小以触发频繁轮转")
+	parser.add_argument("--queue-size", type=int, default=10000)
+	args = parser.parse_args()
+
+	import os
+	import tempfile
+
+	from stage_benchmark import latency_summary
+
+	formatter = logging.Formatter(fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+								  datefmt='%Y-%m-%d %H:%M:%S')
+
+	def make_handlers(directory: str):
+		file_handler = logging.handlers.RotatingFileHandler(os.path.join(directory, "bench.log"),
+															maxBytes=args.max_bytes, backupCount=2, encoding='utf-8')
+		console = _SlowStream(args.console_delay)
+		console_handler = logging.StreamHandler(console)
+		for handler in (file_handler, console_handler):
+			handler.setFormatter(formatter)
+		return [file_handler, console_handler], console
+
+	def run(logger: logging.Logger):
+		latencies = [[] for _ in range(args.threads)]
+
+		def worker(index: int):
+			samples = latencies[index]
+			readings = {"vacuum": "1.2E-5 Pa", "temp": 12.5}
+			for i in range(args.messages):
+				start = time.perf_counter()
+				logger.info("第 %d 次读取: %s", i, readings)
+				samples.append(time.perf_counter() - start)
+				if i % 100 == 0:
+					time.sleep(0.001)  # 轮询间隔
+
+		threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+		start_time = time.perf_counter()
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		elapsed = time.perf_counter() - start_time
+		return latency_summary([s for samples in latencies for s in samples]), elapsed
+
+	def report(label: str, summary: Dict[str, float], elapsed: float, extra: str = "") -> None:
+		print(f"{label:18s} p50 {summary['p50_ms'] * 1000:7.1f} us, p99 {summary['p99_ms'] * 1000:8.1f} us, "
+			  f"max {summary['max_ms']:7.2f} ms, 调用方总耗时 {elapsed:.2f} s{extra}")
+
+	total = args.threads * args.messages
+	print(f"{args.threads} 个线程 x {args.messages} 条日志，文件每 {args.max_bytes // 1024} KB 轮转，"
+		  f"控制台每次写入 {args.console_delay * 1e6:.0f} us")
+
+	with tempfile.TemporaryDirectory() as directory:
+		handlers, console = make_handlers(directory)
+		logger = logging.getLogger("bench.sync")
+		logger.propagate = False
+		logger.setLevel(logging.INFO)
+		for handler in handlers:
+			logger.addHandler(handler)
+		summary, elapsed = run(logger)
+		for handler in handlers:
+			handler.close()
+		report("同步 (原实现)", summary, elapsed, f", 写出 {console.writes}/{total}")
+
+	for overflow in OVERFLOW_POLICIES:
+		with tempfile.TemporaryDirectory() as directory:
+			handlers, console = make_handlers(directory)
+			pipeline = LogPipeline(handlers, args.queue_size, overflow).start()
+			logger = logging.getLogger(f"bench.{overflow}")
+			logger.propagate = False
+			logger.setLevel(logging.INFO)
+			logger.addHandler(pipeline.handler)
+			summary, elapsed = run(logger)
+			stats = pipeline.stats()
+			drain_start = time.perf_counter()
+			pipeline.stop()
+			drain = time.perf_counter() - drain_start
+			for handler in handlers:
+				handler.close()
+			report(f"队列 ({overflow})", summary, elapsed,
+				   f", 写出 {console.writes}/{total}, 丢弃 {stats['dropped']}, 最大队列深度 {stats['max_depth']}, "
+				   f"退出时排空 {drain:.2f} s")
+
+
+if __name__ == "__main__":
+	main()
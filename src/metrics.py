@@ -0,0 +1,513 @@
+# metrics.py
+
+"""
+热路径指标: 计数器、计时器和固定分桶直方图，用来看清一次巡检的时间花在哪里
+(GUI 连接、截图、裁剪/预处理、OCR、Modbus 读取、AT 指令)。
+
+- 每个线程有自己的分片 (threading.local)，inc() / observe() 只修改本线程分片里的列表，
+  不加锁；导出时把全部分片的值加起来 (读取端只读，线程退出后分片保留，计数器保持单调)；
+- 直方图使用固定分桶 (bisect 定位)，与 Prometheus 的 histogram 一致，桶边界单位为秒；
+- MetricsServer 在 localhost 上以 Prometheus 文本格式提供 /metrics；
+  MetricsReporter 定期写一行摘要日志 (与上一行相比的增量: 次数、平均值、p95 估计)；
+- LoggerMixin 的使用者用 with self.timed("at_command"): ... 记录到
+  stage_seconds{component=类名, stage=阶段}；模块级的阶段 (read_Lbar5) 用 stage_timer()。
+"""
+
+import argparse
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class _Timing:
+	__slots__ = ("histogram", "start")
+
+	def __init__(self, histogram: "Histogram"):
+		self.histogram = histogram
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Counter:
+	__slots__ = ("_id", "_registry", "_local")
+
+	def __init__(self, registry: "MetricsRegistry", metric_id: int):
+		self._registry = registry
+		self._local = registry._local
+		self._id = metric_id
+
+	def inc(self, amount: float = 1.0) -> None:
+		try:
+			shard = self._local.shard
+		except AttributeError:
+			shard = self._registry._new_shard()
+		cell = shard.get(self._id)
+		if cell is None:
+			cell = shard[self._id] = [0.0]
+		cell[0] += amount
+
+
+class Histogram:
+	"""分片中的值: [各桶计数 (最后一个是 +Inf), 总和]，桶计数不累加，导出时才转成累计值"""
+	__slots__ = ("_id", "_registry", "_local", "_bounds", "_size")
+
+	def __init__(self, registry: "MetricsRegistry", metric_id: int, bounds: Sequence[float]):
+		self._registry = registry
+		self._local = registry._local
+		self._id = metric_id
+		self._bounds = tuple(bounds)
+		self._size = len(self._bounds) + 2
+
+	def observe(self, value: float) -> None:
+		try:
+			shard = self._local.shard
+		except AttributeError:
+			shard = self._registry._new_shard()
+		cell = shard.get(self._id)
+		if cell is None:
+			cell = shard[self._id] = [0] * (self._size - 1) + [0.0]
+		cell[bisect.bisect_left(self._bounds, value)] += 1
+		cell[-1] += value
+
+	def time(self) -> _Timing:
+		"""with histogram.time(): ... 记录代码块的耗时 (秒)"""
+		return _Timing(self)
+
+
+class Gauge:
+	"""当前值 (队列深度、缓存条目数等)，不分片: set() 是一次属性赋值；也可以给一个读取函数"""
+	__slots__ = ("value", "function")
+
+	def __init__(self):
+		self.value = 0.0
+		self.function: Optional[Callable[[], float]] = None
+
+	def set(self, value: float) -> None:
+		self.value = value
+
+	def set_function(self, function: Callable[[], float]) -> None:
+		self.function = function
+
+	def get(self) -> float:
+		return float(self.function()) if self.function is not None else self.value
+
+
+class MetricFamily:
+	"""带标签的一组指标: family.labels(stage="ocr") 返回对应的 Counter / Histogram / Gauge"""
+
+	def __init__(self, registry: "MetricsRegistry", kind: str, name: str, help_text: str,
+				 labelnames: Sequence[str], buckets: Sequence[float]):
+		self.registry = registry
+		self.kind = kind
+		self.name = name
+		self.help = help_text
+		self.labelnames = tuple(labelnames)
+		self.buckets = tuple(buckets)
+		self.children: Dict[LabelValues, object] = {}
+
+	def labels(self, *values: str, **kwargs: str):
+		if kwargs:
+			values = tuple(str(kwargs[name]) for name in self.labelnames)
+		key = tuple(values)
+		child = self.children.get(key)
+		if child is None:
+			if len(key) != len(self.labelnames):
+				raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际为 {key}")
+			child = self.registry._new_child(self, key)
+		return child
+
+
+class MetricsRegistry:
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._local = threading.local()
+		self._shards: List[Dict[int, list]] = []
+		self._families: Dict[str, MetricFamily] = {}
+		self._children: Dict[int, Tuple[MetricFamily, LabelValues]] = {}  # 指标 id -> (所属的组, 标签值)
+		self._gauges: List[Tuple[MetricFamily, LabelValues, Gauge]] = []
+
+	# --- 注册 ---
+
+	def _family(self, kind: str, name: str, help_text: str, labelnames: Sequence[str],
+				buckets: Sequence[float] = ()) -> MetricFamily:
+		with self._lock:
+			family = self._families.get(name)
+			if family is None:
+				family = self._families[name] = MetricFamily(self, kind, name, help_text, labelnames, buckets)
+			elif family.kind != kind or family.labelnames != tuple(labelnames):
+				raise ValueError(f"指标 {name} 已注册为 {family.kind} {family.labelnames}")
+			return family
+
+	def _new_child(self, family: MetricFamily, key: LabelValues):
+		with self._lock:
+			child = family.children.get(key)
+			if child is not None:
+				return child
+			metric_id = len(self._children)
+			if family.kind == "counter":
+				child = Counter(self, metric_id)
+			elif family.kind == "histogram":
+				child = Histogram(self, metric_id, family.buckets)
+			else:
+				child = Gauge()
+				self._gauges.append((family, key, child))
+			self._children[metric_id] = (family, key)
+			family.children[key] = child
+			return child
+
+	def _new_shard(self) -> Dict[int, list]:
+		shard = self._local.shard = {}
+		with self._lock:
+			self._shards.append(shard)
+		return shard
+
+	def counter(self, name: str, help_text: str = "", labelnames: Sequence[str] = ()):
+		"""没有标签时直接返回 Counter，否则返回 MetricFamily (用 labels() 取得 Counter)；重复注册返回同一个指标"""
+		family = self._family("counter", name, help_text, labelnames)
+		return family.labels() if not labelnames else family
+
+	def histogram(self, name: str, help_text: str = "", labelnames: Sequence[str] = (),
+				  buckets: Sequence[float] = DEFAULT_BUCKETS):
+		family = self._family("histogram", name, help_text, labelnames, sorted(buckets))
+		return family.labels() if not labelnames else family
+
+	def gauge(self, name: str, help_text: str = "", labelnames: Sequence[str] = ()):
+		family = self._family("gauge", name, help_text, labelnames)
+		return family.labels() if not labelnames else family
+
+	# --- 导出 ---
+
+	def collect(self) -> Dict[Tuple[str, LabelValues], list]:
+		"""把全部线程分片加起来: {(指标名, 标签值): 值}，计数器为 [总数]，直方图为 [各桶计数..., 总和]"""
+		with self._lock:
+			shards = list(self._shards)
+			children = dict(self._children)
+			gauges = list(self._gauges)
+		totals: Dict[int, list] = {}
+		for shard in shards:
+			for metric_id, cell in list(shard.items()):
+				total = totals.get(metric_id)
+				if total is None:
+					totals[metric_id] = list(cell)
+				else:
+					for i, value in enumerate(cell):
+						total[i] += value
+		result = {}
+		for metric_id, values in totals.items():
+			family, key = children[metric_id]
+			result[(family.name, key)] = values
+		for family, key, gauge in gauges:
+			try:
+				result[(family.name, key)] = [gauge.get()]
+			except Exception:
+				pass  # 读取函数出错时不导出该值
+		return result
+
+	def families(self) -> List[MetricFamily]:
+		with self._lock:
+			return list(self._families.values())
+
+	def render(self) -> str:
+		"""Prometheus 文本格式 (text/plain; version=0.0.4)"""
+		values = self.collect()
+		lines = []
+		for family in self.families():
+			lines.append(f"# HELP {family.name} {family.help or family.name}")
+			lines.append(f"# TYPE {family.name} {family.kind}")
+			for key in list(family.children):
+				value = values.get((family.name, key))
+				labels = list(zip(family.labelnames, key))
+				if family.kind != "histogram":
+					lines.append(f"{family.name}{_format_labels(labels)} {_format_value(value[0] if value else 0)}")
+					continue
+				if value is None:
+					value = [0] * (len(family.buckets) + 1) + [0.0]
+				cumulative = 0
+				for bound, count in zip(family.buckets + (float("inf"),), value[:-1]):
+					cumulative += count
+					le = "+Inf" if bound == float("inf") else _format_value(bound)
+					lines.append(f"{family.name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+				lines.append(f"{family.name}_sum{_format_labels(labels)} {_format_value(value[-1])}")
+				lines.append(f"{family.name}_count{_format_labels(labels)} {cumulative}")
+		return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+	if not labels:
+		return ""
+	escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+	return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+	if isinstance(value, int) or float(value).is_integer():
+		return str(int(value))
+	return repr(float(value))
+
+
+def bucket_quantile(bounds: Sequence[float], counts: Sequence[float], q: float) -> float:
+	"""由 (非累计的) 分桶计数估计分位数，桶内线性插值；落在 +Inf 桶时返回最大的有限边界"""
+	total = sum(counts)
+	if total <= 0:
+		return 0.0
+	rank = q * total
+	cumulative = 0.0
+	for i, count in enumerate(counts):
+		if cumulative + count >= rank and count > 0:
+			if i >= len(bounds):
+				return bounds[-1]
+			lower = bounds[i - 1] if i > 0 else 0.0
+			return lower + (bounds[i] - lower) * (rank - cumulative) / count
+		cumulative += count
+	return bounds[-1]
+
+
+# --- 输出: HTTP 端点和定期摘要日志 ---
+
+class MetricsServer:
+	"""只监听 localhost 的 /metrics 端点 (Prometheus 文本格式)，port=0 时由系统分配"""
+
+	def __init__(self, registry: Optional[MetricsRegistry] = None, host: str = "127.0.0.1", port: int = 9108):
+		self.registry = registry or default_registry()
+		self.host = host
+		self.port = port
+		self._server = None  # http.server.ThreadingHTTPServer
+		self._thread: Optional[threading.Thread] = None
+
+	def start(self) -> "MetricsServer":
+		import http.server  # 只有开启端点时才需要，不拖慢每个导入 tools 的脚本的启动
+
+		registry = self.registry
+
+		class Handler(http.server.BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path.split("?")[0] not in ("/metrics", "/"):
+					self.send_error(404)
+					return
+				body = registry.render().encode("utf-8")
+				self.send_response(200)
+				self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+				self.send_header("Content-Length", str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, format, *args):
+				pass  # 不把每次抓取写进日志
+
+		self._server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+		self._server.daemon_threads = True
+		self.port = self._server.server_address[1]
+		self._thread = threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True)
+		self._thread.start()
+		logging.getLogger(self.__class__.__name__).info(f"指标端点: http://{self.host}:{self.port}/metrics")
+		return self
+
+	def stop(self) -> None:
+		if self._server is not None:
+			self._server.shutdown()
+			self._server.server_close()
+			self._server = None
+
+
+class MetricsReporter:
+	"""每 interval 秒写一行摘要日志，只包含这段时间内有变化的指标"""
+
+	def __init__(self, registry: Optional[MetricsRegistry] = None, interval: float = 60.0):
+		self.registry = registry or default_registry()
+		self.interval = interval
+		self.logger = logging.getLogger("metrics")
+		self._previous: Dict[Tuple[str, LabelValues], list] = {}
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+
+	def start(self) -> "MetricsReporter":
+		self._previous = self.registry.collect()
+		self._thread = threading.Thread(target=self._run, name="MetricsReporter", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join(2)
+
+	def _run(self) -> None:
+		while not self._stop.wait(self.interval):
+			line = self.summary()
+			if line:
+				self.logger.info(line)
+
+	def summary(self) -> str:
+		"""与上一次调用相比的增量摘要，例如 "stage_seconds{stage=ocr} n=20 mean=12.3ms p95~24.1ms | ..." """
+		current = self.registry.collect()
+		kinds = {family.name: family for family in self.registry.families()}
+		parts = []
+		for (name, key), values in current.items():
+			family = kinds[name]
+			label = name + ("{" + ",".join(f"{n}={v}" for n, v in zip(family.labelnames, key)) + "}" if key else "")
+			previous = self._previous.get((name, key))
+			if family.kind == "gauge":
+				parts.append(f"{label}={values[0]:g}")
+				continue
+			delta = [v - p for v, p in zip(values, previous)] if previous else values
+			if family.kind == "counter":
+				if delta[0]:
+					parts.append(f"{label} +{delta[0]:g}")
+				continue
+			count = sum(delta[:-1])
+			if count:
+				parts.append(f"{label} n={count} mean={delta[-1] / count * 1000:.1f}ms "
+							 f"p95~{bucket_quantile(family.buckets, delta[:-1], 0.95) * 1000:.1f}ms")
+		self._previous = current
+		return " | ".join(parts)
+
+
+_default_registry: Optional[MetricsRegistry] = None
+_default_lock = threading.Lock()
+
+
+def default_registry() -> MetricsRegistry:
+	"""进程内默认的指标注册表"""
+	global _default_registry
+	if _default_registry is not None:
+		return _default_registry
+	with _default_lock:
+		if _default_registry is None:
+			_default_registry = MetricsRegistry()
+		return _default_registry
+
+
+_stage_timers: Dict[Tuple[str, str], Histogram] = {}
+
+
+def stage_timer(component: str, stage: str) -> Histogram:
+	"""默认注册表中的 stage_seconds{component, stage} 计时器 (查找结果缓存，热路径上只有一次字典查找)"""
+	timer = _stage_timers.get((component, stage))
+	if timer is None:
+		timer = _stage_timers[(component, stage)] = default_registry().histogram(
+			"stage_seconds", "各组件各阶段的耗时 (秒)", ("component", "stage")).labels(component, stage)
+	return timer
+
+
+# --- 基准测试：每次埋点调用的开销 ---
+
+class _LockedHistogram:
+	"""对照: 一把全局锁保护的直方图 (与 ocr_engine.OCRLatencyStats 的做法相同)"""
+
+	def __init__(self, bounds: Sequence[float]):
+		self._lock = threading.Lock()
+		self._bounds = tuple(bounds)
+		self._counts = [0] * (len(self._bounds) + 1)
+		self._sum = 0.0
+
+	def observe(self, value: float) -> None:
+		with self._lock:
+			self._counts[bisect.bisect_left(self._bounds, value)] += 1
+			self._sum += value
+
+
+def main():
+	parser = argparse.ArgumentParser(description="指标埋点的单次调用开销 (单线程 / 多线程)")
+	parser.add_argument("--calls", type=int, default=500000, help="每个线程的调用次数")
+	parser.add_argument("--threads", type=int, default=4, help="多线程测试的线程数")
+	parser.add_argument("--serve", type=float, default=0, help="测试完成后在 localhost 上提供 /metrics 的秒数")
+	args = parser.parse_args()
+
+	registry = MetricsRegistry()
+	counter = registry.counter("bench_calls_total", "基准测试调用次数")
+	histogram = registry.histogram("bench_seconds", "基准测试耗时", ("stage",)).labels(stage="ocr")
+	locked = _LockedHistogram(DEFAULT_BUCKETS)
+
+	def measure(label: str, body: Callable[[int], None], threads: int = 1) -> float:
+		workers = [threading.Thread(target=body, args=(args.calls,)) for _ in range(threads)]
+		start_time = time.perf_counter()
+		for worker in workers:
+			worker.start()
+		for worker in workers:
+			worker.join()
+		elapsed = time.perf_counter() - start_time
+		per_call = elapsed / (args.calls * threads) * 1e9
+		print(f"  {label:34s} {per_call:7.0f} ns/次")
+		return per_call
+
+	def empty(n):
+		for _ in range(n):
+			pass
+
+	def count(n):
+		inc = counter.inc
+		for _ in range(n):
+			inc()
+
+	def observe(n):
+		obs = histogram.observe
+		for _ in range(n):
+			obs(0.003)
+
+	def timed(n):
+		for _ in range(n):
+			with histogram.time():
+				pass
+
+	from tools import LoggerMixin
+
+	class Component(LoggerMixin):
+		pass
+
+	component = Component()
+
+	def mixin_timed(n):
+		for _ in range(n):
+			with component.timed("ocr"):
+				pass
+
+	def bare_timing(n):
+		perf_counter = time.perf_counter
+		for _ in range(n):
+			start = perf_counter()
+			perf_counter() - start
+
+	def observe_locked(n):
+		obs = locked.observe
+		for _ in range(n):
+			obs(0.003)
+
+	for threads in (1, args.threads):
+		print(f"--- {threads} 个线程，每个线程 {args.calls} 次 ---")
+		base = measure("空循环", empty, threads)
+		measure("counter.inc()", count, threads)
+		measure("histogram.observe() (分片)", observe, threads)
+		measure("histogram.observe() (全局锁)", observe_locked, threads)
+		measure("两次 perf_counter (手工计时)", bare_timing, threads)
+		timer_cost = measure("with histogram.time()", timed, threads)
+		measure("with LoggerMixin.timed()", mixin_timed, threads)
+		print(f"  每次计时埋点净开销约 {timer_cost - base:.0f} ns (一次 OCR 约 10 ms，占比 "
+			  f"{(timer_cost - base) / 1e7 * 100:.4f}%)")
+
+	values = registry.collect()
+	expected = args.calls * (1 + args.threads)
+	print(f"计数器汇总: {values[('bench_calls_total', ())][0]:.0f} (期望 {expected})，"
+		  f"直方图次数: {sum(values[('bench_seconds', ('ocr',))][:-1])} (期望 {expected * 2})")
+	print(MetricsReporter(registry).summary())
+
+	if args.serve:
+		server = MetricsServer(registry, port=0).start()
+		print(f"curl http://127.0.0.1:{server.port}/metrics  ({args.serve:g} 秒后退出)")
+		time.sleep(args.serve)
+		server.stop()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,275 @@
+# modbus_registers.py
+
+"""
+声明式的 Modbus 寄存器表 + 合并块读取规划。
+
+LN2SeparatorReader 原来对每个寄存器单独 read_holding_registers(address, count=1)，
+两次请求之间还要 sleep(0.1)，每次采样超过 100 ms。这里改为:
+
+1.  用 RegisterField 声明每个量: 地址、数据类型 (int16/uint16 占一个寄存器，
+	int32/uint32/float32 占两个)、比例系数 (例如 /100 换算为 MPa) 和单位；
+2.  规划器把地址相邻或间隔不超过 max_gap 的字段合并为尽量少的块读取，
+	每块不超过一个 PDU 允许的 125 个寄存器；
+3.  每个块在规划时预编译一个 struct 格式 (间隔的寄存器用填充字节跳过)，
+	读回后一次 unpack 解出块内所有字段。
+
+用法:
+	register_map = RegisterMap([
+		RegisterField("液位", 0, "uint16", unit="mm"),
+		RegisterField("压力", 1, "uint16", scale=0.01, unit="MPa"),
+	])
+	values = register_map.read(client, device_id=1)  # {"液位": 1234.0, "压力": 0.56}
+"""
+
+import argparse
+import struct
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from tools import LoggerMixin
+
+# 数据类型 -> (struct 格式字符, 占用的寄存器数)
+REGISTER_TYPES = {
+	"int16": ("h", 1),
+	"uint16": ("H", 1),
+	"int32": ("i", 2),
+	"uint32": ("I", 2),
+	"float32": ("f", 2),
+}
+
+# 一次 "读保持寄存器" 请求最多 125 个寄存器 (PDU 上限 253 字节)
+MAX_REGISTERS_PER_READ = 125
+
+
+@dataclass(frozen=True)
+class RegisterField:
+	"""
+	一个寄存器量。word_order="little" 表示 32 位量的低字在前 (部分 PLC 的 CDAB 顺序)，
+	字内始终是大端字节序 (Modbus 规定)。
+	"""
+	name: str
+	address: int
+	dtype: str = "uint16"
+	scale: float = 1.0
+	unit: str = ""
+	word_order: str = "big"
+
+	def __post_init__(self):
+		if self.dtype not in REGISTER_TYPES:
+			raise ValueError(f"不支持的寄存器类型: {self.dtype}")
+		if self.word_order not in ("big", "little"):
+			raise ValueError(f"word_order 只能是 big 或 little: {self.word_order}")
+
+	@property
+	def width(self) -> int:
+		return REGISTER_TYPES[self.dtype][1]
+
+	@property
+	def end(self) -> int:
+		return self.address + self.width
+
+
+@dataclass
+class ReadBlock:
+	"""一次块读取: 起始地址、寄存器数，以及块内的字段和预编译的解码格式"""
+	start: int
+	count: int
+	fields: List[RegisterField]
+	_struct: Optional[struct.Struct] = field(default=None, repr=False)
+	_swap: Tuple[int, ...] = field(default=(), repr=False)  # 需要交换高低字的块内偏移
+
+	def compile(self) -> None:
+		fmt, swap, cursor, overlapping = ">", [], self.start, False
+		for f in self.fields:
+			if f.address < cursor:
+				overlapping = True
+				break
+			fmt += "2x" * (f.address - cursor) + REGISTER_TYPES[f.dtype][0]
+			if f.word_order == "little" and f.width == 2:
+				swap.append(f.address - self.start)
+			cursor = f.end
+		fmt += "2x" * (self.start + self.count - cursor)
+		# 字段相互重叠 (同一寄存器按两种类型解释) 时无法用一个格式串，退回逐字段解码
+		self._struct = None if overlapping else struct.Struct(fmt)
+		self._swap = tuple(swap)
+
+	def decode(self, registers: Sequence[int]) -> Dict[str, float]:
+		"""把读回的寄存器解码为 {字段名: 乘以比例系数后的值}"""
+		if len(registers) < self.count:
+			raise ValueError(f"块 {self.start}+{self.count} 只读回 {len(registers)} 个寄存器")
+		if self._swap:
+			registers = list(registers)
+			for i in self._swap:
+				registers[i], registers[i + 1] = registers[i + 1], registers[i]
+		raw = struct.pack(f">{self.count}H", *registers[:self.count])
+		if self._struct is not None:
+			values = self._struct.unpack(raw)
+		else:
+			values = [struct.unpack_from(">" + REGISTER_TYPES[f.dtype][0], raw, (f.address - self.start) * 2)[0]
+					  for f in self.fields]
+		return {f.name: value * f.scale for f, value in zip(self.fields, values)}
+
+
+def plan_blocks(fields: Sequence[RegisterField], max_gap: int = 8,
+				max_registers: int = MAX_REGISTERS_PER_READ) -> List[ReadBlock]:
+	"""
+	按地址排序后贪心合并: 下一个字段与当前块的间隔不超过 max_gap 个寄存器、
+	且合并后不超过 max_registers 时并入当前块，否则开始新块。
+	max_gap 是 "多读几个无用寄存器" 与 "多一次往返" 之间的权衡，对 TCP 来说几个寄存器几乎没有代价。
+	"""
+	blocks: List[ReadBlock] = []
+	for f in sorted(fields, key=lambda f: (f.address, f.width)):
+		if f.width > max_registers:
+			raise ValueError(f"字段 {f.name} 超过单次读取上限")
+		if blocks:
+			block = blocks[-1]
+			end = block.start + block.count
+			new_end = max(end, f.end)
+			if f.address - end <= max_gap and new_end - block.start <= max_registers:
+				block.count = new_end - block.start
+				block.fields.append(f)
+				continue
+		blocks.append(ReadBlock(f.address, f.width, [f]))
+	for block in blocks:
+		block.compile()
+	return blocks
+
+
+class RegisterMap(LoggerMixin):
+	"""
+	一台设备的寄存器表。构造时完成规划，read() 每块一次往返。
+	"""
+
+	def __init__(self, fields: Sequence[RegisterField], max_gap: int = 8,
+				 max_registers: int = MAX_REGISTERS_PER_READ):
+		names = [f.name for f in fields]
+		if len(set(names)) != len(names):
+			raise ValueError("寄存器表中有重复的字段名")
+		self.fields = list(fields)
+		self.blocks = plan_blocks(self.fields, max_gap, max_registers)
+		self.units = {f.name: f.unit for f in self.fields}
+
+	def empty(self) -> Dict[str, Optional[float]]:
+		return {f.name: None for f in self.fields}
+
+	def read(self, client, device_id: int = 1) -> Dict[str, Optional[float]]:
+		"""
+		用 pymodbus 同步客户端读取全部字段。某个块读取失败时只有该块的字段为 None，
+		其它块照常返回。
+		"""
+		return self.read_with(lambda start, count: self._read_block(client, device_id, start, count))
+
+	def read_with(self, read_block: Callable[[int, int], Optional[Sequence[int]]]) -> Dict[str, Optional[float]]:
+		"""read_block(start, count) 返回寄存器列表或 None，可以接入任意传输方式"""
+		values = self.empty()
+		for block in self.blocks:
+			registers = read_block(block.start, block.count)
+			if registers is not None:
+				values.update(block.decode(registers))
+		return values
+
+	def _read_block(self, client, device_id: int, start: int, count: int) -> Optional[List[int]]:
+		try:
+			result = client.read_holding_registers(start, count=count, device_id=device_id)
+			if result.isError():
+				self.logger.error(f"块读取失败, 地址: {start}, 数量: {count}, 错误: {result}")
+				return None
+			return result.registers
+		except Exception as e:
+			self.logger.error(f"块读取时发生异常, 地址: {start}, 数量: {count}: {e}")
+			return None
+
+	def encode(self, values: Mapping[str, float]) -> Dict[int, int]:
+		"""把 {字段名: 工程值} 编码为 {地址: 寄存器值} (用于 PLC 模拟器)"""
+		registers: Dict[int, int] = {}
+		for f in self.fields:
+			if f.name not in values:
+				continue
+			raw = values[f.name] / f.scale
+			if f.dtype != "float32":
+				raw = int(round(raw))
+			words = struct.unpack(f">{f.width}H", struct.pack(">" + REGISTER_TYPES[f.dtype][0], raw))
+			if f.word_order == "little":
+				words = words[::-1]
+			for i, word in enumerate(words):
+				registers[f.address + i] = word
+		return registers
+
+
+# --- 基准测试：逐寄存器读取 vs 规划后的块读取 (本地 pymodbus 模拟器) ---
+
+def build_synthetic_map(count: int) -> RegisterMap:
+	"""生成一张混合类型、地址有间隔的寄存器表，模拟较大的 PLC 点表"""
+	fields, address = [], 0
+	dtypes = ("uint16", "int16", "float32", "uint32", "int32")
+	for i in range(count):
+		dtype = dtypes[i % len(dtypes)]
+		fields.append(RegisterField(f"p{i}", address, dtype, scale=0.1 if dtype.endswith("16") else 1.0,
+									word_order="little" if i % 7 == 3 else "big"))
+		address += REGISTER_TYPES[dtype][1] + (3 if i % 10 == 9 else 0)
+	return RegisterMap(fields)
+
+
+def main():
+	parser = argparse.ArgumentParser(description="逐寄存器读取 vs 合并块读取 (本地 PLC 模拟器)")
+	parser.add_argument("--rounds", type=int, default=50, help="每种方式的采样次数")
+	parser.add_argument("--latency", type=float, default=0.002, help="模拟 PLC 每个请求的响应时间 (秒)")
+	parser.add_argument("--fields", type=int, default=40, help="合成点表的字段数")
+	parser.add_argument("--legacy-delay", type=float, default=0.1, help="原实现两次请求之间的 sleep (秒)")
+	parser.add_argument("--legacy-rounds", type=int, default=3, help="逐字段读取的采样次数 (每次要 sleep 多次)")
+	args = parser.parse_args()
+
+	from pymodbus.client import ModbusTcpClient
+
+	from debug_LN2_reader import LN2_REGISTER_MAP
+	from plc_simulator import PLCSimulator
+
+	cases = [("LN2 分离器", LN2_REGISTER_MAP, {"液位": 1234, "压力": 0.56}),
+			 (f"合成点表 ({args.fields} 个字段)", build_synthetic_map(args.fields), None)]
+	for label, register_map, expected in cases:
+		if expected is None:
+			expected = {f.name: (i * 37 % 500) * f.scale * (-1 if f.dtype.startswith("int") else 1)
+						for i, f in enumerate(register_map.fields)}
+		with PLCSimulator(register_map.encode(expected), latency=args.latency) as plc:
+			client = ModbusTcpClient(plc.host, port=plc.port)
+			client.connect()
+
+			def legacy_read():
+				# 原 read_current_data 的做法: 每个字段一次请求，请求之间 sleep
+				values = {}
+				for i, f in enumerate(register_map.fields):
+					if i:
+						time.sleep(args.legacy_delay)
+					registers = client.read_holding_registers(f.address, count=f.width, device_id=1).registers
+					values.update(_decode_single(f, registers))
+				return values
+
+			results = []
+			for name, read in (("逐字段", legacy_read), ("块读取", lambda: register_map.read(client))):
+				rounds = args.rounds if name == "块读取" else args.legacy_rounds
+				plc.requests = 0
+				latencies = []
+				for _ in range(rounds):
+					start_time = time.perf_counter()
+					values = read()
+					latencies.append(time.perf_counter() - start_time)
+				ok = all(abs(values[k] - v) <= 1e-6 * max(1.0, abs(v)) for k, v in expected.items())
+				latencies.sort()
+				results.append(f"{name}: {plc.requests // rounds} 次请求/样本, "
+							   f"p50 {latencies[len(latencies) // 2] * 1000:7.2f} ms, "
+							   f"max {latencies[-1] * 1000:7.2f} ms, 解码{'正确' if ok else '错误'}")
+			client.close()
+		print(f"\n--- {label}: {len(register_map.blocks)} 个块 ---")
+		for line in results:
+			print("  " + line)
+
+
+def _decode_single(f: RegisterField, registers: Sequence[int]) -> Dict[str, float]:
+	block = ReadBlock(f.address, f.width, [f])
+	block.compile()
+	return block.decode(registers)
+
+
+if __name__ == "__main__":
+	main()
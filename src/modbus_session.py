@@ -0,0 +1,309 @@
+# modbus_session.py
+
+"""
+长连接的 Modbus TCP 会话: 连接复用 + 半开连接检测 + 带抖动退避的透明重连。
+
+debug_LN2_reader.main 每次运行都要建立 TCP 连接、读一次、再断开，connect_LN2 也没有重连逻辑；
+轮询频率高时 TCP 建连反而成了主要开销。ModbusSession 把连接一直保持着:
+
+- 每次请求前先做一次本地检查 (select 查看空闲连接是否可读，不产生网络流量)，
+  对端已经关闭 (收到 FIN/RST) 的连接直接丢弃重连，不必等一次请求超时；
+- 连接空闲超过 probe_interval 时，先用一次单寄存器读取做探测。对端断电、网线拔掉等
+  "半开" 连接本地看不出来，探测超时后立即重连，而不是让真正的读取去撞超时；
+- 请求失败时关闭连接，并按 "完全抖动" 的指数退避安排下一次重连
+  (等待时间在 [0, min(上限, 初值 * 2^n)] 内均匀随机，多台客户端不会同时重连)。
+  退避期间的请求立即返回失败，不阻塞调用方的轮询循环；
+- stats() 给出连接复用、重连、探测等计数。
+"""
+
+import argparse
+import logging
+import random
+import select
+import socket
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Callable, List, Optional, TypeVar
+
+from tools import LoggerMixin
+
+if TYPE_CHECKING:
+	from pymodbus.client import ModbusTcpClient
+
+T = TypeVar("T")
+
+
+def tcp_client_factory(**kwargs) -> "ModbusTcpClient":
+	"""默认的客户端工厂；pymodbus 导入较慢，第一次建立连接时才导入"""
+	from pymodbus.client import ModbusTcpClient
+
+	return ModbusTcpClient(**kwargs)
+
+
+@dataclass
+class SessionStats:
+	connects: int = 0  # 成功建立的连接数 (第一次连接也算)
+	reconnects: int = 0  # 因连接失效而重新建立的连接数
+	connect_failures: int = 0
+	reuses: int = 0  # 复用已有连接完成的请求数
+	requests: int = 0
+	request_failures: int = 0
+	probes: int = 0
+	probe_failures: int = 0
+	peer_closed: int = 0  # 本地检查发现对端已关闭的次数
+	backoff_rejects: int = 0  # 退避期间被直接拒绝的请求数
+
+
+def peer_closed(sock: Optional[socket.socket]) -> bool:
+	"""
+	不发送任何数据，判断连接是否已不可用。请求之间的空闲连接本不应该可读:
+	可读意味着对端关闭 (FIN/RST) 或者有迟到的响应 (再复用会错位)，两种情况都应重连。
+	"""
+	if sock is None:
+		return True
+	try:
+		readable, _, errored = select.select([sock], [], [sock], 0)
+		return bool(readable or errored)
+	except (OSError, ValueError):
+		return True
+
+
+class ModbusSession(LoggerMixin):
+	"""
+	线程安全的 Modbus TCP 长连接。所有请求通过 call() 或 read_holding_registers() 发出。
+	"""
+
+	def __init__(self, host: str, port: int, unit_id: int = 1, timeout: float = 1.0,
+				 probe_interval: float = 10.0, probe_address: int = 0,
+				 backoff_initial: float = 0.2, backoff_max: float = 30.0,
+				 client_factory: Callable[..., "ModbusTcpClient"] = tcp_client_factory):
+		self.host = host
+		self.port = port
+		self.unit_id = unit_id
+		self.timeout = timeout
+		self.probe_interval = probe_interval
+		self.probe_address = probe_address
+		self.backoff_initial = backoff_initial
+		self.backoff_max = backoff_max
+		self.client_factory = client_factory
+		self.counters = SessionStats()
+
+		self.client: Optional["ModbusTcpClient"] = None
+		self._lock = threading.RLock()
+		self._last_activity = 0.0
+		self._failures = 0  # 连续失败次数，决定退避时长
+		self._next_attempt = 0.0
+		self._ever_connected = False
+
+	# --- 连接管理 ---
+
+	@property
+	def is_connected(self) -> bool:
+		return self.client is not None and self.client.connected
+
+	def _backoff(self) -> None:
+		"""安排下一次连接尝试 (完全抖动)"""
+		self._failures += 1
+		ceiling = min(self.backoff_max, self.backoff_initial * 2 ** (self._failures - 1))
+		self._next_attempt = time.monotonic() + random.uniform(0, ceiling)
+
+	def _drop(self) -> None:
+		if self.client is not None:
+			try:
+				self.client.close()
+			except Exception as e:
+				self.logger.debug(f"关闭连接时发生错误: {e}")
+			self.client = None
+
+	def _open(self) -> bool:
+		if time.monotonic() < self._next_attempt:
+			self.counters.backoff_rejects += 1
+			return False
+		# retries=0: 失败立即交回这里处理，不在 pymodbus 内部重试
+		client = self.client_factory(host=self.host, port=self.port, timeout=self.timeout, retries=0)
+		with self.timed("connect"):
+			connected = client.connect()
+		if not connected:
+			client.close()
+			self.counters.connect_failures += 1
+			self._backoff()
+			self.logger.warning(f"无法连接到 PLC: {self.host}:{self.port}，"
+								f"{max(0.0, self._next_attempt - time.monotonic()):.2f} 秒后重试")
+			return False
+		try:
+			# 让内核也帮忙发现长时间静默的死连接
+			client.socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+		except (OSError, AttributeError):
+			pass
+		self.client = client
+		self.counters.connects += 1
+		if self._ever_connected:
+			self.counters.reconnects += 1
+			self.logger.info(f"已重新连接到 PLC: {self.host}:{self.port}")
+		else:
+			self.logger.info(f"成功连接到 PLC: {self.host}:{self.port}")
+		self._ever_connected = True
+		self._failures = 0
+		self._last_activity = time.monotonic()
+		return True
+
+	def _probe(self) -> bool:
+		self.counters.probes += 1
+		try:
+			result = self.client.read_holding_registers(self.probe_address, count=1, device_id=self.unit_id)
+			if not result.isError():
+				return True
+		except Exception as e:
+			self.logger.debug(f"探测失败: {e}")
+		self.counters.probe_failures += 1
+		return False
+
+	def ensure_connected(self) -> bool:
+		"""保证持有一个可用的连接；复用已有连接时不产生任何网络流量 (除非空闲时间超过探测间隔)"""
+		with self._lock:
+			if self.client is not None:
+				if peer_closed(self.client.socket):
+					self.counters.peer_closed += 1
+					self.logger.warning(f"PLC 已关闭连接: {self.host}:{self.port}")
+					self._drop()
+				elif time.monotonic() - self._last_activity > self.probe_interval and not self._probe():
+					self.logger.warning(f"连接探测无响应 (半开连接): {self.host}:{self.port}")
+					self._drop()
+				else:
+					return True
+			return self._open()
+
+	def connect(self) -> bool:
+		"""立即尝试建立连接 (忽略退避)"""
+		with self._lock:
+			self._next_attempt = 0.0
+			return self.ensure_connected()
+
+	def close(self) -> None:
+		with self._lock:
+			self._drop()
+			self.logger.info(f"已断开 PLC 连接: {self.host}:{self.port}")
+
+	def __enter__(self):
+		self.connect()
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+	# --- 请求 ---
+
+	def call(self, request: Callable[["ModbusTcpClient"], T]) -> Optional[T]:
+		"""
+		在会话连接上执行 request(client)。连接不可用或请求失败时返回 None；
+		连接断开导致的失败会在重连后重试一次 (刚复用的连接可能恰好在请求途中失效)。
+		"""
+		with self._lock:
+			for attempt in range(2):
+				connects = self.counters.connects
+				if not self.ensure_connected():
+					return None
+				reused = self.counters.connects == connects
+				self.counters.requests += 1
+				try:
+					with self.timed("request"):
+						result = request(self.client)
+				except Exception as e:
+					self.counters.request_failures += 1
+					self.logger.warning(f"请求失败 ({self.host}:{self.port}): {e}")
+					self._drop()
+					if attempt == 0 and reused:
+						continue  # 复用的连接失效，立即重连重试一次
+					self._backoff()
+					return None
+				self._last_activity = time.monotonic()
+				if reused:
+					self.counters.reuses += 1
+				return result
+			return None
+
+	def read_holding_registers(self, address: int, count: int = 1) -> Optional[List[int]]:
+		"""读取保持寄存器，失败 (含 Modbus 异常响应) 返回 None"""
+		result = self.call(lambda client: client.read_holding_registers(address, count=count, device_id=self.unit_id))
+		if result is None:
+			return None
+		if result.isError():
+			self.logger.error(f"读取寄存器失败, 地址: {address}, 数量: {count}, 错误: {result}")
+			return None
+		return result.registers
+
+	def stats(self) -> dict:
+		with self._lock:
+			result = asdict(self.counters)
+			result["connected"] = self.is_connected
+			result["reuse_rate"] = self.counters.reuses / self.counters.requests if self.counters.requests else 0.0
+			return result
+
+
+# --- 基准测试 / 故障测试：本地模拟 PLC 主动断开连接、停止响应 ---
+
+def main():
+	parser = argparse.ArgumentParser(description="每次建连 vs 长连接会话；模拟 PLC 断连/半开时的重连表现")
+	parser.add_argument("--reads", type=int, default=500, help="每个场景的读取次数")
+	parser.add_argument("--drop-every", type=int, default=20, help="模拟 PLC 每处理多少个请求断开一次连接")
+	parser.add_argument("--timeout", type=float, default=0.3, help="请求超时 (秒)")
+	args = parser.parse_args()
+
+	from pymodbus.client import ModbusTcpClient
+
+	from plc_simulator import PLCSimulator
+
+	logging.getLogger("pymodbus").setLevel(logging.CRITICAL)
+	logging.getLogger(ModbusSession.__name__).setLevel(logging.ERROR)
+
+	with PLCSimulator({0: 1234, 1: 56}) as plc:
+		# 1. 原流程: 每次读取都新建连接
+		start_time = time.perf_counter()
+		for _ in range(args.reads):
+			client = ModbusTcpClient(host=plc.host, port=plc.port, timeout=args.timeout)
+			client.connect()
+			client.read_holding_registers(0, count=2, device_id=1)
+			client.close()
+		per_connect = (time.perf_counter() - start_time) / args.reads
+		print(f"每次建连:   {per_connect * 1000:6.2f} ms/次")
+
+		# 2. 长连接会话
+		session = ModbusSession(plc.host, plc.port, timeout=args.timeout)
+		start_time = time.perf_counter()
+		for _ in range(args.reads):
+			session.read_holding_registers(0, 2)
+		persistent = (time.perf_counter() - start_time) / args.reads
+		print(f"长连接会话: {persistent * 1000:6.2f} ms/次 ({per_connect / persistent:.1f}x) | {session.stats()}")
+
+		# 3. PLC 每 N 个请求断开一次连接: 读取应全部成功 (透明重连 + 重试)
+		session = ModbusSession(plc.host, plc.port, timeout=args.timeout)
+		plc.drop_every = args.drop_every
+		ok = sum(session.read_holding_registers(0, 2) == [1234, 56] for _ in range(args.reads))
+		plc.drop_every = 0
+		print(f"周期性断连: 成功 {ok}/{args.reads}, PLC 断开 {plc.drops} 次 | {session.stats()}")
+		assert ok == args.reads, f"周期性断连时有 {args.reads - ok} 次读取失败"
+
+		# 4. PLC 停止响应 (半开连接): 空闲超过探测间隔后由探测发现，恢复后自动重连
+		session = ModbusSession(plc.host, plc.port, timeout=args.timeout, probe_interval=0.2)
+		session.read_holding_registers(0, 2)
+		plc.stalled = True
+		time.sleep(0.3)
+		start_time = time.perf_counter()
+		stalled = session.read_holding_registers(0, 2)
+		detect = time.perf_counter() - start_time
+		plc.stalled = False
+		recovered = None
+		start_time = time.perf_counter()
+		while recovered is None and time.perf_counter() - start_time < 10:
+			recovered = session.read_holding_registers(0, 2)
+			if recovered is None:
+				time.sleep(0.05)
+		print(f"半开连接:   停止响应时读取 {stalled} (耗时 {detect * 1000:.0f} ms), "
+			  f"恢复后 {time.perf_counter() - start_time:.2f} s 内读到 {recovered} | {session.stats()}")
+		session.close()
+		assert recovered == [1234, 56], f"PLC 恢复响应后未能重新读到数据: {recovered}"
+
+
+if __name__ == "__main__":
+	main()
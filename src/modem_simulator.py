@@ -0,0 +1,150 @@
+# modem_simulator.py
+
+"""
+脚本化的 GSM 模块模拟器，挂在一对伪终端 (pty) 的主端上，被测代码像打开真实串口一样
+打开从端 (serial.Serial(modem.port))。只能在 Linux / macOS 上使用 (依赖 os.openpty)。
+
+支持的指令: AT、ATE0/ATE1、AT+CPIN?、AT+CSQ、AT+CREG?、AT+CMGF=<n>、AT+CMGS=<n> (PDU 模式)，
+其它指令一律回 OK；script 可以覆盖任意指令的响应。
+响应按真实模块的格式输出 ("\\r\\nOK\\r\\n")，AT+CMGS 先回 "\\r\\n> "，收到 Ctrl-Z 后
+经过 send_delay (模拟网络发送耗时) 再回 "+CMGS: <mr>" 和 OK。
+inject() 可以随时插入主动上报 (URC)，例如 '+CMTI: "SM",3' 或 'RING'。
+"""
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from tools import LoggerMixin
+
+
+class ScriptedModem(LoggerMixin):
+
+	def __init__(self, response_delay: float = 0.01, send_delay: float = 0.3, echo: bool = True,
+				 script: Optional[Dict[str, str]] = None):
+		self.response_delay = response_delay  # 模块处理一条指令的耗时
+		self.send_delay = send_delay  # 短信从 Ctrl-Z 到 +CMGS 的耗时
+		self.echo = echo
+		self.script = dict(script or {})
+		self.commands: List[str] = []  # 收到的指令 (按顺序)
+		self.sent_pdus: List[str] = []
+		self.pdu_mode = False
+		self._message_ref = 0
+
+		self._master, self._slave = os.openpty()
+		self.port = os.ttyname(self._slave)
+		self._write_lock = threading.Lock()
+		self._running = False
+		self._thread: Optional[threading.Thread] = None
+		self._set_raw(self._slave)
+
+	@staticmethod
+	def _set_raw(fd: int) -> None:
+		# 关闭行规程的回显和换行转换，使 pty 表现得像一根串口线
+		import tty
+
+		tty.setraw(fd)
+
+	def start(self) -> "ScriptedModem":
+		self._running = True
+		self._thread = threading.Thread(target=self._run, name="ScriptedModem", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		self._running = False
+		for fd in (self._master, self._slave):
+			try:
+				os.close(fd)
+			except OSError:
+				pass
+		if self._thread is not None:
+			self._thread.join(2)
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.stop()
+
+	def _write(self, data: bytes) -> None:
+		with self._write_lock:
+			os.write(self._master, data)
+
+	def inject(self, urc: str) -> None:
+		"""模拟模块主动上报一行"""
+		self._write(f"\r\n{urc}\r\n".encode("ascii"))
+
+	# --- 指令处理 ---
+
+	def _respond(self, command: str) -> None:
+		time.sleep(self.response_delay)
+		upper = command.upper()
+		if command in self.script:
+			self._write(f"\r\n{self.script[command]}\r\n".encode("ascii"))
+		elif upper == "ATE0":
+			self.echo = False
+			self._write(b"\r\nOK\r\n")
+		elif upper == "ATE1":
+			self.echo = True
+			self._write(b"\r\nOK\r\n")
+		elif upper == "AT+CPIN?":
+			self._write(b"\r\n+CPIN: READY\r\n\r\nOK\r\n")
+		elif upper == "AT+CSQ":
+			self._write(b"\r\n+CSQ: 23,99\r\n\r\nOK\r\n")
+		elif upper == "AT+CREG?":
+			self._write(b"\r\n+CREG: 0,1\r\n\r\nOK\r\n")
+		elif upper.startswith("AT+CMGF="):
+			self.pdu_mode = upper.endswith("=0")
+			self._write(b"\r\nOK\r\n")
+		elif upper.startswith("AT+CMGS="):
+			if not self.pdu_mode:
+				self._write(b"\r\n+CMS ERROR: 302\r\n")
+			else:
+				self._write(b"\r\n> ")
+				return
+		else:
+			self._write(b"\r\nOK\r\n")
+
+	def _finish_sms(self, pdu: str) -> None:
+		self.sent_pdus.append(pdu)
+		time.sleep(self.send_delay)
+		self._message_ref = (self._message_ref + 1) % 256
+		self._write(f"\r\n+CMGS: {self._message_ref}\r\n\r\nOK\r\n".encode("ascii"))
+
+	def _run(self) -> None:
+		buffer = bytearray()
+		awaiting_pdu = False
+		while self._running:
+			try:
+				data = os.read(self._master, 1024)
+			except OSError:
+				break
+			if not data:
+				break
+			buffer += data
+			while True:
+				if awaiting_pdu:
+					end = buffer.find(b"\x1a")
+					if end < 0:
+						break
+					pdu = buffer[:end].decode("ascii", "ignore").strip()
+					del buffer[:end + 1]
+					awaiting_pdu = False
+					if self.echo:
+						self._write(pdu.encode("ascii"))
+					self._finish_sms(pdu)
+					continue
+				end = buffer.find(b"\r")
+				if end < 0:
+					break
+				command = buffer[:end].decode("ascii", "ignore").strip()
+				del buffer[:end + 1]
+				if not command:
+					continue
+				self.commands.append(command)
+				if self.echo:
+					self._write(command.encode("ascii") + b"\r")
+				self._respond(command)
+				awaiting_pdu = command.upper().startswith("AT+CMGS=") and self.pdu_mode
@@ -0,0 +1,322 @@
+# ocr_engine.py
+
+"""
+常驻进程内的 Tesseract OCR 引擎池。
+
+pytesseract 每次调用都会启动一个 tesseract.exe 进程并重新加载 traineddata，
+单行读数大约 0.15 秒 (见 pytesseract_demo.py)。这里沿用 tesserocr_demo.py 中
+PyTessBaseAPI 的做法：API 句柄只初始化一次，之后反复 SetImage / GetUTF8Text。
+
+- 每个 (psm, whitelist) 组合是一个 "配置档"，每个配置档维护若干个已预热的句柄；
+- 句柄借出/归还通过队列完成，可在多线程间安全共享；
+- tesserocr 不可用 (未安装或 tessdata 路径错误) 时自动回退到 pytesseract；
+- 每次调用都记录耗时，可通过 stats 查看两种后端的对比。
+
+用法:
+	pool = get_default_pool()
+	text = pool.recognize(pil_image, whitelist='0123456789.E-', psm=7)
+	print(pool.stats.summary())
+"""
+
+import argparse
+import queue
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from tools import LoggerMixin
+
+# tesserocr (加载 libtesseract) 和 pytesseract 都在第一次识别时才导入，导入本模块不需要它们
+_UNLOADED = object()
+_tesserocr = _UNLOADED
+_tesseract_cmd: Optional[str] = None
+
+
+def _load_tesserocr():
+	"""返回 tesserocr 模块，未安装时返回 None (结果缓存)"""
+	global _tesserocr
+	if _tesserocr is _UNLOADED:
+		try:
+			import tesserocr
+		except ImportError:  # 未安装 tesserocr 时只能使用 pytesseract
+			tesserocr = None
+		_tesserocr = tesserocr
+	return _tesserocr
+
+
+def set_tesseract_cmd(path: str) -> None:
+	"""指定 pytesseract 回退时使用的 tesseract 可执行文件 (不在 PATH 中时)，不会因此导入 pytesseract"""
+	global _tesseract_cmd
+	_tesseract_cmd = path
+	if "pytesseract" in sys.modules:
+		sys.modules["pytesseract"].pytesseract.tesseract_cmd = path
+
+
+def _load_pytesseract():
+	import pytesseract
+
+	if _tesseract_cmd is not None:
+		pytesseract.pytesseract.tesseract_cmd = _tesseract_cmd
+	return pytesseract
+
+# tesserocr 需要的是 tessdata 目录 (与 tesserocr_demo.py 相同)
+TESSDATA_PATH = r'C:\Program Files\Tesseract-OCR\tessdata'
+TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+BACKEND_TESSEROCR = "tesserocr"
+BACKEND_PYTESSERACT = "pytesseract"
+
+Profile = Tuple[int, str]
+
+
+class OCRLatencyStats:
+	"""
+	按 (后端, 配置档) 统计每次 OCR 调用的耗时，线程安全
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._records: Dict[Tuple[str, Profile], List[float]] = {}
+
+	def record(self, backend: str, profile: Profile, elapsed: float) -> None:
+		with self._lock:
+			# [次数, 总耗时, 最小, 最大, 最近一次]
+			rec = self._records.get((backend, profile))
+			if rec is None:
+				self._records[(backend, profile)] = [1, elapsed, elapsed, elapsed, elapsed]
+			else:
+				rec[0] += 1
+				rec[1] += elapsed
+				rec[2] = min(rec[2], elapsed)
+				rec[3] = max(rec[3], elapsed)
+				rec[4] = elapsed
+
+	def reset(self) -> None:
+		with self._lock:
+			self._records.clear()
+
+	def summary(self) -> Dict[str, Dict[str, float]]:
+		"""返回 {"后端 psm=7 wl=...": {"count", "mean_ms", "min_ms", "max_ms", "last_ms"}}"""
+		with self._lock:
+			result = {}
+			for (backend, (psm, whitelist)), (count, total, t_min, t_max, last) in self._records.items():
+				result[f"{backend} psm={psm} wl={whitelist}"] = {
+					"count": count,
+					"mean_ms": total / count * 1000,
+					"min_ms": t_min * 1000,
+					"max_ms": t_max * 1000,
+					"last_ms": last * 1000,
+				}
+			return result
+
+
+class TesseractEnginePool(LoggerMixin):
+	"""
+	PyTessBaseAPI 句柄池。每个 (psm, whitelist) 配置档最多创建 max_handles_per_profile 个句柄，
+	句柄用完即归还，不会重复加载 traineddata。
+	"""
+
+	def __init__(self, tessdata_path: str = TESSDATA_PATH, lang: str = 'eng',
+				 max_handles_per_profile: int = 2, use_tesserocr: bool = True):
+		self.tessdata_path = tessdata_path
+		self.lang = lang
+		self.max_handles_per_profile = max(1, max_handles_per_profile)
+		self.stats = OCRLatencyStats()
+
+		self._lock = threading.Lock()
+		self._idle: Dict[Profile, queue.LifoQueue] = {}
+		self._created: Dict[Profile, int] = {}
+		self._all_handles: List = []
+		self._borrowed: Set[int] = set()  # 借出中的句柄 id
+		self._closed = False
+		self.tesserocr_available = use_tesserocr and _load_tesserocr() is not None
+		if use_tesserocr and not self.tesserocr_available:
+			self.logger.warning("未安装 tesserocr，OCR 将回退到 pytesseract (每次调用启动新进程)")
+
+	# --- 句柄管理 ---
+
+	def _create_handle(self, profile: Profile):
+		psm, whitelist = profile
+		tesserocr = _load_tesserocr()
+		api = tesserocr.PyTessBaseAPI(path=self.tessdata_path, lang=self.lang, psm=tesserocr.PSM(psm),
+									  oem=tesserocr.OEM.DEFAULT)
+		if whitelist:
+			api.SetVariable("tessedit_char_whitelist", whitelist)
+		return api
+
+	def _acquire(self, profile: Profile):
+		"""借出一个句柄；tesserocr 不可用或句柄池已关闭时返回 None"""
+		with self._lock:
+			if self._closed or not self.tesserocr_available:
+				return None
+			idle = self._idle.setdefault(profile, queue.LifoQueue())
+			try:
+				api = idle.get_nowait()
+				self._borrowed.add(id(api))
+				return api
+			except queue.Empty:
+				pass
+			can_create = self._created.get(profile, 0) < self.max_handles_per_profile
+			if can_create:
+				# 先占位，避免多个线程同时为同一配置档超额创建
+				self._created[profile] = self._created.get(profile, 0) + 1
+
+		if not can_create:
+			# 句柄都被借出，等待其他线程归还；等待期间句柄池被关闭时放弃
+			while True:
+				try:
+					api = idle.get(timeout=0.5)
+				except queue.Empty:
+					if self._closed:
+						return None
+					continue
+				with self._lock:
+					if self._closed:
+						return None  # 队列里的空闲句柄已由 close() 释放
+					self._borrowed.add(id(api))
+					return api
+
+		try:
+			api = self._create_handle(profile)
+		except Exception as e:
+			with self._lock:
+				self._created[profile] -= 1
+				self.tesserocr_available = False
+			self.logger.error(f"初始化 PyTessBaseAPI 失败 (tessdata: {self.tessdata_path}): {e}，回退到 pytesseract")
+			return None
+		with self._lock:
+			self._borrowed.add(id(api))
+			self._all_handles.append(api)
+		self.logger.debug(f"已创建 OCR 句柄: psm={profile[0]}, whitelist={profile[1]}")
+		return api
+
+	def _release(self, profile: Profile, api) -> None:
+		with self._lock:
+			self._borrowed.discard(id(api))
+			if not self._closed:
+				self._idle[profile].put(api)
+				return
+		# close() 时该句柄还在使用中，归还时才释放
+		self._end(api)
+
+	def _end(self, api) -> None:
+		try:
+			api.End()
+		except Exception as e:
+			self.logger.error(f"释放 OCR 句柄时发生错误: {e}")
+
+	def warm_up(self, whitelist: str, psm: int = 7) -> bool:
+		"""提前为某个配置档创建一个句柄，避免首次识别时的加载开销"""
+		profile = (psm, whitelist)
+		api = self._acquire(profile)
+		if api is None:
+			return False
+		self._release(profile, api)
+		return True
+
+	def close(self) -> None:
+		"""释放空闲的句柄；仍被借出的句柄在归还时释放"""
+		with self._lock:
+			self._closed = True
+			handles = [api for api in self._all_handles if id(api) not in self._borrowed]
+			self._all_handles = []
+			self._idle.clear()
+			self._created.clear()
+		for api in handles:
+			self._end(api)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+	# --- 识别 ---
+
+	def recognize(self, image, whitelist: str, psm: int = 7) -> str:
+		"""
+		识别一张 Pillow 图像或二维 uint8 灰度数组 (通常是单行读数裁剪图，可以是整帧数组的切片视图)，
+		返回去除首尾空白的文本
+		"""
+		profile = (psm, whitelist)
+		api = self._acquire(profile)
+		if api is not None:
+			try:
+				start_time = time.perf_counter()
+				if isinstance(image, np.ndarray):
+					# 直接传入像素缓冲区，不经过 Pillow (只复制这一小块区域)
+					height, width = image.shape
+					api.SetImageBytes(np.ascontiguousarray(image).tobytes(), width, height, 1, width)
+				else:
+					api.SetImage(image)
+				text = api.GetUTF8Text()
+				self.stats.record(BACKEND_TESSEROCR, profile, time.perf_counter() - start_time)
+				return text.strip()
+			finally:
+				self._release(profile, api)
+
+		start_time = time.perf_counter()
+		custom_config = f'--psm {psm} -c tessedit_char_whitelist={whitelist}'
+		text = _load_pytesseract().image_to_string(image, config=custom_config)
+		self.stats.record(BACKEND_PYTESSERACT, profile, time.perf_counter() - start_time)
+		return text.strip()
+
+
+_default_pool: Optional[TesseractEnginePool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool() -> TesseractEnginePool:
+	"""进程内共享的默认引擎池 (惰性创建)"""
+	global _default_pool
+	with _default_pool_lock:
+		if _default_pool is None:
+			_default_pool = TesseractEnginePool()
+		return _default_pool
+
+
+# --- 基准测试：在合成的读数裁剪图上比较两种后端 ---
+
+def render_reading(text: str, size: Tuple[int, int] = (150, 31), font_size: int = 22):
+	"""渲染一张类似仪表读数的单行灰度图"""
+	from PIL import Image, ImageDraw, ImageFont
+
+	img = Image.new('L', size, color=255)
+	d = ImageDraw.Draw(img)
+	try:
+		font = ImageFont.truetype("arial.ttf", font_size)
+	except IOError:
+		font = ImageFont.load_default()
+	d.text((4, 2), text, fill=0, font=font)
+	return img
+
+
+def main():
+	parser = argparse.ArgumentParser(description="比较 tesserocr 引擎池与 pytesseract 的单次 OCR 耗时")
+	parser.add_argument("--tessdata", type=str, default=TESSDATA_PATH, help="tessdata 目录")
+	parser.add_argument("--rounds", type=int, default=20, help="每种后端的识别次数")
+	args = parser.parse_args()
+
+	set_tesseract_cmd(TESSERACT_CMD)
+	samples = [("1.23E-9", '0123456789.E-'), ("15.2K", '0123456789Kk.')]
+	images = [(render_reading(text), whitelist, text) for text, whitelist in samples]
+
+	for label, use_tesserocr in (("pytesseract", False), ("tesserocr pool", True)):
+		with TesseractEnginePool(tessdata_path=args.tessdata, use_tesserocr=use_tesserocr) as pool:
+			for _, whitelist, _ in images:
+				pool.warm_up(whitelist)
+			correct = 0
+			for _ in range(args.rounds):
+				for img, whitelist, expected in images:
+					correct += pool.recognize(img, whitelist) == expected
+			print(f"\n--- {label} (正确 {correct}/{args.rounds * len(images)}) ---")
+			for key, s in pool.stats.summary().items():
+				print(f"  {key}: n={s['count']}, mean={s['mean_ms']:.2f} ms, "
+					  f"min={s['min_ms']:.2f} ms, max={s['max_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+	main()
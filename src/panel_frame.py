@@ -0,0 +1,229 @@
+# panel_frame.py
+
+"""
+PanelFrame (阶段 1 的产物) 及其录制 / 回放。
+
+录制格式是一个 zip 文件 (一个会话一个文件):
+	index.jsonl         每帧一行: 序号、时间戳、主窗口坐标、各控件坐标、源炉面板文本、图像文件名
+	frame_000000.png    主窗口截图 (PNG 本身已压缩，zip 中不再压缩)
+	frame_000000.json   该帧在 index.jsonl 中的那一行，录制时随帧写入
+
+index.jsonl 在 close() 时才写入。录制进程崩溃或被杀掉时 zip 没有 index.jsonl，甚至没有中央目录，
+FrameReplayer 会改为按成员名收集 frame_*.json 重建索引，必要时顺序扫描各成员的本地文件头。
+
+FrameReplayer 从录制文件中重建 PanelFrame，可以在没有 GUI 的机器上 (包括 Linux)
+把录制的会话送进阶段 2 的分析，或者送进 stage_benchmark.py 做分阶段延迟测试。
+本模块不依赖 pywinauto / pyautogui。
+"""
+
+import io
+import json
+import struct
+import threading
+import time
+import zipfile
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from region_cache import Rect, snapshot_rect
+
+INDEX_NAME = "index.jsonl"
+
+
+@dataclass
+class PanelFrame:
+	"""阶段 1 的产物：一次GUI交互得到的全部文本、坐标和主窗口截图"""
+	main_screenshot_pil: Any
+	main_win_coords: Any
+	reactor_texts: List[str]
+	shutter_coords: Any
+	vacuum_coords: Any
+	temp_coords: Any
+	control_coords: Dict[str, Any] = field(default_factory=dict)
+
+
+def _rect_to_list(rect) -> List[int]:
+	return list(snapshot_rect(rect))
+
+
+class FrameRecorder:
+	"""
+	把 PanelFrame 依次追加到 zip 会话文件中，线程安全 (可以直接包在采集线程的 capture 外面)
+	"""
+
+	def __init__(self, path: str):
+		self.path = path
+		self.count = 0
+		self._lock = threading.Lock()
+		self._zip = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED)
+		self._index: List[str] = []
+
+	def record(self, frame: PanelFrame, timestamp: Optional[float] = None) -> None:
+		buf = io.BytesIO()
+		frame.main_screenshot_pil.save(buf, format='PNG', compress_level=1)
+		with self._lock:
+			stem = f"frame_{self.count:06d}"
+			image_name = f"{stem}.png"
+			line = json.dumps({
+				"index": self.count,
+				"timestamp": time.time() if timestamp is None else timestamp,
+				"main_win_coords": _rect_to_list(frame.main_win_coords),
+				"controls": {name: _rect_to_list(r) for name, r in frame.control_coords.items()},
+				"reactor_texts": list(frame.reactor_texts or []),
+				"image": image_name,
+			}, ensure_ascii=False)
+			# 先写图像再写该帧的索引行：索引行存在时图像一定是完整的
+			self._zip.writestr(image_name, buf.getvalue())
+			self._zip.writestr(f"{stem}.json", line)
+			self._zip.fp.flush()
+			self._index.append(line)
+			self.count += 1
+
+	def wrap(self, capture: Callable[[], PanelFrame]) -> Callable[[], PanelFrame]:
+		"""返回一个边采集边录制的 capture 函数"""
+
+		def recording_capture():
+			frame = capture()
+			self.record(frame)
+			return frame
+
+		return recording_capture
+
+	def close(self) -> None:
+		with self._lock:
+			if self._zip is None:
+				return
+			self._zip.writestr(INDEX_NAME, "\n".join(self._index) + "\n")
+			self._zip.close()
+			self._zip = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+
+def _is_frame_record(name: str) -> bool:
+	return name.startswith("frame_") and name.endswith(".json")
+
+
+def scan_local_members(path: str) -> Dict[str, Tuple[int, int]]:
+	"""
+	顺序扫描 zip 的本地文件头，返回 {成员名: (数据偏移, 长度)}。
+	用于没有中央目录 (录制中途崩溃) 的会话文件；录制时不压缩，数据可以按偏移直接读取。
+	遇到截断的成员或中央目录即停止。
+	"""
+	members = {}
+	with open(path, 'rb') as f:
+		end = f.seek(0, io.SEEK_END)
+		f.seek(0)
+		while True:
+			header = f.read(zipfile.sizeFileHeader)
+			if len(header) < zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+				break
+			fields = struct.unpack(zipfile.structFileHeader, header)
+			compress_size, name_length, extra_length = fields[8], fields[10], fields[11]
+			name = f.read(name_length).decode('utf-8')
+			offset = f.tell() + extra_length
+			if offset + compress_size > end:
+				break
+			members[name] = (offset, compress_size)
+			f.seek(offset + compress_size)
+	return members
+
+
+class FrameReplayer:
+	"""
+	从录制文件中按顺序重建 PanelFrame。
+	没有 index.jsonl 的会话 (录制未正常结束) 按 frame_*.json 成员重建索引。
+	"""
+
+	def __init__(self, path: str):
+		self.path = path
+		# 无法用 ZipFile 打开 (没有中央目录) 时为扫描得到的成员表，否则为 None
+		self._members: Optional[Dict[str, Tuple[int, int]]] = None
+		try:
+			with zipfile.ZipFile(path) as zf:
+				names = zf.namelist()
+				if INDEX_NAME in names:
+					lines = zf.read(INDEX_NAME).decode('utf-8').splitlines()
+				else:
+					lines = [zf.read(name).decode('utf-8') for name in names if _is_frame_record(name)]
+		except zipfile.BadZipFile:
+			self._members = scan_local_members(path)
+			with open(path, 'rb') as f:
+				lines = [self._read_scanned(f, name).decode('utf-8') for name in self._members if _is_frame_record(name)]
+		self.records = sorted((json.loads(line) for line in lines if line), key=lambda rec: rec["index"])
+
+	def __len__(self) -> int:
+		return len(self.records)
+
+	def _read_scanned(self, f, name: str) -> bytes:
+		offset, size = self._members[name]
+		f.seek(offset)
+		return f.read(size)
+
+	def _frames(self, read: Callable[[str], bytes]) -> Iterator[PanelFrame]:
+		from PIL import Image
+
+		for rec in self.records:
+			image = Image.open(io.BytesIO(read(rec["image"])))
+			image.load()
+			controls = {name: Rect(*r) for name, r in rec["controls"].items()}
+			yield PanelFrame(image, Rect(*rec["main_win_coords"]), rec["reactor_texts"],
+							 controls.get("shutter"), controls.get("vacuum"), controls.get("temp"), controls)
+
+	def frames(self) -> Iterator[PanelFrame]:
+		if self._members is None:
+			with zipfile.ZipFile(self.path) as zf:
+				yield from self._frames(zf.read)
+		else:
+			with open(self.path, 'rb') as f:
+				yield from self._frames(lambda name: self._read_scanned(f, name))
+
+	def replay(self, analyze: Callable[[PanelFrame], Any], realtime: bool = False) -> Iterator[Any]:
+		"""
+		把每一帧送入 analyze (例如 read_Lbar5.analyze_frame)，逐帧产出分析结果。
+		realtime=True 时按录制时的时间间隔回放。
+		"""
+		previous = None
+		for rec, frame in zip(self.records, self.frames()):
+			if realtime and previous is not None:
+				time.sleep(max(0.0, rec["timestamp"] - previous))
+			previous = rec["timestamp"]
+			yield analyze(frame)
+
+
+def build_synthetic_session(path: str, frames: int = 20, seed: int = 0) -> None:
+	"""
+	生成一个合成会话 (真空计 / 冷泵温度读数 + 一个快门指示灯)，
+	没有真实录制时可用于在 Linux 上测试回放和基准测试。
+	"""
+	import numpy as np
+	from PIL import Image
+	from glyph_matcher import render_corpus
+
+	rng = np.random.default_rng(seed)
+	vacuum = render_corpus(frames, "vacuum", seed=seed)
+	temp = render_corpus(frames, "temp", seed=seed + 1)
+	main_win_coords = Rect(100, 100, 900, 600)
+	controls = {
+		"reactor": Rect(110, 140, 510, 340),
+		"shutter": Rect(520, 140, 620, 170),
+		"vacuum": Rect(266, 400, 376, 424),
+		"temp": Rect(266, 440, 376, 464),
+	}
+	with FrameRecorder(path) as recorder:
+		for i in range(frames):
+			image = Image.new('RGB', (main_win_coords.width(), main_win_coords.height()), color=(235, 235, 235))
+			# 读数大约每 5 帧变化一次，模拟大部分周期画面不变
+			k = i - i % 5
+			for name, crop in (("vacuum", vacuum[k][0]), ("temp", temp[k][0])):
+				r = controls[name]
+				image.paste(crop.convert('RGB'), (r.left - main_win_coords.left, r.top - main_win_coords.top))
+			led = (30, 230, 30) if rng.random() < 0.5 else (230, 30, 30)
+			x, y = 520 + 20 - main_win_coords.left, 140 + 15 - main_win_coords.top
+			image.paste(led, (x - 4, y - 4, x + 5, y + 5))
+			recorder.record(PanelFrame(image, main_win_coords, [f"cell {i}"], controls["shutter"],
+									   controls["vacuum"], controls["temp"], controls), timestamp=float(i))
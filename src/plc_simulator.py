@@ -0,0 +1,198 @@
+# plc_simulator.py
+
+"""
+本地 Modbus TCP PLC 模拟器 (基于 pymodbus 服务端)，用于在没有真实 PLC 时测试和基准测试读取器。
+
+服务端运行在独立线程的事件循环中；保持寄存器是一个普通列表，测试代码可以随时修改，
+下一次读取即返回新值。latency 可以模拟 PLC 的响应时间 (异步等待，不阻塞其它连接)。
+
+用法:
+	with PLCSimulator({0: 1234, 1: 56}, port=15020, latency=0.005) as plc:
+		reader = LN2SeparatorReader("127.0.0.1", plc.port)
+		...
+		plc.set_registers(0, [1300])
+
+故障注入 (测试重连逻辑):
+	plc.drop_connections()   # 主动断开所有客户端连接 (客户端收到 FIN)
+	plc.drop_every = 10      # 每处理 10 个请求断开一次连接
+	plc.stalled = True       # 不再响应但保持连接 (模拟对端断电/断网造成的半开连接)
+
+需要模拟几十上百台 PLC 时用 SimulatorFarm，把所有模拟器放进同一个后台事件循环。
+"""
+
+import asyncio
+import socket
+import threading
+from typing import Dict, List, Optional, Sequence, Union
+
+from pymodbus.server import ModbusTcpServer
+from pymodbus.simulator import DataType, SimData, SimDevice
+
+from tools import LoggerMixin
+
+
+_allocated_ports = set()
+
+
+def free_port(host: str = "127.0.0.1") -> int:
+	"""
+	向系统申请一个空闲的 TCP 端口。端口在真正监听前会被释放，系统可能把同一个端口
+	再次分配出去，所以记住已经分配过的端口，避免同一进程中的多台模拟器撞车
+	"""
+	while True:
+		with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+			s.bind((host, 0))
+			port = s.getsockname()[1]
+		if port not in _allocated_ports:
+			_allocated_ports.add(port)
+			return port
+
+
+class PLCSimulator(LoggerMixin):
+	"""
+	一个只有保持寄存器的模拟 PLC。registers 为 {地址: 值} 或从地址 0 开始的列表，
+	size 个寄存器之外的地址会返回 Modbus 异常 (与真实 PLC 的非法地址一致)。
+	"""
+
+	def __init__(self, registers: Union[Dict[int, int], Sequence[int], None] = None, host: str = "127.0.0.1",
+				 port: Optional[int] = None, latency: float = 0.0, size: int = 1000):
+		self.host = host
+		self.port = port or free_port(host)
+		self.latency = latency
+		self.size = size
+		self.registers: List[int] = [0] * size
+		self.requests = 0
+		self.drop_every = 0
+		self.stalled = False
+		self.drops = 0
+		if isinstance(registers, dict):
+			for address, value in registers.items():
+				self.registers[address] = value & 0xFFFF
+		elif registers is not None:
+			self.set_registers(0, registers)
+
+		self._loop: Optional[asyncio.AbstractEventLoop] = None
+		self._server: Optional[ModbusTcpServer] = None
+		self._thread: Optional[threading.Thread] = None
+		self._ready = threading.Event()
+
+	def set_registers(self, address: int, values: Sequence[int]) -> None:
+		self.registers[address:address + len(values)] = [v & 0xFFFF for v in values]
+
+	async def _on_access(self, function_code, start_address, address, count, current_registers, set_values):
+		# 每次访问都从 self.registers 刷新响应，使测试代码的修改立即可见
+		self.requests += 1
+		while self.stalled:
+			await asyncio.sleep(0.05)
+		if self.latency > 0:
+			await asyncio.sleep(self.latency)
+		if self.drop_every and self.requests % self.drop_every == 0:
+			# 在本次响应发出之后断开
+			asyncio.get_running_loop().call_soon(self._drop_all)
+		offset = address - start_address
+		if set_values is None:
+			current_registers[offset:offset + count] = self.registers[address:address + count]
+		else:
+			self.registers[address:address + len(set_values)] = list(set_values)
+		return None
+
+	def _drop_all(self) -> None:
+		for connection in list(self._server.active_connections.values()):
+			connection.close()
+		self.drops += 1
+
+	def drop_connections(self) -> None:
+		"""断开所有当前的客户端连接 (服务端继续监听，客户端可以重新连接)"""
+		if self._server is None or self._loop is None:
+			return
+		done = threading.Event()
+
+		def drop():
+			self._drop_all()
+			done.set()
+
+		self._loop.call_soon_threadsafe(drop)
+		done.wait(5)
+
+	async def listen(self) -> None:
+		"""在当前事件循环中创建服务端并开始监听 (SimulatorFarm 用它把多台模拟器放进同一个循环)"""
+		device = SimDevice(id=0, simdata=[SimData(0, count=self.size, values=0, datatype=DataType.REGISTERS)],
+						   action=self._on_access)
+		self._loop = asyncio.get_running_loop()
+		self._server = ModbusTcpServer(device, address=(self.host, self.port))
+		await self._server.serve_forever(background=True)  # 开始监听后立即返回
+
+	async def _serve(self) -> None:
+		await self.listen()
+		self._ready.set()
+		await self._server.serving
+
+	def start(self) -> "PLCSimulator":
+		self._thread = threading.Thread(target=lambda: asyncio.run(self._serve()), name=f"PLCSimulator:{self.port}",
+										daemon=True)
+		self._thread.start()
+		if not self._ready.wait(5):
+			raise RuntimeError(f"PLC 模拟器启动超时: {self.host}:{self.port}")
+		self.logger.info(f"PLC 模拟器已启动: {self.host}:{self.port}")
+		return self
+
+	def stop(self) -> None:
+		if self._server is None or self._loop is None:
+			return
+		asyncio.run_coroutine_threadsafe(self._server.shutdown(), self._loop).result(5)
+		if self._thread is not None:
+			self._thread.join(5)
+		self._server = None
+		self.logger.info(f"PLC 模拟器已停止: {self.host}:{self.port}")
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.stop()
+
+
+class SimulatorFarm(LoggerMixin):
+	"""
+	在同一个后台事件循环中运行多台模拟 PLC (每台一个端口)，
+	用于模拟几十到几百台设备而不必为每台开一个线程。
+	"""
+
+	def __init__(self, simulators: Sequence[PLCSimulator]):
+		self.simulators = list(simulators)
+		self._loop: Optional[asyncio.AbstractEventLoop] = None
+		self._thread: Optional[threading.Thread] = None
+		self._ready = threading.Event()
+		self._done: Optional[asyncio.Future] = None
+
+	async def _serve(self) -> None:
+		self._loop = asyncio.get_running_loop()
+		self._done = self._loop.create_future()
+		for sim in self.simulators:
+			await sim.listen()
+		self._ready.set()
+		await self._done
+		for sim in self.simulators:
+			await sim._server.shutdown()
+			sim._server = None
+
+	def start(self) -> "SimulatorFarm":
+		self._thread = threading.Thread(target=lambda: asyncio.run(self._serve()), name="SimulatorFarm", daemon=True)
+		self._thread.start()
+		if not self._ready.wait(30):
+			raise RuntimeError("PLC 模拟器组启动超时")
+		self.logger.info(f"已启动 {len(self.simulators)} 台 PLC 模拟器")
+		return self
+
+	def stop(self) -> None:
+		if self._loop is None or self._done is None:
+			return
+		self._loop.call_soon_threadsafe(self._done.set_result, None)
+		self._thread.join(10)
+		self._loop = None
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.stop()
@@ -0,0 +1,297 @@
+# polling_engine.py
+
+"""
+Molly 2000 面板的连续流水线轮询引擎。
+
+read_Lbar5.main 是一次性的脚本：连接、截图一次、分析、退出。这里把它的两个阶段拆成
+两个线程组成的流水线：
+
+	[采集线程] --(有界队列)--> [分析线程] --> on_result 回调
+
+- 采集线程按配置的采样率调用 capture()，即 "阶段 1 GUI交互"；
+- 分析线程调用 analyze(frame)，即 "阶段 2 离线分析"；
+- 第 N 帧分析的同时，第 N+1 帧已经在采集，两者互相重叠；
+- 队列满时按丢帧策略处理：
+	'block'       - 采集线程阻塞等待 (背压，采样率自动降低)
+	'drop_oldest' - 丢弃队列中最旧的一帧，保证分析的总是最新画面
+	'drop_newest' - 丢弃刚采集到的这一帧
+- stats() 报告实际吞吐量和每帧端到端延迟 (采集开始 -> 分析结束)。
+
+capture / analyze 只是普通的可调用对象，与 GUI 无关，可以用假数据测试。
+"""
+
+import argparse
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from tools import LoggerMixin, setup_logger
+
+DROP_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+_STOP = object()  # 通知分析线程退出的哨兵
+
+
+class PollingEngine(LoggerMixin):
+	"""
+	两级流水线轮询引擎
+	"""
+
+	def __init__(self, capture: Callable[[], Any], analyze: Callable[[Any], Any],
+				 sample_rate: float = 1.0, queue_size: int = 2, drop_policy: str = "drop_oldest",
+				 on_result: Optional[Callable[[int, Any, float], None]] = None,
+				 latency_window: int = 1000):
+		if drop_policy not in DROP_POLICIES:
+			raise ValueError(f"未知的丢帧策略: {drop_policy}，可选: {DROP_POLICIES}")
+		if sample_rate <= 0:
+			raise ValueError("采样率必须大于 0")
+		self.capture = capture
+		self.analyze = analyze
+		self.interval = 1.0 / sample_rate
+		self.drop_policy = drop_policy
+		self.on_result = on_result
+
+		self._queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+		self._stop_event = threading.Event()
+		self._threads = []
+		self._stats_lock = threading.Lock()
+		self._latencies = deque(maxlen=latency_window)
+		self._started_at: Optional[float] = None
+		self._stopped_at: Optional[float] = None
+		self.captured = 0
+		self.analysed = 0
+		self.dropped = 0
+		self.capture_errors = 0
+		self.analyse_errors = 0
+		self.overruns = 0
+
+	# --- 生命周期 ---
+
+	def start(self) -> None:
+		if self._threads:
+			raise RuntimeError("轮询引擎已在运行")
+		self._stop_event.clear()
+		self._started_at = time.perf_counter()
+		self._stopped_at = None
+		self._threads = [
+			threading.Thread(target=self._capture_loop, name="panel-capture", daemon=True),
+			threading.Thread(target=self._analyse_loop, name="panel-analyse", daemon=True),
+		]
+		for t in self._threads:
+			t.start()
+		self.logger.info(f"轮询引擎已启动: 间隔 {self.interval:.3f} s, 丢帧策略 {self.drop_policy}")
+
+	def stop(self, timeout: float = 10.0) -> None:
+		"""停止采集，等待队列中剩余的帧分析完毕"""
+		self._stop_event.set()
+		for t in self._threads:
+			t.join(timeout)
+		self._threads = []
+		self._stopped_at = time.perf_counter()
+		self.logger.info(f"轮询引擎已停止: {self.stats()}")
+
+	def run_for(self, seconds: float) -> Dict[str, float]:
+		"""运行指定时长后停止，返回统计信息"""
+		self.start()
+		try:
+			self._stop_event.wait(seconds)
+		finally:
+			self.stop()
+		return self.stats()
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.stop()
+
+	# --- 两个阶段 ---
+
+	def _enqueue(self, item) -> None:
+		if self.drop_policy == "block":
+			while not self._stop_event.is_set():
+				try:
+					self._queue.put(item, timeout=0.1)
+					return
+				except queue.Full:
+					continue
+			self._count_drop()
+			return
+
+		try:
+			self._queue.put_nowait(item)
+			return
+		except queue.Full:
+			pass
+		if self.drop_policy == "drop_newest":
+			self._count_drop()
+			return
+		# drop_oldest: 腾出一个位置再放入 (分析线程可能同时取走，所以用 nowait)
+		try:
+			self._queue.get_nowait()
+			self._count_drop()
+		except queue.Empty:
+			pass
+		try:
+			self._queue.put_nowait(item)
+		except queue.Full:
+			self._count_drop()
+
+	def _count_drop(self) -> None:
+		with self._stats_lock:
+			self.dropped += 1
+
+	def _capture_loop(self) -> None:
+		next_deadline = time.perf_counter()
+		index = 0
+		try:
+			while not self._stop_event.is_set():
+				captured_at = time.perf_counter()
+				try:
+					frame = self.capture()
+				except Exception as e:
+					with self._stats_lock:
+						self.capture_errors += 1
+					self.logger.error(f"采集第 {index} 帧失败: {e}")
+				else:
+					with self._stats_lock:
+						self.captured += 1
+					self._enqueue((index, captured_at, frame))
+				index += 1
+
+				next_deadline += self.interval
+				now = time.perf_counter()
+				if next_deadline < now:
+					# 采集本身比采样间隔还慢：不补采，直接从现在重新计时
+					with self._stats_lock:
+						self.overruns += 1
+					next_deadline = now
+				else:
+					self._stop_event.wait(next_deadline - now)
+		finally:
+			# 无论采集线程如何退出，都要让分析线程结束
+			self._queue.put(_STOP)
+
+	def _analyse_loop(self) -> None:
+		while True:
+			item = self._queue.get()
+			if item is _STOP:
+				return
+			index, captured_at, frame = item
+			try:
+				result = self.analyze(frame)
+			except Exception as e:
+				with self._stats_lock:
+					self.analyse_errors += 1
+				self.logger.error(f"分析第 {index} 帧失败: {e}")
+				continue
+			latency = time.perf_counter() - captured_at
+			with self._stats_lock:
+				self.analysed += 1
+				self._latencies.append(latency)
+			if self.on_result is not None:
+				try:
+					self.on_result(index, result, latency)
+				except Exception as e:
+					self.logger.error(f"处理第 {index} 帧结果时发生错误: {e}")
+
+	# --- 统计 ---
+
+	def stats(self) -> Dict[str, float]:
+		with self._stats_lock:
+			end = self._stopped_at or time.perf_counter()
+			elapsed = end - self._started_at if self._started_at else 0.0
+			latencies = sorted(self._latencies)
+			result = {
+				"captured": self.captured,
+				"analysed": self.analysed,
+				"dropped": self.dropped,
+				"capture_errors": self.capture_errors,
+				"analyse_errors": self.analyse_errors,
+				"overruns": self.overruns,
+				"throughput_hz": self.analysed / elapsed if elapsed > 0 else 0.0,
+			}
+		if latencies:
+			result["latency_mean_ms"] = sum(latencies) / len(latencies) * 1000
+			result["latency_p95_ms"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+			result["latency_max_ms"] = latencies[-1] * 1000
+		return result
+
+
+def main():
+	from screen_capture import CAPTURE_MODES, RoiCapture, create_backend
+
+	parser = argparse.ArgumentParser(description="连续轮询 Molly 2000 面板")
+	parser.add_argument("--rate", type=float, default=1.0, help="采样率 (Hz)")
+	parser.add_argument("--duration", type=float, default=0, help="运行时长 (秒)，0 表示一直运行到 Ctrl+C")
+	parser.add_argument("--queue-size", type=int, default=2, help="采集与分析之间的队列长度")
+	parser.add_argument("--drop-policy", choices=DROP_POLICIES, default="drop_oldest", help="队列满时的丢帧策略")
+	parser.add_argument("--executor", choices=("serial", "thread", "process"), default="serial",
+						help="阶段 2 区域任务的执行方式")
+	parser.add_argument("--workers", type=int, default=None, help="thread/process 模式的工作者数量")
+	parser.add_argument("--record", type=str, default=None, help="把采集到的帧录制到该 zip 文件 (见 panel_frame.py)")
+	parser.add_argument("--store", type=str, default=None, help="把读数写入该时序数据库 (见 timeseries_store.py)")
+	parser.add_argument("--capture-mode", choices=CAPTURE_MODES, default="auto",
+						help="屏幕采集方式 (见 screen_capture.py)；录制完整的主窗口画面时用 window")
+	args = parser.parse_args()
+
+	import read_Lbar5
+	from analysis_executor import AnalysisExecutor
+
+	setup_logger()
+	read_Lbar5.SCREEN_CAPTURE = RoiCapture(create_backend(), args.capture_mode)
+	# pywinauto 的连接在采集线程中建立；Molly 重启或窗口失效时下一帧自动重新连接
+	molly = read_Lbar5.MollyAttachment()
+	capture = molly.capture
+
+	store = None
+	if args.store:
+		from timeseries_store import TimeSeriesStore
+
+		store = TimeSeriesStore(args.store)
+
+	def on_result(index, results, latency):
+		if store is not None:
+			store.append_readings(results)
+		print(f"[帧 {index}] 延迟 {latency * 1000:.0f} ms | 快门: {results['shutter']} | "
+			  f"真空: {results['vacuum']} | 冷泵温度: {results['temp']}")
+
+	recorder = None
+	if args.record:
+		from panel_frame import FrameRecorder
+
+		recorder = FrameRecorder(args.record)
+		capture = recorder.wrap(capture)
+
+	executor = AnalysisExecutor(args.executor, max_workers=args.workers)
+	engine = PollingEngine(capture, lambda frame: read_Lbar5.analyze_frame(frame, executor),
+						   sample_rate=args.rate, queue_size=args.queue_size, drop_policy=args.drop_policy,
+						   on_result=on_result)
+	engine.start()
+	try:
+		if args.duration > 0:
+			time.sleep(args.duration)
+		else:
+			while True:
+				time.sleep(1)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		engine.stop()
+		executor.close()
+		molly.close()
+		if recorder is not None:
+			recorder.close()
+			print(f"已录制 {recorder.count} 帧到 {args.record}")
+		if store is not None:
+			store.close()
+			print(f"已写入 {store.rows_written} 个样本到 {args.store}")
+	print(f"\n轮询统计: {engine.stats()}")
+	print(f"屏幕采集: {read_Lbar5.SCREEN_CAPTURE.stats()}")
+
+
+if __name__ == "__main__":
+	main()
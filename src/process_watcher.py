@@ -0,0 +1,381 @@
+# process_watcher.py
+
+"""
+增量维护的进程索引: 进程名 -> PID，用于找到 Lbar5.exe 并在 Molly 重启后自动重新连接。
+
+tools.get_pids_by_name 原来每次调用都用 psutil.process_iter 遍历全部进程并读取名称；
+read_Lbar5 取其中的 [0]，Molly 一重启脚本就失败，直到有人手工重新运行。这里:
+
+- 每次扫描只取一次 PID 列表 (psutil.pids()，很便宜)，与上一次的集合求差: 只有新出现的 PID
+  才读取名称和创建时间，消失的 PID 记为退出；
+- 进程以 (pid, create_time) 标识。被关注的进程名 (subscribe 过的) 每次扫描都核对创建时间 /
+  僵尸状态，其余进程每 verify_every 次扫描核对一次，PID 被复用时产生 "exit" + "appear" 两个事件；
+- pids(name) / find(name) 是一次字典查找；subscribe(name, callback) 在后台扫描线程上收到
+  ProcessEvent，consumer 据此重新连接；
+- sample(key) 用缓存的 psutil.Process 对象读取 CPU 占用 (与上一次采样之间的平均值) 和内存，
+  只对关心的进程采样。
+"""
+
+import argparse
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import psutil
+
+from tools import LoggerMixin
+
+
+class ProcessKey(NamedTuple):
+	pid: int
+	create_time: float
+
+
+@dataclass
+class ProcessEvent:
+	kind: str  # "appear" / "exit"
+	key: ProcessKey
+	name: str
+
+	@property
+	def pid(self) -> int:
+		return self.key.pid
+
+
+@dataclass
+class ProcessSample:
+	cpu_percent: float  # 与上一次采样之间的平均值，100 表示占满一个核
+	rss: int  # 常驻内存 (字节)
+	threads: int
+
+
+def _identify(pid: int) -> Optional[Tuple[str, float]]:
+	"""读取 (名称, 创建时间)；进程已经退出时返回 None。无权读取的系统进程也记入索引 (只读一次)"""
+	try:
+		proc = psutil.Process(pid)
+		with proc.oneshot():
+			try:
+				name = proc.name()
+			except psutil.AccessDenied:
+				name = ""
+			try:
+				create_time = proc.create_time()
+			except psutil.AccessDenied:
+				create_time = 0.0  # 无法核对 PID 复用
+			try:
+				if proc.status() == psutil.STATUS_ZOMBIE:
+					return None
+			except psutil.AccessDenied:
+				pass
+		return name, create_time
+	except (psutil.NoSuchProcess, psutil.ZombieProcess):
+		return None
+
+
+class ProcessWatcher(LoggerMixin):
+
+	def __init__(self, interval: float = 1.0, verify_every: int = 30):
+		self.interval = interval
+		self.verify_every = verify_every
+		self._lock = threading.Condition()
+		self._procs: Dict[int, Tuple[float, str]] = {}  # pid -> (创建时间, 名称小写)
+		self._names: Dict[int, str] = {}  # pid -> 原始名称
+		self._by_name: Dict[str, Dict[int, float]] = {}  # 名称小写 -> {pid: 创建时间}
+		self._listeners: List[Tuple[Optional[str], Callable[[ProcessEvent], None]]] = []
+		self._watched: Set[str] = set()
+		self._handles: Dict[ProcessKey, psutil.Process] = {}
+		self._running = False
+		self._thread: Optional[threading.Thread] = None
+		self.scans = 0
+		self.identified = 0  # 读取过名称的进程数 (增量扫描的工作量)
+		self.last_scan_time = 0.0
+
+	# --- 扫描 ---
+
+	def scan(self) -> List[ProcessEvent]:
+		"""扫描一次，返回本次产生的事件 (同时分发给订阅者)"""
+		start_time = time.perf_counter()
+		current = set(psutil.pids())
+		with self._lock:
+			known = set(self._procs)
+			watched = {pid for name in self._watched for pid in self._by_name.get(name, ())}
+		full_verify = self.verify_every > 0 and self.scans % self.verify_every == 0 and self.scans > 0
+
+		events: List[ProcessEvent] = []
+		removed: List[int] = list(known - current)
+		added: Dict[int, Tuple[str, float]] = {}
+		for pid in (known & current) if full_verify else (watched & current):
+			identity = _identify(pid)
+			create_time = self._procs[pid][0]
+			if identity is None:
+				removed.append(pid)
+			elif identity[1] != create_time:
+				removed.append(pid)  # PID 被复用
+				added[pid] = identity
+		for pid in current - known:
+			identity = _identify(pid)
+			self.identified += 1
+			if identity is not None:
+				added[pid] = identity
+
+		with self._lock:
+			for pid in removed:
+				entry = self._procs.pop(pid, None)
+				if entry is None:
+					continue
+				create_time, lower = entry
+				name = self._names.pop(pid, lower)
+				pids = self._by_name.get(lower)
+				if pids is not None:
+					pids.pop(pid, None)
+					if not pids:
+						del self._by_name[lower]
+				key = ProcessKey(pid, create_time)
+				self._handles.pop(key, None)
+				events.append(ProcessEvent("exit", key, name))
+			for pid, (name, create_time) in added.items():
+				lower = name.lower()
+				self._procs[pid] = (create_time, lower)
+				self._names[pid] = name
+				self._by_name.setdefault(lower, {})[pid] = create_time
+				events.append(ProcessEvent("appear", ProcessKey(pid, create_time), name))
+			self.scans += 1
+			self.last_scan_time = time.perf_counter() - start_time
+			listeners = list(self._listeners)
+			self._lock.notify_all()
+
+		for event in events:
+			lower = event.name.lower()
+			for name, callback in listeners:
+				if name is None or name == lower:
+					try:
+						callback(event)
+					except Exception as e:
+						self.logger.error(f"进程事件回调出错 ({event.kind} {event.name}): {e}", exc_info=True)
+		return events
+
+	# --- 查询 ---
+
+	def pids(self, name: str) -> List[int]:
+		"""名称匹配 (不区分大小写) 的 PID，按创建时间排序"""
+		with self._lock:
+			pids = self._by_name.get(name.lower())
+			return [pid for pid, _ in sorted(pids.items(), key=lambda item: item[1])] if pids else []
+
+	def find(self, name: str) -> Optional[ProcessKey]:
+		"""名称匹配的最早启动的进程，没有时返回 None"""
+		with self._lock:
+			pids = self._by_name.get(name.lower())
+			if not pids:
+				return None
+			pid, create_time = min(pids.items(), key=lambda item: item[1])
+			return ProcessKey(pid, create_time)
+
+	def is_alive(self, key: ProcessKey) -> bool:
+		with self._lock:
+			entry = self._procs.get(key.pid)
+			return entry is not None and entry[0] == key.create_time
+
+	def wait_for(self, name: str, timeout: Optional[float] = None) -> Optional[ProcessKey]:
+		"""等待名称匹配的进程出现 (需要后台线程在运行，或由其它线程调用 scan())"""
+		deadline = None if timeout is None else time.monotonic() + timeout
+		with self._lock:
+			while True:
+				pids = self._by_name.get(name.lower())
+				if pids:
+					pid, create_time = min(pids.items(), key=lambda item: item[1])
+					return ProcessKey(pid, create_time)
+				remaining = None if deadline is None else deadline - time.monotonic()
+				if remaining is not None and remaining <= 0:
+					return None
+				self._lock.wait(remaining)
+
+	def subscribe(self, name: Optional[str], callback: Callable[[ProcessEvent], None]) -> None:
+		"""name 为 None 时接收全部事件；订阅的名称每次扫描都核对 PID 复用"""
+		with self._lock:
+			self._listeners.append((name.lower() if name else None, callback))
+			if name:
+				self._watched.add(name.lower())
+
+	def unsubscribe(self, callback: Callable[[ProcessEvent], None]) -> None:
+		with self._lock:
+			self._listeners = [(name, cb) for name, cb in self._listeners if cb != callback]
+			self._watched = {name for name, _ in self._listeners if name}
+
+	# --- 资源采样 ---
+
+	def sample(self, key: ProcessKey) -> Optional[ProcessSample]:
+		"""读取进程的 CPU / 内存；第一次采样的 CPU 为 0 (需要两次采样之间的差)。进程已退出时返回 None"""
+		with self._lock:
+			proc = self._handles.get(key)
+			if proc is None:
+				if not self.is_alive(key):
+					return None
+				proc = self._handles[key] = psutil.Process(key.pid)
+		try:
+			with proc.oneshot():
+				if proc.create_time() != key.create_time and key.create_time:
+					raise psutil.NoSuchProcess(key.pid)
+				return ProcessSample(proc.cpu_percent(None), proc.memory_info().rss, proc.num_threads())
+		except (psutil.NoSuchProcess, psutil.AccessDenied):
+			with self._lock:
+				self._handles.pop(key, None)
+			return None
+
+	# --- 后台线程 ---
+
+	def start(self) -> "ProcessWatcher":
+		"""先同步扫描一次 (之后的查询立即可用)，再在后台线程中每 interval 秒扫描"""
+		if self._running:
+			return self
+		self.scan()
+		self._running = True
+		self._thread = threading.Thread(target=self._run, name="ProcessWatcher", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		self._running = False
+		if self._thread is not None:
+			self._thread.join(self.interval + 2)
+			self._thread = None
+
+	def _run(self) -> None:
+		while self._running:
+			time.sleep(self.interval)
+			try:
+				self.scan()
+			except Exception as e:
+				self.logger.error(f"扫描进程表失败: {e}", exc_info=True)
+
+
+_default_watcher: Optional[ProcessWatcher] = None
+_default_lock = threading.Lock()
+
+
+def default_watcher() -> ProcessWatcher:
+	"""进程内默认的 ProcessWatcher (第一次使用时创建并启动后台扫描)"""
+	global _default_watcher
+	with _default_lock:
+		if _default_watcher is None:
+			_default_watcher = ProcessWatcher().start()
+		return _default_watcher
+
+
+# --- 基准测试 / 故障测试：用假的子进程模拟 Lbar5.exe 重启 ---
+
+def main():
+	parser = argparse.ArgumentParser(description="process_iter 全量遍历 vs 增量进程索引；模拟 Lbar5 重启 (Linux)")
+	parser.add_argument("--background", type=int, default=200, help="额外启动的无关子进程数 (模拟桌面上的进程数)")
+	parser.add_argument("--lookups", type=int, default=200, help="查找次数")
+	parser.add_argument("--restarts", type=int, default=3, help="模拟 Lbar5 重启的次数")
+	parser.add_argument("--interval", type=float, default=0.2, help="扫描间隔 (秒)")
+	args = parser.parse_args()
+
+	import subprocess
+	import sys
+	import tempfile
+
+	target = "Lbar5.exe"
+	workdir = tempfile.mkdtemp()
+	# 进程名 (Linux 上为 comm) 取自可执行文件名: 用一个指向 python 的符号链接扮演 Lbar5.exe
+	fake_exe = os.path.join(workdir, target)
+	os.symlink(sys.executable, fake_exe)
+	script = "import time, sys\nbusy = len(sys.argv) > 1\nend = time.time() + 600\n" \
+			 "while time.time() < end:\n    if busy:\n        sum(range(20000))\n    else:\n        time.sleep(1)\n"
+
+	def spawn(busy: bool = False) -> subprocess.Popen:
+		return subprocess.Popen([fake_exe, "-c", script] + (["busy"] if busy else []))
+
+	def legacy_pids(name: str) -> List[int]:
+		# 原 tools.get_pids_by_name
+		pids = []
+		for proc in psutil.process_iter(['pid', 'name']):
+			if proc.info['name'].lower() == name.lower():
+				pids.append(proc.info['pid'])
+		return pids
+
+	background = [subprocess.Popen(["sleep", "600"]) for _ in range(args.background)]
+	molly = spawn(busy=True)
+	try:
+		time.sleep(0.5)
+		print(f"进程表: {len(psutil.pids())} 个进程")
+
+		start_time = time.perf_counter()
+		for _ in range(args.lookups):
+			found = legacy_pids(target)
+		legacy = (time.perf_counter() - start_time) / args.lookups
+		print(f"process_iter 全量遍历:   每次查找 {legacy * 1000:7.3f} ms -> {found}")
+
+		watcher = ProcessWatcher(interval=args.interval)
+		start_time = time.perf_counter()
+		watcher.scan()
+		first_scan = time.perf_counter() - start_time
+		start_time = time.perf_counter()
+		for _ in range(args.lookups * 100):
+			found = watcher.pids(target)
+		indexed = (time.perf_counter() - start_time) / (args.lookups * 100)
+		scans = []
+		for _ in range(20):
+			start_time = time.perf_counter()
+			watcher.scan()
+			scans.append(time.perf_counter() - start_time)
+		print(f"增量索引:               每次查找 {indexed * 1e6:7.2f} us -> {found}; 首次扫描 {first_scan * 1000:.1f} ms, "
+			  f"之后每次增量扫描 {sorted(scans)[len(scans) // 2] * 1000:.2f} ms (p50)")
+
+		# Lbar5 重启: consumer 订阅退出 / 出现事件并重新连接
+		events: List[Tuple[float, ProcessEvent]] = []
+		reattached = []
+		attached = {"key": watcher.find(target)}
+
+		def on_event(event: ProcessEvent):
+			events.append((time.perf_counter(), event))
+			if event.kind == "exit" and event.key == attached["key"]:
+				attached["key"] = None
+			elif event.kind == "appear" and attached["key"] is None:
+				attached["key"] = event.key
+				reattached.append(event.key)
+
+		watcher.subscribe(target, on_event)
+		watcher.start()
+		detect_exit = []
+		detect_appear = []
+		for _ in range(args.restarts):
+			killed_at = time.perf_counter()
+			molly.kill()
+			molly.wait()  # 回收，否则在 Linux 上会留下僵尸进程
+			molly = spawn(busy=True)
+			spawned_at = time.perf_counter()
+			while len(reattached) < len(detect_appear) + 1 and time.perf_counter() - spawned_at < 5:
+				time.sleep(0.01)
+			exits = [t for t, e in events if e.kind == "exit" and t >= killed_at]
+			appears = [t for t, e in events if e.kind == "appear" and t >= spawned_at]
+			detect_exit.append((exits[0] - killed_at) if exits else float("nan"))
+			detect_appear.append((appears[0] - spawned_at) if appears else float("nan"))
+		print(f"模拟重启 {args.restarts} 次: 重新连接 {len(reattached)} 次, "
+			  f"发现退出平均 {sum(detect_exit) / len(detect_exit) * 1000:.0f} ms, "
+			  f"发现新进程平均 {sum(detect_appear) / len(detect_appear) * 1000:.0f} ms (扫描间隔 {args.interval * 1000:.0f} ms), "
+			  f"当前 PID {attached['key'].pid if attached['key'] else None} (实际 {molly.pid})")
+
+		key = watcher.find(target)
+		watcher.sample(key)
+		time.sleep(0.5)
+		start_time = time.perf_counter()
+		sample = watcher.sample(key)
+		cost = time.perf_counter() - start_time
+		print(f"资源采样: CPU {sample.cpu_percent:.0f}%, 内存 {sample.rss / 1e6:.1f} MB, 线程 {sample.threads}, "
+			  f"每次采样 {cost * 1e6:.0f} us")
+		watcher.stop()
+	finally:
+		for proc in background + [molly]:
+			proc.kill()
+		for proc in background + [molly]:
+			proc.wait()
+		os.unlink(fake_exe)
+		os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+	main()
@@ -8,26 +8,83 @@
 1.  **短暂交互**: 脚本会一次性完成所有GUI操作（获取文本、获取控件坐标、截取主窗口图像）。
 2.  **离线分析**: 之后的所有图像处理（像素取色、OCR）都在截取的图像上进行，不再打扰GUI。
 
+两个阶段分别对应 capture_frame() 和 analyze_frame() (控件定位结果由 create_locator() 缓存)；需要连续轮询时使用 polling_engine.py，
+它会让第 N+1 帧的采集与第 N 帧的分析重叠进行。
+
 安装前置库:
-pip install pywinauto Pillow pytesseract pyautogui
+pip install pywinauto Pillow pytesseract tesserocr
 
 注意:
 1. 请确保已安装 Google Tesseract OCR 引擎并将其添加到系统的 PATH 环境变量中。
 2. Tesseract 是一个完全离线的工具，运行时不会联网。
 """
 
-import pyautogui
-import pytesseract
-from pywinauto.application import Application
-from PIL import ImageEnhance  # 导入 Pillow 图像增强模块
+from typing import Any, Dict, Optional
 
-from tools import get_pids_by_name
+from analysis_executor import AnalysisExecutor, RegionTask
+from control_locator import ControlLocator, ControlSpec, PywinautoBackend
+from frame_preprocess import FramePreprocessor, PreprocessedFrame
+from glyph_matcher import GlyphAtlas, GlyphRecognizer
+from indicator_classifier import Indicator, IndicatorTable
+from metrics import stage_timer
+from ocr_engine import get_default_pool, set_tesseract_cmd
+from panel_frame import PanelFrame
+from process_watcher import ProcessEvent, ProcessKey, ProcessWatcher, default_watcher
+from region_cache import RegionChangeDetector, region_box
+from screen_capture import RoiCapture, create_backend
 
 # --- 1. 用户配置 (User Configuration) ---
 MOLLY_MAIN_PANEL = "Lbar5.exe"
 
 # 如果 Tesseract OCR 引擎不在系统的 PATH 环境变量中，请取消下面的注释并指定其可执行文件路径
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+# (仅在 tesserocr 不可用、回退到 pytesseract 时使用；tesserocr 的 tessdata 路径见 ocr_engine.TESSDATA_PATH)
+# pywinauto / pytesseract 都在首次连接、回退识别时才导入，导入本模块不加载它们
+set_tesseract_cmd(r'C:\Program Files\Tesseract-OCR\tesseract.exe')
+
+# 需要读取的控件定位参数 (传给 child_window() 的关键字参数)
+### TODO ###: 根据 find_controls_and_print 的输出修改这里的定位参数
+CONTROL_SPECS = [
+	ControlSpec("reactor", {"class_name": "ListView20WndClass", "found_index": 3}),
+	ControlSpec("shutter", {"title": "Shutter", "found_index": 0}),
+	ControlSpec("vacuum", {"class_name": "Static", "found_index": 10}),
+	ControlSpec("temp", {"class_name": "Static", "found_index": 12}),
+]
+
+# 指示灯表: (名称, 所在控件, 相对控件左上角的偏移)。偏移量需要您精确测量；
+# 新的快门/阀门指示灯只需在这里添加一行 (所在控件需在 CONTROL_SPECS 中声明)
+INDICATORS = IndicatorTable([
+	Indicator("shutter", "shutter", (20, 15)),
+])
+
+# 固定字体读数的字形图集 (由 glyph_matcher.GlyphAtlas.from_labeled_crops 生成，
+# 样本应是经过 GAUGE_PREPROCESSOR 预处理的区域，即 get_reading_from_preprocessed 实际看到的像素)。
+# 图集文件不存在或匹配置信度低于阈值时，回退到 Tesseract OCR。
+VACUUM_WHITELIST = '0123456789.E-'
+TEMP_WHITELIST = '0123456789Kk.'
+GLYPH_ATLAS_PATHS = {
+	VACUUM_WHITELIST: "glyphs/vacuum.npz",
+	TEMP_WHITELIST: "glyphs/temp.npz",
+}
+GLYPH_MIN_CONFIDENCE = 0.8
+
+# 屏幕采集：只截取阶段 2 实际分析的控件 (指示灯所在控件 + 读数)，后端按系统自动选择 (Windows 上为 GDI)。
+# 其它控件 (如源炉列表) 只读取文本，不截图
+CAPTURE_CONTROLS = sorted(set(INDICATORS.panels) | {"vacuum", "temp"})
+SCREEN_CAPTURE = RoiCapture(create_backend())
+
+# 区域像素指纹缓存：读数区域像素与上一帧相同时直接复用上次的识别结果
+REGION_CACHE = RegionChangeDetector()
+
+# 读数区域的预处理：灰度 + 对比度 2.0。每个区域以自身平均灰度为支点，
+# 与原来逐区域 ImageEnhance.Contrast(2.0) 的输出逐像素相同，也不受外接矩形中其他区域影响
+GAUGE_PREPROCESSOR = FramePreprocessor(contrast=2.0, per_region=True)
+
+# 未指定执行器时在当前线程中依次分析各区域
+_SERIAL_EXECUTOR = AnalysisExecutor("serial")
+
+# 各阶段耗时 (metrics.py 的 stage_seconds{component="read_Lbar5", stage=...})
+_TIMERS = {stage: stage_timer("read_Lbar5", stage)
+		   for stage in ("gui_connect", "locate", "screenshot", "indicators", "preprocess", "ocr")}
 
 
 # --- 2. 辅助函数 (Helper Functions) ---
@@ -72,86 +129,197 @@ def get_shutter_status_from_image(main_screenshot_pil, main_win_coords, panel_co
 		return f"Unknown (R={r}, G={g}, B={b})"
 
 
-def get_reading_ocr_from_image(main_screenshot_pil, main_win_coords, panel_coords, whitelist):
+_glyph_recognizers = {}
+
+
+def _get_glyph_recognizer(whitelist):
+	"""按白名单惰性加载字形识别器，图集不存在时返回 None"""
+	if whitelist not in _glyph_recognizers:
+		recognizer = None
+		atlas_path = GLYPH_ATLAS_PATHS.get(whitelist)
+		if atlas_path:
+			try:
+				recognizer = GlyphRecognizer(GlyphAtlas.load(atlas_path), GLYPH_MIN_CONFIDENCE)
+			except (OSError, KeyError, ValueError) as e:
+				print(f"未能加载字形图集 '{atlas_path}'，将使用 OCR: {e}")
+		_glyph_recognizers[whitelist] = recognizer
+	return _glyph_recognizers[whitelist]
+
+
+def get_reading_from_preprocessed(preprocessed: PreprocessedFrame, main_win_coords, panel_coords, whitelist):
 	"""
-    (离线分析) 从已截取的图像中 OCR 获取仪表读数。
-    使用 Pillow (PIL) 进行图像处理。
+    (离线分析) 在整帧预处理 (灰度 + 对比度查表) 的结果上读取仪表读数。
+    区域只是灰度数组的切片视图，直接交给字形匹配，置信度不足时再交给 OCR 引擎。
     """
-	try:
-		# 1. 计算要裁剪区域在主截图中的相对坐标
-		crop_x_start = panel_coords.left - main_win_coords.left
-		crop_y_start = panel_coords.top - main_win_coords.top
-		crop_x_end = panel_coords.right - main_win_coords.left
-		crop_y_end = panel_coords.bottom - main_win_coords.top
-
-		# 2. 从主截图中裁剪出目标区域 (Pillow crop 使用 (left, upper, right, lower))
-		box = (crop_x_start, crop_y_start, crop_x_end, crop_y_end)
-		cropped_image = main_screenshot_pil.crop(box)
-
-		# --- 图像预处理 (Pillow) ---
-		# 3. 转换为灰度图
-		gray_image = cropped_image.convert('L')
-		# 4. 增强对比度 (等同于 cv2.convertScaleAbs(alpha=2.0))
-		enhancer = ImageEnhance.Contrast(gray_image)
-		contrast_image = enhancer.enhance(2.0)
-
-		# --- OCR 配置 ---
-		custom_config = f'--psm 7 -c tessedit_char_whitelist={whitelist}'
-		# pytesseract 直接支持 Pillow 图像对象
-		text = pytesseract.image_to_string(contrast_image, config=custom_config)
-		return text.strip()
-	except Exception as e:
-		return f"OCR Error: {e}"
+	view = preprocessed.region(region_box(main_win_coords, panel_coords))
+	ocr = lambda: get_default_pool().recognize(view, whitelist, psm=7)
+	recognizer = _get_glyph_recognizer(whitelist)
+	if recognizer is None:
+		return ocr()
+	return recognizer.read(view, whitelist, fallback=ocr)
+
+
+# --- 3. 两个阶段 (Stages) ---
+
+def connect_main_window(pid: Optional[int] = None):
+	"""连接 Molly 主窗口；未指定 pid 时在进程索引中查找 Lbar5.exe"""
+	if pid is None:
+		key = default_watcher().find(MOLLY_MAIN_PANEL)
+		if key is None:
+			raise ProcessLookupError(f"could not get access to molly ! (未找到进程 {MOLLY_MAIN_PANEL})")
+		pid = key.pid
+	print(f"正在连接到进程 PID: {pid}...")
+	from pywinauto.application import Application
+
+	with _TIMERS["gui_connect"].time():
+		app = Application(backend="win32").connect(process=pid)
+		main_window = app.window(title_re="Molly 2000.*")
+		main_window.wait('visible', timeout=10)
+		main_window.set_focus()
+	print(f"成功连接到主窗口: '{main_window.window_text()}'")
+	return main_window
+
+
+def create_locator(main_window) -> ControlLocator:
+	"""为主窗口创建控件定位缓存；控件树只在窗口变化后才重新遍历"""
+	# 运行此函数来查找您需要的控件信息！
+	# find_controls_and_print(main_window)
+	return ControlLocator(PywinautoBackend(main_window), CONTROL_SPECS)
+
+
+class MollyAttachment:
+	"""
+	连续轮询用的 Molly 连接: 缓存主窗口连接和控件定位器，Lbar5.exe 退出 (或以新进程重启) 时由
+	进程监视器通知，下一次 locator() 自动连接新的进程；采集出错时调用 invalidate() 强制重新连接。
+	locator() 应始终在同一个线程 (采集线程) 中调用。
+	"""
+
+	def __init__(self, watcher: Optional[ProcessWatcher] = None):
+		self.watcher = watcher or default_watcher()
+		self.key: Optional[ProcessKey] = None
+		self.attaches = 0
+		self._locator: Optional[ControlLocator] = None
+		self.watcher.subscribe(MOLLY_MAIN_PANEL, self._on_process_event)
+
+	def _on_process_event(self, event: ProcessEvent) -> None:
+		# 在监视器的扫描线程上调用: 只丢弃连接，真正的重新连接留给采集线程
+		if event.kind == "exit" and event.key == self.key:
+			print(f"Molly 进程已退出 (PID {event.pid})，等待重新启动...")
+			self._locator = None
+
+	def locator(self) -> ControlLocator:
+		locator = self._locator
+		if locator is None:
+			key = self.watcher.find(MOLLY_MAIN_PANEL)
+			if key is None:
+				raise ProcessLookupError(f"未找到进程 {MOLLY_MAIN_PANEL}")
+			locator = create_locator(connect_main_window(key.pid))
+			self.key = key
+			self.attaches += 1
+			self._locator = locator
+		return locator
+
+	def invalidate(self) -> None:
+		self._locator = None
+
+	def close(self) -> None:
+		"""取消进程事件订阅并丢弃连接；之后不应再使用该对象"""
+		self.watcher.unsubscribe(self._on_process_event)
+		self._locator = None
+
+	def sample(self) -> Dict[str, float]:
+		"""当前连接的 Lbar5.exe 的 CPU 占用 (%) 和内存 (MB)；未连接或进程已退出时为空"""
+		sample = self.watcher.sample(self.key) if self.key is not None else None
+		if sample is None:
+			return {}
+		return {"lbar5_cpu": sample.cpu_percent, "lbar5_rss_mb": round(sample.rss / 1e6, 1)}
+
+	def capture(self) -> PanelFrame:
+		try:
+			return capture_frame(self.locator())
+		except Exception:
+			self.invalidate()
+			raise
+
+
+def capture_frame(locator: ControlLocator) -> PanelFrame:
+	"""
+    (阶段 1) 短暂的GUI交互：一次性获取所有文本、控件坐标和主窗口截图。
+    """
+	with _TIMERS["locate"].time():
+		# 1a. 通过定位缓存一次性获取主窗口和所有控件的坐标 (必要时才遍历控件树)
+		main_win_coords, coords = locator.rectangles()
+
+		# 1b. 获取文本
+		reactor_texts = locator.texts("reactor")
 
+	# 1c. 只截取要分析的控件区域，写入循环使用的主窗口大小的 Pillow 图像 (主窗口坐标系)
+	with _TIMERS["screenshot"].time():
+		main_screenshot_pil = SCREEN_CAPTURE.capture(main_win_coords, [coords[name] for name in CAPTURE_CONTROLS])
 
-# --- 3. 主逻辑 (Main Logic) ---
+	return PanelFrame(main_screenshot_pil, main_win_coords, reactor_texts,
+					  coords["shutter"], coords["vacuum"], coords["temp"], coords)
+
+
+def analyze_frame(frame: PanelFrame, executor: Optional[AnalysisExecutor] = None) -> Dict[str, Any]:
+	"""
+    (阶段 2) 离线分析一帧，不再打扰GUI。单项分析失败时对应的值为错误描述。
+    传入 executor 时，各区域任务 (快门、读数) 会被分发到其工作池并行执行。
+    """
+	results: Dict[str, Any] = {"reactor_texts": frame.reactor_texts}
+	if executor is None:
+		executor = _SERIAL_EXECUTOR
+
+	# 所有指示灯 (快门、阀门) 在一次向量化运算中完成识别
+	try:
+		with _TIMERS["indicators"].time():
+			results.update(INDICATORS.classify(frame.main_screenshot_pil, frame.main_win_coords, frame.control_coords))
+	except Exception as e:
+		for name in INDICATORS.names:
+			results[name] = f"分析指示灯状态失败: {e}"
+
+	# 读数区域像素未变化时直接复用上次的读数，只把变化了的区域交给执行器
+	tasks = []
+	boxes = []
+	fingerprints = {}
+	for name, coords, whitelist in (("vacuum", frame.vacuum_coords, VACUUM_WHITELIST),
+									("temp", frame.temp_coords, TEMP_WHITELIST)):
+		box = region_box(frame.main_win_coords, coords)
+		hit, value, fingerprint = REGION_CACHE.lookup(name, frame.main_screenshot_pil, box)
+		if hit:
+			results[name] = value
+		else:
+			fingerprints[name] = fingerprint
+			boxes.append(box)
+			tasks.append(RegionTask(name, get_reading_from_preprocessed, coords, (whitelist,)))
+	if not tasks:
+		return results
+
+	# 对需要识别的区域的外接矩形做一次灰度 + 对比度查表，各区域只是其中的零拷贝视图
+	with _TIMERS["preprocess"].time():
+		preprocessed = GAUGE_PREPROCESSOR.process(frame.main_screenshot_pil, boxes)
+	with _TIMERS["ocr"].time():
+		analyzed = executor.analyze(preprocessed, frame.main_win_coords, tasks)
+	for name, value in analyzed.items():
+		if isinstance(value, Exception):
+			results[name] = f"分析失败: {value}"
+			continue
+		results[name] = value
+		if name in fingerprints:
+			REGION_CACHE.store(name, fingerprints[name], value)
+	return results
+
+
+# --- 4. 主逻辑 (Main Logic) ---
 
 def main():
 	"""Main execution function."""
 	# --- 阶段 1: 短暂的GUI交互 ---
+	print("--- [阶段 1] 开始与GUI进行短暂交互 ---")
 	try:
-		molly_pid = get_pids_by_name(MOLLY_MAIN_PANEL)[0]
-	except:
-		print("could not get access to molly !")
-		raise
-	try:
-		print("--- [阶段 1] 开始与GUI进行短暂交互 ---")
-		print(f"正在连接到进程 PID: {molly_pid}...")
-		app = Application(backend="win32").connect(process=molly_pid)
-		main_window = app.window(title_re="Molly 2000.*")
-		main_window.wait('visible', timeout=10)
-		main_window.set_focus()
-		print(f"成功连接到主窗口: '{main_window.window_text()}'")
-
-		# 运行此函数来查找您需要的控件信息！
-		# find_controls_and_print(main_window)
-
-		# 1a. 获取所有需要交互的控件
-		### TODO ###: 根据 find_controls_and_print 的输出修改这里的定位参数
-		reactor_panel = main_window.child_window(class_name="ListView20WndClass", found_index=3)
-		shutter_panel = main_window.child_window(title="Shutter", found_index=0)
-		vacuum_gauge_panel = main_window.child_window(class_name="Static", found_index=10)
-		temp_gauge_panel = main_window.child_window(class_name="Static", found_index=12)
-
-		# 1b. 一次性获取所有文本和坐标
-		reactor_texts = reactor_panel.texts()
-		main_win_coords = main_window.rectangle()
-		shutter_coords = shutter_panel.rectangle()
-		vacuum_coords = vacuum_gauge_panel.rectangle()
-		temp_coords = temp_gauge_panel.rectangle()
-
-		# 1c. 截取整个主窗口的图像
-		# pyautogui.screenshot() 直接返回 Pillow 图像对象
-		main_screenshot_pil = pyautogui.screenshot(region=(
-			main_win_coords.left, main_win_coords.top,
-			main_win_coords.width(), main_win_coords.height()
-		))
-
-		# [已移除] 不再需要 cv2 和 numpy 进行格式转换
-		# main_screenshot_bgr = cv2.cvtColor(np.array(screenshot_pil), cv2.COLOR_RGB2BGR)
-
+		main_window = connect_main_window()
+		frame = capture_frame(create_locator(main_window))
 		print("--- GUI交互完成。所有后续操作均为离线分析 ---")
-
 	except Exception as e:
 		print(f"\n在GUI交互阶段发生错误: {e}")
 		print("请确认 PID 是否正确，以及所有控件定位参数是否准确。")
@@ -159,44 +327,34 @@ def main():
 
 	# --- 阶段 2: 离线图像和数据分析 ---
 	print("\n--- [阶段 2] 开始离线数据分析 ---")
+	results = analyze_frame(frame)
 
 	# 分析任务1: 处理源炉数据
 	print("\n[分析 1] 处理源炉数据...")
-	if reactor_texts:
-		print(f"源炉面板数据 (前5行): {reactor_texts[:5]}")
+	if results["reactor_texts"]:
+		print(f"源炉面板数据 (前5行): {results['reactor_texts'][:5]}")
 	else:
 		print("未能获取源炉数据。")
 
 	# 分析任务2: 分析快门状态
 	print("\n[分析 2] 分析快门状态...")
-	try:
-		# 传入 Pillow 图像对象
-		shutter_status = get_shutter_status_from_image(main_screenshot_pil, main_win_coords, shutter_coords)
-		print(f"快门 1 状态: {shutter_status}")
-	except Exception as e:
-		print(f"分析快门状态失败: {e}")
+	print(f"快门 1 状态: {results['shutter']}")
 
 	# 分析任务3: OCR识别仪表读数
 	print("\n[分析 3] OCR识别仪表读数...")
-	try:
-		vacuum_whitelist = '0123456789.E-'
-		# 传入 Pillow 图像对象
-		vacuum_reading = get_reading_ocr_from_image(main_screenshot_pil, main_win_coords, vacuum_coords,
-													vacuum_whitelist)
-		print(f"真空计读数: {vacuum_reading}")
-	except Exception as e:
-		print(f"OCR识别真空计失败: {e}")
+	print(f"真空计读数: {results['vacuum']}")
+	print(f"冷泵温度读数: {results['temp']}")
 
-	try:
-		temp_whitelist = '0123456789Kk.'
-		# 传入 Pillow 图像对象
-		temp_reading = get_reading_ocr_from_image(main_screenshot_pil, main_win_coords, temp_coords, temp_whitelist)
-		print(f"冷泵温度读数: {temp_reading}")
-	except Exception as e:
-		print(f"OCR识别冷泵温度失败: {e}")
+	capture_stats = SCREEN_CAPTURE.stats()
+	print(f"屏幕采集 [{capture_stats['backend']}]: {capture_stats['grabs_per_frame']} 次截取, "
+		  f"{capture_stats['last_bytes'] / 1024:.1f} KB, {capture_stats['last_latency_ms']:.2f} ms")
+	cache_stats = REGION_CACHE.stats()
+	print(f"区域缓存: 命中 {cache_stats['hits']}, 未命中 {cache_stats['misses']}")
+	for key, s in get_default_pool().stats.summary().items():
+		print(f"OCR 耗时 [{key}]: 平均 {s['mean_ms']:.1f} ms (共 {s['count']} 次)")
 
 	print("\n--- 所有分析任务完成 ---")
 
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	main()
@@ -0,0 +1,120 @@
+# region_cache.py
+
+"""
+按区域的像素变化检测：画面没变就直接复用上一次的识别结果。
+
+大多数轮询周期里，真空计和冷泵温度的数字与上一周期完全相同，但 OCR 仍会对每个裁剪区域
+重新识别一次。这里为每个区域 (由 panel_coords 与 main_win_coords 算出的裁剪框) 计算
+一个像素指纹 (blake2b 摘要)，指纹与上一帧相同则直接返回缓存的值，不再调用 OCR。
+
+用法:
+	cache = RegionChangeDetector()
+	box = region_box(main_win_coords, vacuum_coords)
+	reading = cache.get_or_compute("vacuum", screenshot, box, lambda: do_ocr(...))
+	print(cache.stats())
+"""
+
+import hashlib
+import threading
+from collections import namedtuple
+from typing import Any, Callable, Dict, Optional, Tuple
+
+Box = Tuple[int, int, int, int]
+
+
+class Rect(namedtuple("Rect", "left top right bottom")):
+	"""可被 pickle 的矩形快照，接口与 pywinauto 的 RECT 相同 (left/top/right/bottom/width()/height())"""
+	__slots__ = ()
+
+	def width(self) -> int:
+		return self.right - self.left
+
+	def height(self) -> int:
+		return self.bottom - self.top
+
+
+def snapshot_rect(rect) -> Rect:
+	return Rect(rect.left, rect.top, rect.right, rect.bottom)
+
+
+def region_box(main_win_coords, panel_coords) -> Box:
+	"""控件绝对坐标 -> 主窗口截图内的裁剪框 (left, upper, right, lower)"""
+	return (panel_coords.left - main_win_coords.left, panel_coords.top - main_win_coords.top,
+			panel_coords.right - main_win_coords.left, panel_coords.bottom - main_win_coords.top)
+
+
+def region_fingerprint(image, box: Box, sample_step: int = 1) -> bytes:
+	"""
+	计算图像中 box 区域的像素指纹。image 可以是 Pillow 图像或 numpy 数组 (H, W[, C])。
+	sample_step > 1 时只对降采样后的像素求摘要，更快但可能漏掉细小的变化。
+	"""
+	left, upper, right, lower = box
+	if hasattr(image, 'crop'):
+		region = image.crop(box)
+		if sample_step > 1:
+			region = region.reduce(sample_step)
+		data = region.tobytes()
+	else:
+		view = image[upper:lower:sample_step, left:right:sample_step]
+		data = view.tobytes()
+	digest = hashlib.blake2b(data, digest_size=16)
+	# 裁剪框尺寸也计入指纹，窗口尺寸变化时必然视为变化
+	digest.update(f"{right - left}x{lower - upper}".encode('ascii'))
+	return digest.digest()
+
+
+class RegionChangeDetector:
+	"""
+	记录每个命名区域最近一次的像素指纹和解码值，线程安全
+	"""
+
+	def __init__(self, sample_step: int = 1):
+		self.sample_step = sample_step
+		self.hits = 0
+		self.misses = 0
+		self._lock = threading.Lock()
+		self._entries: Dict[str, Tuple[bytes, Any]] = {}
+
+	def lookup(self, name: str, image, box: Box) -> Tuple[bool, Any, bytes]:
+		"""
+		只查询不计算，返回 (是否命中, 缓存值, 当前指纹)。
+		未命中时由调用方自行计算，再用 store() 写回 (例如把识别任务分发到工作池时)。
+		"""
+		fingerprint = region_fingerprint(image, box, self.sample_step)
+		with self._lock:
+			entry = self._entries.get(name)
+			if entry is not None and entry[0] == fingerprint:
+				self.hits += 1
+				return True, entry[1], fingerprint
+			self.misses += 1
+			return False, None, fingerprint
+
+	def store(self, name: str, fingerprint: bytes, value: Any) -> None:
+		with self._lock:
+			self._entries[name] = (fingerprint, value)
+
+	def get_or_compute(self, name: str, image, box: Box, compute: Callable[[], Any]) -> Any:
+		"""区域像素未变化时返回缓存值，否则调用 compute() 并缓存其结果"""
+		hit, value, fingerprint = self.lookup(name, image, box)
+		if hit:
+			return value
+		value = compute()
+		self.store(name, fingerprint, value)
+		return value
+
+	def invalidate(self, name: Optional[str] = None) -> None:
+		"""丢弃某个区域 (或全部区域) 的缓存，例如在 OCR 配置改变之后"""
+		with self._lock:
+			if name is None:
+				self._entries.clear()
+			else:
+				self._entries.pop(name, None)
+
+	def stats(self) -> Dict[str, float]:
+		with self._lock:
+			total = self.hits + self.misses
+			return {
+				"hits": self.hits,
+				"misses": self.misses,
+				"hit_rate": self.hits / total if total else 0.0,
+			}
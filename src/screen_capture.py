@@ -0,0 +1,509 @@
+# screen_capture.py
+
+"""
+只截取关注区域 (ROI) 的屏幕采集。
+
+read_Lbar5.capture_frame 原来每个周期用 pyautogui.screenshot(region=主窗口) 截取整个主窗口，
+而阶段 2 只分析其中几个很小的控件区域 (指示灯、真空计、冷泵温度)；更糟的是 pyautogui 底层的
+PIL.ImageGrab 在 Windows 和 X11 上都是先截取整个屏幕再裁剪，并且每帧分配新图像。这里改为:
+
+- RoiCapture.capture(主窗口矩形, [关注区域...]) 只向后端请求关注区域的像素。区域如何分组由
+  plan_grabs 按代价模型决定: 每次截取的固定开销折算成 call_overhead_px 个像素，相距较近的
+  区域合并成一次截取 (外接矩形)，相距较远的分开截取；布局不变时直接复用上一次的分组；
+- 像素写入预先分配、循环使用的主窗口大小的 RGB 图像。关注区域以外的像素不更新 (内容无意义)，
+  下游按主窗口坐标裁剪的代码 (region_box、IndicatorTable、FramePreprocessor、
+  RegionChangeDetector) 不需要改动。缓冲区在下游不再引用返回的图像后才会被复用，
+  PollingEngine 队列里的帧不会被后面的采集覆盖；
+- 后端: "gdi" (Windows，ctypes 调用 BitBlt，DIB 段常驻复用)、"x11" (ctypes 调用 libX11 的
+  XGetImage，可以在 Xvfb 虚拟显示上测试)、"synthetic" (从给定图像取像素，测试和基准用)；
+- 每帧截取的字节数和耗时记录在 last_bytes / last_latency，累计值见 stats()，
+  同时计入指标 screen_capture_bytes_total / screen_capture_seconds (按后端区分)。
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import sys
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+from metrics import default_registry
+from region_cache import Box, Rect, snapshot_rect
+from tools import LoggerMixin
+
+CAPTURE_MODES = ("auto", "union", "split", "window")
+CAPTURE_BACKENDS = ("gdi", "x11", "synthetic")
+
+_BYTES = default_registry().counter("screen_capture_bytes_total", "屏幕采集读取的像素字节数", ("backend",))
+_SECONDS = default_registry().histogram("screen_capture_seconds", "每帧屏幕采集耗时 (秒)", ("backend",))
+
+
+def box_area(box: Box) -> int:
+	return max(0, box[2] - box[0]) * max(0, box[3] - box[1])
+
+
+def _merge(a: Box, b: Box) -> Box:
+	return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def plan_grabs(boxes: Sequence[Box], call_overhead_px: int, mode: str = "auto") -> List[Box]:
+	"""
+	把关注区域分组为若干次截取，返回每次截取的矩形:
+		'union' - 一次截取全部区域的外接矩形
+		'split' - 每个区域单独截取 (只有大面积重叠、合并后读取的像素更少时才合并)
+		'auto'  - 贪心合并: 代价 = 读取的像素数 + 每次截取 call_overhead_px，
+				  每次合并节省最多的一对，直到再合并不再节省
+	"""
+	if mode not in ("auto", "union", "split"):
+		raise ValueError(f"未知的分组方式: {mode}")
+	groups = [tuple(box) for box in boxes if box_area(box) > 0]
+	if mode == "union" and groups:
+		merged = groups[0]
+		for box in groups[1:]:
+			merged = _merge(merged, box)
+		return [merged]
+	overhead = call_overhead_px if mode == "auto" else 0
+	while len(groups) > 1:
+		best_saving, best_pair = 0, None
+		for i in range(len(groups)):
+			for j in range(i + 1, len(groups)):
+				saving = (box_area(groups[i]) + box_area(groups[j]) + overhead
+						  - box_area(_merge(groups[i], groups[j])))
+				if saving > best_saving:
+					best_saving, best_pair = saving, (i, j)
+		if best_pair is None:
+			break
+		i, j = best_pair
+		merged = _merge(groups[i], groups[j])
+		del groups[j]
+		groups[i] = merged
+	return groups
+
+
+class CaptureBackend:
+	"""
+	截取屏幕矩形 box (屏幕坐标) 的像素，贴到 dest 图像的 xy 处。
+	后端只在采集线程中使用 (由 RoiCapture 加锁保证)，第一次截取时才打开系统资源。
+	"""
+	name = ""
+	call_overhead_px = 0  # 每次截取的固定开销折算成的像素数，供 plan_grabs 使用
+	bytes_per_pixel = 4
+
+	def __init__(self):
+		self._scratches: Dict[Tuple[int, int], Image.Image] = {}
+
+	def grab_into(self, dest: Image.Image, xy: Tuple[int, int], box: Box) -> None:
+		raise NotImplementedError
+
+	def close(self) -> None:
+		pass
+
+	def _scratch(self, width: int, height: int) -> Image.Image:
+		"""按尺寸缓存的中转图像: 区域尺寸每帧相同，解码后再贴入目标，不必每次分配"""
+		image = self._scratches.get((width, height))
+		if image is None:
+			if len(self._scratches) >= 64:  # 窗口反复改变尺寸时不无限增长
+				self._scratches.clear()
+			image = self._scratches[(width, height)] = Image.new("RGB", (width, height))
+		return image
+
+
+class _BitmapInfoHeader(ctypes.Structure):
+	_fields_ = [
+		("biSize", ctypes.c_uint32), ("biWidth", ctypes.c_int32), ("biHeight", ctypes.c_int32),
+		("biPlanes", ctypes.c_uint16), ("biBitCount", ctypes.c_uint16), ("biCompression", ctypes.c_uint32),
+		("biSizeImage", ctypes.c_uint32), ("biXPelsPerMeter", ctypes.c_int32), ("biYPelsPerMeter", ctypes.c_int32),
+		("biClrUsed", ctypes.c_uint32), ("biClrImportant", ctypes.c_uint32),
+	]
+
+
+class GdiBackend(CaptureBackend):
+	"""
+	Windows GDI: 常驻的屏幕 DC + 内存 DC + 32 位自顶向下的 DIB 段。每次截取把区域 BitBlt 到 DIB
+	左上角，再按 BGRX 解码到中转图像；DIB 只在需要更大的区域时重新分配。
+	坐标与 pywinauto 一致 (pywinauto 导入时已把进程设为 DPI 感知)。
+	"""
+	name = "gdi"
+	call_overhead_px = 40000  # BitBlt 的固定开销约为几十微秒
+
+	_SRCCOPY = 0x00CC0020
+
+	def __init__(self):
+		super().__init__()
+		self._user32 = None
+		self._gdi32 = None
+		self._screen_dc = None
+		self._memory_dc = None
+		self._bitmap = None
+		self._old_bitmap = None
+		self._bits = ctypes.c_void_p()
+		self._size = (0, 0)
+
+	def _open(self) -> None:
+		user32, gdi32 = ctypes.windll.user32, ctypes.windll.gdi32
+		handle = ctypes.c_void_p
+		user32.GetDC.argtypes = [handle]
+		user32.GetDC.restype = handle
+		user32.ReleaseDC.argtypes = [handle, handle]
+		gdi32.CreateCompatibleDC.argtypes = [handle]
+		gdi32.CreateCompatibleDC.restype = handle
+		gdi32.CreateDIBSection.argtypes = [handle, ctypes.POINTER(_BitmapInfoHeader), ctypes.c_uint,
+										   ctypes.POINTER(ctypes.c_void_p), handle, ctypes.c_uint32]
+		gdi32.CreateDIBSection.restype = handle
+		gdi32.SelectObject.argtypes = [handle, handle]
+		gdi32.SelectObject.restype = handle
+		gdi32.DeleteObject.argtypes = [handle]
+		gdi32.DeleteDC.argtypes = [handle]
+		gdi32.BitBlt.argtypes = [handle, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+								 handle, ctypes.c_int, ctypes.c_int, ctypes.c_uint32]
+		self._user32, self._gdi32 = user32, gdi32
+		self._screen_dc = user32.GetDC(None)
+		self._memory_dc = gdi32.CreateCompatibleDC(self._screen_dc)
+		if not self._screen_dc or not self._memory_dc:
+			self.close()
+			raise OSError("无法创建屏幕 DC")
+
+	def _ensure(self, width: int, height: int) -> None:
+		if self._memory_dc is None:
+			self._open()
+		if width <= self._size[0] and height <= self._size[1]:
+			return
+		width, height = max(width, self._size[0]), max(height, self._size[1])
+		header = _BitmapInfoHeader(biSize=ctypes.sizeof(_BitmapInfoHeader), biWidth=width, biHeight=-height,
+								   biPlanes=1, biBitCount=32, biCompression=0)  # BI_RGB，负高度为自顶向下
+		bits = ctypes.c_void_p()
+		bitmap = self._gdi32.CreateDIBSection(self._memory_dc, ctypes.byref(header), 0, ctypes.byref(bits), None, 0)
+		if not bitmap:
+			raise OSError(f"无法分配 {width}x{height} 的 DIB")
+		old = self._gdi32.SelectObject(self._memory_dc, bitmap)
+		if self._bitmap is not None:
+			self._gdi32.DeleteObject(self._bitmap)
+		else:
+			self._old_bitmap = old
+		self._bitmap, self._bits, self._size = bitmap, bits, (width, height)
+
+	def grab_into(self, dest: Image.Image, xy: Tuple[int, int], box: Box) -> None:
+		left, top, right, bottom = box
+		width, height = right - left, bottom - top
+		self._ensure(width, height)
+		if not self._gdi32.BitBlt(self._memory_dc, 0, 0, width, height, self._screen_dc, left, top, self._SRCCOPY):
+			raise OSError(f"BitBlt 失败: {box}")
+		self._gdi32.GdiFlush()
+		stride = self._size[0] * 4
+		data = (ctypes.c_char * (stride * height)).from_address(self._bits.value)
+		scratch = self._scratch(width, height)
+		scratch.frombytes(data, "raw", "BGRX", stride, 1)
+		dest.paste(scratch, xy)
+
+	def close(self) -> None:
+		if self._memory_dc is not None:
+			if self._bitmap is not None:
+				self._gdi32.SelectObject(self._memory_dc, self._old_bitmap)
+				self._gdi32.DeleteObject(self._bitmap)
+			self._gdi32.DeleteDC(self._memory_dc)
+		if self._screen_dc is not None:
+			self._user32.ReleaseDC(None, self._screen_dc)
+		self._screen_dc = self._memory_dc = self._bitmap = self._old_bitmap = None
+		self._size = (0, 0)
+
+
+class _XImage(ctypes.Structure):
+	# 只声明用到的前几个字段 (XImage 由 libX11 分配，这里只读)
+	_fields_ = [
+		("width", ctypes.c_int), ("height", ctypes.c_int), ("xoffset", ctypes.c_int), ("format", ctypes.c_int),
+		("data", ctypes.c_void_p), ("byte_order", ctypes.c_int), ("bitmap_unit", ctypes.c_int),
+		("bitmap_bit_order", ctypes.c_int), ("bitmap_pad", ctypes.c_int), ("depth", ctypes.c_int),
+		("bytes_per_line", ctypes.c_int), ("bits_per_pixel", ctypes.c_int),
+	]
+
+
+class X11Backend(CaptureBackend):
+	"""
+	X11: 每次截取用 XGetImage 只读取区域内的像素 (PIL.ImageGrab 在 X11 上会读取整个屏幕)。
+	display 为 None 时使用 $DISPLAY，可以在 Xvfb 虚拟显示上测试:
+		Xvfb :99 -screen 0 1920x1080x24 &
+		python screen_capture.py --backend x11 --display :99
+	"""
+	name = "x11"
+	call_overhead_px = 20000  # 每次 XGetImage 是一次与 X 服务器的往返
+
+	_ALL_PLANES = ctypes.c_ulong(-1).value
+	_Z_PIXMAP = 2
+
+	def __init__(self, display: Optional[str] = None):
+		super().__init__()
+		self.display = display
+		self._xlib = None
+		self._display = None
+		self._root = 0
+
+	def _open(self) -> None:
+		path = ctypes.util.find_library("X11")
+		if path is None:
+			raise OSError("未找到 libX11")
+		xlib = ctypes.cdll.LoadLibrary(path)
+		xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+		xlib.XOpenDisplay.restype = ctypes.c_void_p
+		xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+		xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+		xlib.XGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int, ctypes.c_int,
+								   ctypes.c_uint, ctypes.c_uint, ctypes.c_ulong, ctypes.c_int]
+		xlib.XGetImage.restype = ctypes.POINTER(_XImage)
+		xlib.XDestroyImage.argtypes = [ctypes.POINTER(_XImage)]
+		xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+		display = xlib.XOpenDisplay(self.display.encode() if self.display else None)
+		if not display:
+			raise OSError(f"无法连接 X 显示: {self.display or os.environ.get('DISPLAY')}")
+		self._xlib, self._display = xlib, display
+		self._root = xlib.XDefaultRootWindow(display)
+
+	def grab_into(self, dest: Image.Image, xy: Tuple[int, int], box: Box) -> None:
+		if self._display is None:
+			self._open()
+		left, top, right, bottom = box
+		width, height = right - left, bottom - top
+		image = self._xlib.XGetImage(self._display, self._root, left, top, width, height,
+									 self._ALL_PLANES, self._Z_PIXMAP)
+		if not image:
+			raise OSError(f"XGetImage 失败 (区域超出屏幕?): {box}")
+		try:
+			info = image.contents
+			if info.bits_per_pixel != 32:
+				raise OSError(f"不支持的像素格式: {info.bits_per_pixel} 位/像素")
+			data = (ctypes.c_char * (info.bytes_per_line * height)).from_address(info.data)
+			scratch = self._scratch(width, height)
+			scratch.frombytes(data, "raw", "BGRX" if info.byte_order == 0 else "XRGB", info.bytes_per_line, 1)
+		finally:
+			self._xlib.XDestroyImage(image)
+		dest.paste(scratch, xy)
+
+	def close(self) -> None:
+		if self._display is not None:
+			self._xlib.XCloseDisplay(self._display)
+			self._display = None
+
+
+class SyntheticBackend(CaptureBackend):
+	"""
+	从 source 图像 (左上角位于屏幕坐标 origin) 取像素，不需要显示器；可以随时替换 source 模拟画面变化。
+	call_delay 模拟真实后端每次截取的固定开销 (秒)。
+	"""
+	name = "synthetic"
+	bytes_per_pixel = 3
+
+	def __init__(self, source: Image.Image, origin: Tuple[int, int] = (0, 0), call_delay: float = 0.0,
+				 call_overhead_px: int = 20000):
+		super().__init__()
+		self.source = source if source.mode == "RGB" else source.convert("RGB")
+		self.origin = origin
+		self.call_delay = call_delay
+		self.call_overhead_px = call_overhead_px
+
+	def grab_into(self, dest: Image.Image, xy: Tuple[int, int], box: Box) -> None:
+		if self.call_delay:
+			time.sleep(self.call_delay)
+		left, top, right, bottom = box
+		scratch = self._scratch(right - left, bottom - top)
+		# 把整张源图像以负偏移贴入中转图像，超出部分被裁掉，结果正好是 box 内的像素 (不分配新图像)
+		scratch.paste(self.source, (self.origin[0] - left, self.origin[1] - top))
+		dest.paste(scratch, xy)
+
+
+def create_backend(name: Optional[str] = None, **kwargs) -> CaptureBackend:
+	"""按名称创建后端；name 为 None 时 Windows 上使用 gdi，其它系统使用 x11"""
+	if name is None:
+		name = "gdi" if sys.platform == "win32" else "x11"
+	if name == "gdi":
+		return GdiBackend(**kwargs)
+	if name == "x11":
+		return X11Backend(**kwargs)
+	if name == "synthetic":
+		return SyntheticBackend(**kwargs)
+	raise ValueError(f"未知的采集后端: {name}，可选: {CAPTURE_BACKENDS}")
+
+
+class RoiCapture(LoggerMixin):
+	"""
+	只截取关注区域，结果写入循环使用的主窗口大小图像。
+	mode: 'auto' / 'union' / 'split' 见 plan_grabs；'window' 截取整个主窗口 (与原实现相同的像素)。
+	"""
+
+	def __init__(self, backend: CaptureBackend, mode: str = "auto"):
+		if mode not in CAPTURE_MODES:
+			raise ValueError(f"未知的采集方式: {mode}，可选: {CAPTURE_MODES}")
+		self.backend = backend
+		self.mode = mode
+		self.frames = 0
+		self.allocations = 0  # 分配过的主窗口缓冲区数量 (稳定后等于同时在用的帧数)
+		self.last_bytes = 0
+		self.last_grabs = 0
+		self.last_latency = 0.0
+		self.total_bytes = 0
+		self._total_latency = 0.0
+		self._lock = threading.Lock()
+		self._plan_key = None
+		self._plan: List[Box] = []
+		self._buffer_size: Optional[Tuple[int, int]] = None
+		self._free: List[Image.Image] = []
+		self._bytes_counter = _BYTES.labels(backend.name)
+		self._latency_histogram = _SECONDS.labels(backend.name)
+
+	def plan(self, window, rois: Sequence) -> List[Box]:
+		"""本帧要截取的矩形 (屏幕坐标，已裁剪到主窗口内)；主窗口和区域都没变时复用上一次的结果"""
+		key = (snapshot_rect(window), tuple(snapshot_rect(roi) for roi in rois))
+		if key != self._plan_key:
+			win = key[0]
+			if self.mode == "window":
+				boxes = [tuple(win)]
+			else:
+				clipped = [(max(r.left, win.left), max(r.top, win.top), min(r.right, win.right),
+							min(r.bottom, win.bottom)) for r in key[1]]
+				boxes = plan_grabs(clipped, self.backend.call_overhead_px, self.mode)
+			self._plan_key, self._plan = key, boxes
+		return self._plan
+
+	def _buffer(self, size: Tuple[int, int]) -> Image.Image:
+		if size != self._buffer_size:
+			self._buffer_size = size  # 主窗口尺寸变化: 旧尺寸的缓冲区随最后一个引用释放
+			self._free = []
+		base = self._free.pop() if self._free else None
+		if base is None:
+			base = Image.new("RGB", size)
+			self.allocations += 1
+		# 交给下游的是共享同一块像素内存的新 Image 对象；下游不再引用它时，缓冲区才回到空闲列表
+		view = base._new(base.im)
+		weakref.finalize(view, self._release, base)
+		return view
+
+	def _release(self, base: Image.Image) -> None:
+		# 可能在任意线程上调用 (最后一个引用在哪里释放就在哪里调用)；list.append 本身是原子的
+		if base.size == self._buffer_size:
+			self._free.append(base)
+
+	def capture(self, window, rois: Sequence) -> Image.Image:
+		"""
+		截取 rois (屏幕坐标的矩形) 并返回主窗口大小、主窗口坐标系的 RGB 图像，只有 rois 内的像素有效
+		"""
+		start_time = time.perf_counter()
+		with self._lock:
+			boxes = self.plan(window, rois)
+			win = self._plan_key[0]
+			image = self._buffer((win.width(), win.height()))
+			for box in boxes:
+				self.backend.grab_into(image, (box[0] - win.left, box[1] - win.top), box)
+			nbytes = sum(box_area(box) for box in boxes) * self.backend.bytes_per_pixel
+			elapsed = time.perf_counter() - start_time
+			self.frames += 1
+			self.last_bytes, self.last_grabs, self.last_latency = nbytes, len(boxes), elapsed
+			self.total_bytes += nbytes
+			self._total_latency += elapsed
+		self._bytes_counter.inc(nbytes)
+		self._latency_histogram.observe(elapsed)
+		return image
+
+	def close(self) -> None:
+		with self._lock:
+			self.backend.close()
+
+	def stats(self) -> Dict[str, float]:
+		frames = max(1, self.frames)
+		return {
+			"backend": self.backend.name,
+			"mode": self.mode,
+			"frames": self.frames,
+			"grabs_per_frame": self.last_grabs,
+			"last_bytes": self.last_bytes,
+			"avg_bytes": self.total_bytes / frames,
+			"last_latency_ms": self.last_latency * 1000,
+			"avg_latency_ms": self._total_latency / frames * 1000,
+			"buffers": self.allocations,
+		}
+
+
+# --- 基准测试：整窗口截图 vs 只截取关注区域 ---
+
+# 测试用的关注区域布局 (相对主窗口左上角): 指示灯 + 两个读数
+LAYOUTS = {
+	"clustered": [(40, 60, 100, 90), (120, 60, 230, 84), (120, 100, 230, 124)],
+	"scattered": [(40, 60, 100, 90), (1300, 80, 1410, 104), (700, 820, 810, 844)],
+}
+
+
+def main():
+	parser = argparse.ArgumentParser(description="整窗口截图 vs 只截取关注区域: 每帧字节数和耗时")
+	parser.add_argument("--backend", choices=CAPTURE_BACKENDS, default="synthetic")
+	parser.add_argument("--display", default=None, help="x11 后端的显示，如 :99 (默认 $DISPLAY)")
+	parser.add_argument("--frames", type=int, default=300)
+	parser.add_argument("--window", type=int, nargs=4, default=(100, 80, 1700, 1000),
+						metavar=("LEFT", "TOP", "RIGHT", "BOTTOM"), help="主窗口的屏幕坐标")
+	parser.add_argument("--call-delay", type=float, default=0.0001,
+						help="synthetic 后端模拟的每次截取固定开销 (秒)")
+	args = parser.parse_args()
+
+	import random
+
+	from stage_benchmark import latency_summary
+
+	window = Rect(*args.window)
+	if args.backend == "synthetic":
+		rng = random.Random(0)
+		screen = Image.frombytes("RGB", (1920, 1080), rng.randbytes(1920 * 1080 * 3))
+		make_backend = lambda: SyntheticBackend(screen, call_delay=args.call_delay)
+
+		def baseline():
+			# 模拟 pyautogui.screenshot(region=...): 截取整个屏幕再裁剪，每帧分配新图像
+			if args.call_delay:
+				time.sleep(args.call_delay)
+			return screen.copy().crop(tuple(window))
+	else:
+		from PIL import ImageGrab
+
+		screen = None
+		make_backend = lambda: create_backend(args.backend, **({"display": args.display} if args.backend == "x11" else {}))
+		xdisplay = (args.display or os.environ.get("DISPLAY", "")) if args.backend == "x11" else None
+		baseline = lambda: ImageGrab.grab(bbox=tuple(window), xdisplay=xdisplay)
+
+	def report(label: str, samples: List[float], nbytes: float, grabs: int, buffers: str = "") -> None:
+		summary = latency_summary(samples)
+		print(f"{label:24s} {nbytes / 1024:9.1f} KB/帧, {grabs} 次截取, p50 {summary['p50_ms']:7.3f} ms, "
+			  f"p99 {summary['p99_ms']:7.3f} ms{buffers}")
+
+	samples = []
+	for _ in range(args.frames):
+		start_time = time.perf_counter()
+		baseline()
+		samples.append(time.perf_counter() - start_time)
+	print(f"后端 {args.backend}，主窗口 {window.width()}x{window.height()}，{args.frames} 帧")
+	report("整窗口 (原实现)", samples, window.width() * window.height() * 3, 1)
+
+	for layout, offsets in LAYOUTS.items():
+		rois = [Rect(window.left + l, window.top + t, window.left + r, window.top + b) for l, t, r, b in offsets]
+		print(f"\n布局 {layout}: {len(rois)} 个区域")
+		for mode in CAPTURE_MODES:
+			capture = RoiCapture(make_backend(), mode)
+			samples = []
+			held = []  # 模拟流水线中同时在用的帧 (队列 2 帧 + 分析中 1 帧)
+			for _ in range(args.frames):
+				start_time = time.perf_counter()
+				image = capture.capture(window, rois)
+				samples.append(time.perf_counter() - start_time)
+				held.append(image)
+				if len(held) > 3:
+					held.pop(0)
+			if screen is not None:
+				for roi in rois:
+					box = (roi.left - window.left, roi.top - window.top, roi.right - window.left, roi.bottom - window.top)
+					assert image.crop(box).tobytes() == screen.crop(tuple(roi)).tobytes(), f"{mode}: 区域像素不一致"
+			stats = capture.stats()
+			report(f"  {mode}", samples, stats["avg_bytes"], stats["grabs_per_frame"],
+				   f", 缓冲区 {stats['buffers']} 个")
+			capture.close()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,402 @@
+# serial_port_manager.py
+
+"""
+串口共享管理: 每个串口一个所有者线程 + 优先级指令队列。
+
+TrafficLightController、GSMController 和 three_color_light_demo.py 各自打开、关闭自己的
+serial.Serial，并在调用方线程里阻塞读写；同一个 COM 口有第二个使用者时，两边的请求和应答
+会互相串线。这里:
+
+- PortManager 按端口名登记 ManagedPort，同一端口只打开一次，在最后一个使用者释放前一直保持打开；
+- ManagedPort 只有所有者线程会碰串口。调用方通过 submit(transaction, priority) 提交
+  "请求/应答" 事务 (一个接收已打开串口的函数)，立即拿到 concurrent.futures.Future；
+  事务按优先级执行 (数值越小越先)，同优先级先进先出，报警类指令不会排在后台轮询后面；
+- 串口读写出错时关闭端口，下一个事务自动重新打开；
+- 像 GSM 模块这样会主动上报数据的设备可以 set_listener(callback)：队列空闲时所有者线程
+  持续读取并把数据交给回调，有新事务提交时立即中断空闲读取 (cancel_read)。
+"""
+
+import argparse
+import atexit
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Optional
+
+import serial
+
+from tools import LoggerMixin
+
+PRIORITY_HIGH = 0  # 报警、状态灯
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20  # 后台轮询
+
+Transaction = Callable[[serial.Serial], Any]
+
+
+class SerialPortError(Exception):
+	pass
+
+
+def _wake(conn: serial.Serial) -> None:
+	"""set_listener() 放入队列的唤醒项，不会被执行"""
+
+
+class ManagedPort(LoggerMixin):
+
+	def __init__(self, name: str, opener: Callable[..., serial.Serial] = serial.Serial, idle_timeout: float = 0.1,
+				 latency_window: int = 1000, **serial_kwargs):
+		self.name = name
+		self.opener = opener
+		self.idle_timeout = idle_timeout  # 有 listener 时，一次空闲读取最多阻塞多久
+		self.serial_kwargs = serial_kwargs
+
+		self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+		self._sequence = itertools.count()
+		self._conn: Optional[serial.Serial] = None
+		self._listener: Optional[Callable[[bytes], None]] = None
+		self._lock = threading.Lock()
+		self._idle_reading = False
+		self._cancel_issued = False
+		self._running = True
+
+		self.submitted = 0
+		self.completed = 0
+		self.failed = 0
+		self.opens = 0
+		self.max_depth = 0
+		self.busy_seconds = 0.0
+		self.wait_times: Deque[float] = deque(maxlen=latency_window)
+
+		self._thread = threading.Thread(target=self._run, name=f"SerialPort-{name}", daemon=True)
+		self._thread.start()
+
+	# --- 提交事务 ---
+
+	def submit(self, transaction: Transaction, priority: int = PRIORITY_NORMAL) -> Future:
+		"""在所有者线程上执行 transaction(serial_conn)，返回其结果的 Future"""
+		future: Future = Future()
+		if not self._running:
+			future.set_exception(SerialPortError(f"串口已关闭: {self.name}"))
+			return future
+		self._queue.put((priority, next(self._sequence), time.perf_counter(), transaction, future))
+		self.submitted += 1
+		self.max_depth = max(self.max_depth, self._queue.qsize())
+		self._interrupt_idle_read()
+		return future
+
+	def call(self, transaction: Transaction, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None) -> Any:
+		"""submit 并等待结果 (事务中的异常原样抛出)"""
+		return self.submit(transaction, priority).result(timeout)
+
+	def exchange(self, payload: bytes, reply_length: int, timeout: float = 1.0,
+				 priority: int = PRIORITY_NORMAL) -> Future:
+		"""写入 payload 并读取 reply_length 字节 (超时返回已收到的部分)"""
+
+		def transaction(conn: serial.Serial) -> bytes:
+			conn.reset_input_buffer()
+			conn.write(payload)
+			conn.timeout = timeout
+			return conn.read(reply_length)
+
+		return self.submit(transaction, priority)
+
+	def write(self, data: bytes, priority: int = PRIORITY_HIGH) -> int:
+		"""只写不读 (应答由 listener 接收)，写完才返回"""
+		return self.call(lambda conn: conn.write(data), priority)
+
+	def open(self) -> None:
+		"""立即打开串口 (失败时抛出异常)；不调用时由第一个事务打开"""
+		self.call(lambda conn: None, PRIORITY_HIGH)
+
+	def set_listener(self, callback: Optional[Callable[[bytes], None]]) -> None:
+		self._listener = callback
+		# 所有者线程空闲且原来没有 listener 时阻塞在 _queue.get() 上，放入一个唤醒项让它立即开始空闲读取
+		self._queue.put((PRIORITY_HIGH, next(self._sequence), time.perf_counter(), _wake, None))
+		self._interrupt_idle_read()
+
+	@property
+	def is_open(self) -> bool:
+		return self._running and self._conn is not None and self._conn.is_open
+
+	# --- 所有者线程 ---
+
+	def _ensure_open(self) -> serial.Serial:
+		if self._conn is None or not self._conn.is_open:
+			self._conn = self.opener(self.name, **self.serial_kwargs)
+			self.opens += 1
+			if self.opens > 1:
+				self.logger.info(f"已重新打开串口: {self.name}")
+		return self._conn
+
+	def _drop(self) -> None:
+		if self._conn is not None:
+			try:
+				self._conn.close()
+			except Exception as e:
+				self.logger.debug(f"关闭串口时发生错误: {e}")
+			self._conn = None
+
+	def _interrupt_idle_read(self) -> None:
+		with self._lock:
+			if self._idle_reading and self._conn is not None and hasattr(self._conn, "cancel_read"):
+				self._cancel_issued = True
+				self._conn.cancel_read()
+
+	def _idle_read(self, listener: Callable[[bytes], None]) -> None:
+		try:
+			conn = self._ensure_open()
+		except Exception as e:
+			self.logger.error(f"打开串口失败: {self.name}: {e}")
+			time.sleep(self.idle_timeout)
+			return
+		with self._lock:
+			if not self._queue.empty():
+				return
+			self._idle_reading = True
+		try:
+			conn.timeout = self.idle_timeout
+			data = conn.read(max(1, conn.in_waiting))
+			with self._lock:
+				self._idle_reading = False
+				cancelled, self._cancel_issued = self._cancel_issued, False
+			if cancelled:
+				# 读取结束和中断请求可能擦肩而过: 用一次非阻塞读取消化残留的中断信号，
+				# 以免它打断下一个事务的读取
+				conn.timeout = 0
+				data += conn.read(conn.in_waiting or 1)
+		except (serial.SerialException, OSError) as e:
+			self.logger.error(f"读取串口失败: {self.name}: {e}")
+			self._drop()
+			return
+		finally:
+			with self._lock:
+				self._idle_reading = False
+		if data:
+			try:
+				listener(data)
+			except Exception as e:
+				self.logger.error(f"串口数据回调异常: {e}", exc_info=True)
+
+	def _run(self) -> None:
+		while True:
+			listener = self._listener
+			try:
+				item = self._queue.get_nowait() if listener is not None else self._queue.get()
+			except queue.Empty:
+				self._idle_read(listener)
+				continue
+			_, _, submitted, transaction, future = item
+			if transaction is None:  # close() 放入的结束标记，排在所有事务之后
+				break
+			if future is None:  # set_listener() 放入的唤醒项
+				continue
+			if not future.set_running_or_notify_cancel():
+				continue
+			started = time.perf_counter()
+			self.wait_times.append(started - submitted)
+			try:
+				result = transaction(self._ensure_open())
+			except Exception as e:
+				self.failed += 1
+				if isinstance(e, (serial.SerialException, OSError)):
+					self.logger.error(f"串口事务失败，关闭端口待下次重新打开: {self.name}: {e}")
+					self._drop()
+				future.set_exception(e)
+			else:
+				self.completed += 1
+				future.set_result(result)
+			self.busy_seconds += time.perf_counter() - started
+		self._drop()
+
+	def close(self, timeout: float = 5.0) -> None:
+		"""执行完已提交的事务后关闭串口"""
+		if not self._running:
+			return
+		self._running = False
+		self._queue.put((float("inf"), next(self._sequence), 0.0, None, None))
+		self._interrupt_idle_read()
+		self._thread.join(timeout)
+
+	def stats(self) -> Dict[str, float]:
+		waits = sorted(self.wait_times)
+		return {
+			"queue_depth": self._queue.qsize(),
+			"max_depth": self.max_depth,
+			"submitted": self.submitted,
+			"completed": self.completed,
+			"failed": self.failed,
+			"opens": self.opens,
+			"busy_seconds": self.busy_seconds,
+			"wait_p50_ms": waits[len(waits) // 2] * 1000 if waits else 0.0,
+			"wait_p95_ms": waits[int(len(waits) * 0.95)] * 1000 if waits else 0.0,
+		}
+
+
+class PortManager(LoggerMixin):
+	"""
+	按端口名共享 ManagedPort；同一端口的所有使用者拿到的是同一个对象。
+	port() 和 release() 成对使用，最后一个使用者释放后才关闭串口。
+	"""
+
+	def __init__(self, opener: Callable[..., serial.Serial] = serial.Serial):
+		self.opener = opener
+		self._ports: Dict[str, ManagedPort] = {}
+		self._users: Dict[str, int] = {}
+		self._lock = threading.Lock()
+
+	def port(self, name: str, **serial_kwargs) -> ManagedPort:
+		"""取得 (必要时打开) 端口；打开失败时抛出异常"""
+		with self._lock:
+			managed = self._ports.get(name)
+			if managed is not None:
+				if serial_kwargs.get("baudrate", managed.serial_kwargs.get("baudrate")) != managed.serial_kwargs.get("baudrate"):
+					self.logger.warning(f"串口 {name} 已按 {managed.serial_kwargs} 打开，忽略新的参数 {serial_kwargs}")
+				self._users[name] += 1
+				return managed
+			managed = ManagedPort(name, opener=self.opener, **serial_kwargs)
+			try:
+				managed.open()
+			except Exception:
+				managed.close()
+				raise
+			self._ports[name] = managed
+			self._users[name] = 1
+			return managed
+
+	def release(self, name: str) -> None:
+		with self._lock:
+			if name not in self._ports:
+				return
+			self._users[name] -= 1
+			if self._users[name] > 0:
+				return
+			managed = self._ports.pop(name)
+			del self._users[name]
+		managed.close()
+
+	def close_all(self) -> None:
+		with self._lock:
+			ports, self._ports, self._users = list(self._ports.values()), {}, {}
+		for managed in ports:
+			managed.close()
+
+
+_default_manager: Optional[PortManager] = None
+_default_lock = threading.Lock()
+
+
+def default_manager() -> PortManager:
+	"""进程内默认的 PortManager (第一次使用时创建，退出时关闭全部端口)"""
+	global _default_manager
+	with _default_lock:
+		if _default_manager is None:
+			_default_manager = PortManager()
+			atexit.register(_default_manager.close_all)
+		return _default_manager
+
+
+def get_port(name: str, **serial_kwargs) -> ManagedPort:
+	return default_manager().port(name, **serial_kwargs)
+
+
+def release_port(name: str) -> None:
+	default_manager().release(name)
+
+
+# --- 基准测试：多个模拟三色灯从站 (pty)，每个端口多个使用者 ---
+
+def main():
+	parser = argparse.ArgumentParser(description="各自打开串口 vs 端口管理器 (模拟 RTU 从站, 需要 pty)")
+	parser.add_argument("--ports", type=int, default=3, help="模拟串口 (从站) 数量")
+	parser.add_argument("--users", type=int, default=3, help="每个端口的使用者线程数")
+	parser.add_argument("--requests", type=int, default=30, help="每个使用者的请求数")
+	parser.add_argument("--baudrate", type=int, default=115200, help="模拟线路波特率")
+	args = parser.parse_args()
+
+	import logging
+
+	from light_rtu import CHANNELS, FRAME_LENGTH, MODES, build_write_coil
+	from light_simulator import SimulatedLightSlave
+
+	logging.getLogger(ManagedPort.__name__).setLevel(logging.CRITICAL)
+	frames = [build_write_coil(1, CHANNELS[channel], MODES[mode]) for channel in CHANNELS for mode in ("on", "off")]
+
+	def run_users(worker) -> tuple:
+		results = {"ok": 0, "bad": 0}
+		lock = threading.Lock()
+
+		def user(port_name, index):
+			for i in range(args.requests):
+				frame = frames[(index + i) % len(frames)]
+				ok = worker(port_name, frame)
+				with lock:
+					results["ok" if ok else "bad"] += 1
+
+		threads = [threading.Thread(target=user, args=(slave.port, u)) for slave in slaves for u in range(args.users)]
+		start_time = time.perf_counter()
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		return results, time.perf_counter() - start_time
+
+	slaves = [SimulatedLightSlave(baudrate=args.baudrate).start() for _ in range(args.ports)]
+	total = args.ports * args.users * args.requests
+	try:
+		# 1. 原做法: 每个使用者自己打开串口，互不协调 -> 应答被别人读走、帧交错
+		def uncoordinated(port_name, frame):
+			try:
+				with serial.Serial(port_name, args.baudrate, timeout=0.2) as conn:
+					conn.write(frame)
+					return conn.read(FRAME_LENGTH) == frame
+			except serial.SerialException:
+				return False  # pyserial 也会发现 "multiple access on port"
+
+		results, elapsed = run_users(uncoordinated)
+		print(f"各自打开 (无协调):  {total / elapsed:7.1f} 请求/s, 正确应答 {results['ok']}/{total}")
+
+		# 2. 每次使用时加锁、打开、关闭: 结果正确，但每个事务都要付出打开串口的开销，锁等待不可见
+		locks = {slave.port: threading.Lock() for slave in slaves}
+
+		def open_per_use(port_name, frame):
+			with locks[port_name], serial.Serial(port_name, args.baudrate, timeout=0.2) as conn:
+				conn.write(frame)
+				return conn.read(FRAME_LENGTH) == frame
+
+		results, elapsed = run_users(open_per_use)
+		print(f"加锁 + 每次打开:    {total / elapsed:7.1f} 请求/s, 正确应答 {results['ok']}/{total}")
+
+		# 3. 端口管理器: 每个端口一个所有者线程，串口常开
+		manager = PortManager()
+		ports = {slave.port: manager.port(slave.port, baudrate=args.baudrate) for slave in slaves}
+
+		def managed(port_name, frame):
+			return ports[port_name].exchange(frame, FRAME_LENGTH, timeout=0.2).result() == frame
+
+		results, elapsed = run_users(managed)
+		print(f"端口管理器:         {total / elapsed:7.1f} 请求/s, 正确应答 {results['ok']}/{total}")
+		assert results["ok"] == total, f"端口管理器有 {total - results['ok']} 个请求未得到正确应答"
+
+		# 4. 优先级: 后台请求把队列塞满时，高优先级指令插到队首
+		port = ports[slaves[0].port]
+		for priority, label in ((PRIORITY_LOW, "同优先级 (先进先出)"), (PRIORITY_HIGH, "高优先级")):
+			background = [port.exchange(frames[i % len(frames)], FRAME_LENGTH, 0.2, PRIORITY_LOW) for i in range(50)]
+			start_time = time.perf_counter()
+			port.exchange(frames[0], FRAME_LENGTH, 0.2, priority).result()
+			latency = time.perf_counter() - start_time
+			for future in background:
+				future.result()
+			print(f"  队列中有 50 个后台请求时, {label}指令的等待: {latency * 1000:6.1f} ms")
+		print(f"  {port.stats()}")
+		manager.close_all()
+	finally:
+		for slave in slaves:
+			slave.stop()
+
+
+if __name__ == "__main__":
+	main()
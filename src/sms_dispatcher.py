@@ -0,0 +1,325 @@
+# sms_dispatcher.py
+
+"""
+GSMController 前面的报警短信调度队列。
+
+故障期间同一条报警会在短时间内反复触发，而且要发给好几部值班手机。直接调用 send_sms
+会逐条、逐人发送，每条前面还要设置一次模式。这里改为:
+
+- 调制解调器模式 (AT+CMGF=0) 每个会话只设置一次 (GSMController.ensure_pdu_mode)；
+- 合并: 同一报警 (key 默认为报警文本) 还在队列里未发出时，再次提交只会合并收件人、
+  累计重复次数，发出的短信末尾注明 "(重复 N 次)"；
+- 去重: 同一报警已经发给某个收件人后，dedup_window 秒内再次提交时跳过该收件人 (只计数)，
+  全部收件人都已发过时直接丢弃；
+- 扇出: 一条报警按收件人逐个发送，中间没有任何多余的设置指令；
+- 重试: 发送失败的收件人 (包括设置模式失败) 按指数退避重新排队，最多尝试 max_attempts 次；
+- 限速: 同一个模块两条短信之间至少间隔 min_interval 秒 (运营商对短时间大量发送会拦截)；
+- stats() 给出队列深度、合并/去重条数和从提交到送达的端到端延迟。
+"""
+
+import argparse
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from tools import LoggerMixin
+
+
+@dataclass
+class _Alarm:
+	key: str
+	message: str
+	recipients: List[str]
+	submitted: float  # 第一次提交的时刻 (time.monotonic)
+	repeats: int = 1
+	submit_times: Dict[str, float] = field(default_factory=dict)  # 收件人 -> 该收件人最早被请求的时刻
+	attempt: int = 1  # 第几次尝试发送
+	not_before: float = 0.0  # 重试的报警在此时刻之前不发送 (time.monotonic)
+
+	def text(self) -> str:
+		return self.message if self.repeats == 1 else f"{self.message} (重复 {self.repeats} 次)"
+
+
+class SMSDispatcher(LoggerMixin):
+	"""
+	gsm 需要提供 ensure_pdu_mode() 和 send_sms(phone, message) -> bool (即 GSMController)。
+	"""
+
+	def __init__(self, gsm, dedup_window: float = 300.0, min_interval: float = 3.0, max_queue: int = 1000,
+				 latency_window: int = 1000, retry_initial: float = 30.0, retry_max: float = 600.0,
+				 max_attempts: int = 5):
+		self.gsm = gsm
+		self.dedup_window = dedup_window
+		self.min_interval = min_interval
+		self.max_queue = max_queue
+		self.retry_initial = retry_initial
+		self.retry_max = retry_max
+		self.max_attempts = max(1, max_attempts)
+
+		self._cond = threading.Condition()
+		self._queue: "OrderedDict[str, _Alarm]" = OrderedDict()  # 按首次提交顺序
+		self._recently_sent: Dict[Tuple[str, str], float] = {}  # (key, 收件人) -> 成功发出的时刻
+		self._last_send = 0.0
+		self._running = False
+		self._busy = False
+		self._thread: Optional[threading.Thread] = None
+		self._session_ready = False
+
+		self.submitted = 0
+		self.coalesced = 0
+		self.deduplicated = 0
+		self.rejected = 0
+		self.sent = 0
+		self.failed = 0  # 失败的发送次数 (每次尝试都计数)
+		self.retried = 0  # 重新排队的收件人次数
+		self.abandoned = 0  # 用完 max_attempts 次仍失败而放弃的收件人数
+		self.latencies: Deque[float] = deque(maxlen=latency_window)
+
+	# --- 提交 ---
+
+	def submit(self, message: str, recipients: Sequence[str], key: Optional[str] = None) -> str:
+		"""
+		提交一条报警，返回处理结果: "queued" / "coalesced" / "deduplicated" / "rejected"
+		"""
+		key = key or message
+		now = time.monotonic()
+		with self._cond:
+			self.submitted += 1
+			alarm = self._queue.get(key)
+			if alarm is not None:
+				alarm.repeats += 1
+				for phone in recipients:
+					if phone not in alarm.submit_times:
+						alarm.recipients.append(phone)
+						alarm.submit_times[phone] = now
+				self.coalesced += 1
+				return "coalesced"
+			unique = [p for p in dict.fromkeys(recipients) if not self._sent_recently(key, p, now)]
+			if not unique:
+				self.deduplicated += 1
+				return "deduplicated"
+			if len(self._queue) >= self.max_queue:
+				self.rejected += 1
+				self.logger.error(f"短信队列已满 ({self.max_queue})，丢弃报警: {message}")
+				return "rejected"
+			self._queue[key] = _Alarm(key, message, unique, now, submit_times={p: now for p in unique})
+			self._cond.notify()
+			return "queued"
+
+	# --- 发送线程 ---
+
+	def start(self) -> "SMSDispatcher":
+		self._running = True
+		self._thread = threading.Thread(target=self._run, name="SMSDispatcher", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self, drain: bool = True, timeout: float = 60.0) -> None:
+		"""drain=True 时先把队列中已有的报警发完 (最多等 timeout 秒)"""
+		if drain:
+			self.join(timeout)
+		with self._cond:
+			self._running = False
+			self._cond.notify_all()
+		if self._thread is not None:
+			self._thread.join(timeout)
+			self._thread = None
+
+	def join(self, timeout: Optional[float] = None) -> bool:
+		"""等待队列清空且当前报警发送完毕"""
+		deadline = None if timeout is None else time.monotonic() + timeout
+		with self._cond:
+			while self._queue or self._busy:
+				remaining = None if deadline is None else deadline - time.monotonic()
+				if remaining is not None and remaining <= 0:
+					return False
+				self._cond.wait(remaining)
+		return True
+
+	def reset_session(self) -> None:
+		"""模块重新连接后调用，下一条短信前重新设置模式"""
+		self._session_ready = False
+
+	def _sent_recently(self, key: str, phone: str, now: float) -> bool:
+		sent_at = self._recently_sent.get((key, phone))
+		return sent_at is not None and now - sent_at < self.dedup_window
+
+	def _next_alarm(self) -> Tuple[Optional[_Alarm], Optional[float]]:
+		"""取出第一条已到发送时刻的报警；都在退避中时返回 (None, 最近一条还需等待的秒数)"""
+		now = time.monotonic()
+		wait = None
+		for key, alarm in self._queue.items():
+			if alarm.not_before <= now:
+				del self._queue[key]
+				return alarm, None
+			remaining = alarm.not_before - now
+			wait = remaining if wait is None else min(wait, remaining)
+		return None, wait
+
+	def _run(self) -> None:
+		while True:
+			with self._cond:
+				while True:
+					if not self._running:
+						return
+					alarm, wait = self._next_alarm()
+					if alarm is not None:
+						break
+					self._cond.wait(wait)
+				self._busy = True
+			failed: List[str] = list(alarm.recipients)
+			try:
+				failed = self._dispatch(alarm)
+			finally:
+				with self._cond:
+					self._retry(alarm, failed)
+					self._expire_recent()
+					self._busy = False
+					self._cond.notify_all()
+
+	def _expire_recent(self) -> None:
+		now = time.monotonic()
+		for key in [k for k, t in self._recently_sent.items() if now - t >= self.dedup_window]:
+			del self._recently_sent[key]
+
+	def _retry(self, alarm: _Alarm, failed: List[str]) -> None:
+		"""(持有 _cond 时调用) 发送失败的收件人按指数退避重新排队，次数用完则放弃"""
+		if not failed:
+			return
+		if alarm.attempt >= self.max_attempts:
+			self.abandoned += len(failed)
+			self.logger.error(f"报警短信重试 {alarm.attempt} 次仍失败，放弃: {', '.join(failed)}: {alarm.message}")
+			return
+		self.retried += len(failed)
+		queued = self._queue.get(alarm.key)
+		if queued is not None:
+			# 重试期间同一报警又被提交: 失败的收件人并入新报警，随它一起发送
+			for phone in failed:
+				if phone not in queued.submit_times:
+					queued.recipients.append(phone)
+					queued.submit_times[phone] = alarm.submit_times[phone]
+			return
+		delay = min(self.retry_initial * 2 ** (alarm.attempt - 1), self.retry_max)
+		self._queue[alarm.key] = _Alarm(alarm.key, alarm.message, failed, alarm.submitted, alarm.repeats,
+										{p: alarm.submit_times[p] for p in failed}, alarm.attempt + 1,
+										time.monotonic() + delay)
+		self.logger.warning(f"{len(failed)} 个收件人发送失败，{delay:.0f} 秒后第 {alarm.attempt + 1} 次尝试: "
+							f"{alarm.message}")
+		self._cond.notify()
+
+	def _dispatch(self, alarm: _Alarm) -> List[str]:
+		"""发送一条报警，返回发送失败的收件人"""
+		if not self._session_ready:
+			self._session_ready = self.gsm.ensure_pdu_mode()
+			if not self._session_ready:
+				self.failed += len(alarm.recipients)
+				self.logger.error(f"设置短信模式失败，报警未发送: {alarm.message}")
+				return list(alarm.recipients)
+		failed = []
+		# 在发送过程中被合并进来的收件人也要发到，所以逐个从列表头取
+		index = 0
+		while True:
+			with self._cond:
+				if index >= len(alarm.recipients):
+					break
+				phone = alarm.recipients[index]
+				text = alarm.text()
+				# 另一条同 key 的报警 (例如发送期间重新提交的) 已经发给了这个收件人
+				duplicate = self._sent_recently(alarm.key, phone, time.monotonic())
+			index += 1
+			if duplicate:
+				continue
+			wait = self._last_send + self.min_interval - time.monotonic()
+			if wait > 0:
+				time.sleep(wait)
+			ok = self.gsm.send_sms(phone, text)
+			self._last_send = time.monotonic()
+			if ok:
+				self.sent += 1
+				self.latencies.append(self._last_send - alarm.submit_times[phone])
+				with self._cond:
+					self._recently_sent[(alarm.key, phone)] = self._last_send
+			else:
+				self.failed += 1
+				failed.append(phone)
+				# 发送失败通常是模块状态问题，下一条之前重新设置模式
+				self._session_ready = False
+				self.logger.error(f"报警短信发送失败: {phone}: {text}")
+		return failed
+
+	# --- 统计 ---
+
+	def stats(self) -> Dict[str, float]:
+		with self._cond:
+			depth = sum(len(a.recipients) for a in self._queue.values())
+			ordered = sorted(self.latencies)
+		return {
+			"queue_depth": depth,
+			"queued_alarms": len(self._queue),
+			"submitted": self.submitted,
+			"coalesced": self.coalesced,
+			"deduplicated": self.deduplicated,
+			"rejected": self.rejected,
+			"sent": self.sent,
+			"failed": self.failed,
+			"retried": self.retried,
+			"abandoned": self.abandoned,
+			"latency_mean_s": sum(ordered) / len(ordered) if ordered else 0.0,
+			"latency_p95_s": ordered[int(len(ordered) * 0.95)] if ordered else 0.0,
+			"latency_max_s": ordered[-1] if ordered else 0.0,
+		}
+
+
+# --- 基准测试：故障期间的报警风暴 (脚本化模块) ---
+
+def main():
+	parser = argparse.ArgumentParser(description="报警风暴: 逐条直接发送 vs 调度队列 (脚本化模块，需要 pty)")
+	parser.add_argument("--alarms", type=int, default=3, help="不同报警的种类数")
+	parser.add_argument("--repeats", type=int, default=10, help="每种报警在风暴中重复触发的次数")
+	parser.add_argument("--phones", type=int, default=4, help="值班手机数量")
+	parser.add_argument("--min-interval", type=float, default=0.2, help="同一模块两条短信的最小间隔 (秒)")
+	parser.add_argument("--send-delay", type=float, default=0.05, help="模拟短信网络发送耗时 (秒)")
+	args = parser.parse_args()
+
+	import contextlib
+	import io
+	import logging
+
+	from debug_gsm_send import GSMController
+	from modem_simulator import ScriptedModem
+
+	logging.getLogger(GSMController.__name__).setLevel(logging.WARNING)
+	phones = [f"1771268{i:04d}" for i in range(args.phones)]
+	storm = [f"报警 {i}: 真空度超限" for _ in range(args.repeats) for i in range(args.alarms)]
+
+	for label in ("逐条直接发送", "调度队列"):
+		with ScriptedModem(response_delay=0.005, send_delay=args.send_delay) as modem, \
+				contextlib.redirect_stdout(io.StringIO()):
+			gsm = GSMController(modem.port, 115200)
+			gsm.connect_gsm()
+			start_time = time.perf_counter()
+			if label == "逐条直接发送":
+				for message in storm:
+					for phone in phones:
+						gsm.reset_pdu_mode()  # 原 send_sms 每条短信前都发送 AT+CMGF=0
+						gsm.send_sms(phone, message)
+						time.sleep(args.min_interval)
+				stats = None
+			else:
+				dispatcher = SMSDispatcher(gsm, dedup_window=60, min_interval=args.min_interval).start()
+				for message in storm:
+					dispatcher.submit(message, phones)
+				dispatcher.stop(drain=True)
+				stats = dispatcher.stats()
+			elapsed = time.perf_counter() - start_time
+			gsm.disconnect_gsm()
+			setup = sum(1 for c in modem.commands if c.upper().startswith("AT+CMGF"))
+		print(f"{label}: 发出短信 {len(modem.sent_pdus)} 条, AT+CMGF {setup} 次, 总耗时 {elapsed:.2f} s")
+		if stats:
+			print(f"  {stats}")
+
+
+if __name__ == "__main__":
+	main()
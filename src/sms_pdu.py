@@ -0,0 +1,364 @@
+# sms_pdu.py
+
+"""
+短信 PDU 编解码 (从 debug_gsm_send.py 的 SMSPDUCodec 扩展而来)。
+
+原实现固定使用 UCS2 (DCS=08)，用户数据长度按一个字节写入，超过 70 个字符的短信会悄悄溢出，
+纯 ASCII 的报警也要占用双倍的空口容量。这里:
+
+- 文本全部能用 GSM 7 位默认字母表 (含扩展表) 表示时使用 7 位打包 (DCS=00)，单条 160 字符，
+  否则使用 UCS2，单条 70 字符；
+- 超长文本拆成级联短信，每段带 UDH (IEI=00, 8 位参考号)，7 位每段 153 字符、UCS2 每段 67 字符；
+  拆分时不会把扩展字符的转义序列或 UTF-16 代理对拆到两段里；
+- 文本到用户数据的编码结果按 LRU 缓存，反复发送的报警模板只编码一次；
+- decode_pdu() 可以解析 SMS-SUBMIT / SMS-DELIVER，decode_message() 把级联的各段拼回原文。
+"""
+
+import argparse
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+GSM7_BASIC = (
+	"@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+	"¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENSION = {"\f": 0x0A, "^": 0x14, "{": 0x28, "}": 0x29, "\\": 0x2F, "[": 0x3C, "~": 0x3D, "]": 0x3E,
+				  "|": 0x40, "€": 0x65}
+GSM7_ESCAPE = 0x1B
+
+_GSM7_ENCODE = {char: code for code, char in enumerate(GSM7_BASIC) if code != GSM7_ESCAPE}
+_GSM7_DECODE = {code: char for char, code in _GSM7_ENCODE.items()}
+_GSM7_EXTENSION_DECODE = {code: char for char, code in GSM7_EXTENSION.items()}
+
+DCS_GSM7 = 0x00
+DCS_UCS2 = 0x08
+
+MAX_SEPTETS = 160  # 单条 7 位短信的字符数 (140 字节)
+MAX_UCS2_OCTETS = 140
+CONCAT_UDH_OCTETS = 6  # 05 00 03 ref total seq
+
+
+class SMSPDUError(Exception):
+	pass
+
+
+@dataclass
+class DecodedPDU:
+	phone: str
+	text: str
+	dcs: int
+	reference: Optional[int] = None  # 级联短信的参考号，单条短信为 None
+	total: int = 1
+	sequence: int = 1
+	sms_center: str = ""
+
+
+def gsm7_septets(text: str) -> Optional[List[int]]:
+	"""把文本转换成 GSM 7 位码 (扩展字符为 ESC + 码)，存在无法表示的字符时返回 None"""
+	septets = []
+	for char in text:
+		code = _GSM7_ENCODE.get(char)
+		if code is not None:
+			septets.append(code)
+			continue
+		code = GSM7_EXTENSION.get(char)
+		if code is None:
+			return None
+		septets.append(GSM7_ESCAPE)
+		septets.append(code)
+	return septets
+
+
+def pack_septets(septets: List[int], fill_bits: int = 0) -> bytes:
+	"""按 GSM 03.38 把 7 位码依次从低位打包进字节流，前面留出 fill_bits 个填充位 (与 UDH 对齐用)"""
+	value = 0
+	position = fill_bits
+	for septet in septets:
+		value |= septet << position
+		position += 7
+	return value.to_bytes((position + 7) // 8, "little")
+
+
+def unpack_septets(data: bytes, count: int, fill_bits: int = 0) -> List[int]:
+	value = int.from_bytes(data, "little") >> fill_bits
+	return [(value >> (7 * i)) & 0x7F for i in range(count)]
+
+
+def gsm7_decode(septets: Iterable[int]) -> str:
+	chars = []
+	escaped = False
+	for septet in septets:
+		if escaped:
+			chars.append(_GSM7_EXTENSION_DECODE.get(septet, " "))
+			escaped = False
+		elif septet == GSM7_ESCAPE:
+			escaped = True
+		else:
+			chars.append(_GSM7_DECODE[septet])
+	return "".join(chars)
+
+
+def _split_septets(septets: List[int], limit: int) -> List[List[int]]:
+	segments = []
+	start = 0
+	while start < len(septets):
+		end = min(start + limit, len(septets))
+		# 不把 ESC 和它后面的扩展码拆开
+		if end < len(septets) and septets[end - 1] == GSM7_ESCAPE:
+			end -= 1
+		segments.append(septets[start:end])
+		start = end
+	return segments
+
+
+def _split_ucs2(data: bytes, limit: int) -> List[bytes]:
+	segments = []
+	start = 0
+	while start < len(data):
+		end = min(start + limit, len(data))
+		# 不把 UTF-16 代理对拆开 (高代理 D800-DBFF 留到下一段)
+		if end < len(data) and 0xD8 <= data[end - 2] <= 0xDB:
+			end -= 2
+		segments.append(data[start:end])
+		start = end
+	return segments
+
+
+def _swap_semi_octets(digits: str) -> str:
+	if len(digits) % 2 == 1:
+		digits += "F"
+	return "".join(digits[i + 1] + digits[i] for i in range(0, len(digits), 2))
+
+
+class SMSPDUCodec:
+	# 从 alarm_manager.py 提取的 PDU 编解码器
+	def __init__(self, sms_center: str = "+8613344181200", cache_size: int = 256):
+		self.sms_center = sms_center
+		self.cache_size = cache_size
+		self._reference = random.randrange(256)  # 级联短信参考号，每条长短信递增
+		# 文本 -> (DCS, [(UDL, 用户数据 hex)])，用户数据不含 UDH
+		self._cache: "OrderedDict[str, Tuple[int, List[Tuple[int, str]]]]" = OrderedDict()
+		self._phone_cache: Dict[str, str] = {}
+		self.cache_hits = 0
+		self.cache_misses = 0
+
+	def _encode_phone_number(self, phone: str) -> str:
+		if not phone:
+			raise SMSPDUError("手机号码不能为空")
+		encoded = self._phone_cache.get(phone)
+		if encoded is None:
+			normalized_phone = phone[3:] if phone.startswith("+86") else (phone[1:] if phone.startswith('+') else phone)
+			address_type = 0x91 if phone.startswith('+') else 0x81
+			encoded = f"{len(normalized_phone):02X}{address_type:02X}{_swap_semi_octets(normalized_phone)}"
+			self._phone_cache[phone] = encoded
+		return encoded
+
+	def _encode_sms_center(self, sms_center: str) -> str:
+		if not sms_center: return "00"
+		normalized = sms_center[1:] if sms_center.startswith('+') else sms_center
+		encoded_digits = _swap_semi_octets(normalized)
+		return f"{(1 + len(encoded_digits) // 2):02X}91{encoded_digits}"
+
+	# --- 用户数据 ---
+
+	def _encode_user_data(self, message: str) -> Tuple[int, List[Tuple[int, str]]]:
+		"""
+		返回 (DCS, 各段 (UDL, 用户数据 hex))。多段时每段的用户数据已经为 UDH 预留了位置:
+		7 位编码按 UDH 之后的填充位打包，UDL 包含 UDH 占用的字符数。
+		"""
+		cached = self._cache.get(message)
+		if cached is not None:
+			self._cache.move_to_end(message)
+			self.cache_hits += 1
+			return cached
+		self.cache_misses += 1
+
+		septets = gsm7_septets(message)
+		if septets is not None:
+			dcs = DCS_GSM7
+			if len(septets) <= MAX_SEPTETS:
+				parts = [(len(septets), pack_septets(septets).hex().upper())]
+			else:
+				header_septets = (CONCAT_UDH_OCTETS * 8 + 6) // 7
+				fill_bits = header_septets * 7 - CONCAT_UDH_OCTETS * 8
+				parts = [(header_septets + len(segment), pack_septets(segment, fill_bits).hex().upper())
+						 for segment in _split_septets(septets, MAX_SEPTETS - header_septets)]
+		else:
+			dcs = DCS_UCS2
+			data = message.encode("utf-16-be")
+			if len(data) <= MAX_UCS2_OCTETS:
+				parts = [(len(data), data.hex().upper())]
+			else:
+				parts = [(CONCAT_UDH_OCTETS + len(segment), segment.hex().upper())
+						 for segment in _split_ucs2(data, MAX_UCS2_OCTETS - CONCAT_UDH_OCTETS)]
+		if len(parts) > 255:
+			raise SMSPDUError(f"短信过长: 需要 {len(parts)} 段，级联短信最多 255 段")
+
+		result = (dcs, parts)
+		self._cache[message] = result
+		if len(self._cache) > self.cache_size:
+			self._cache.popitem(last=False)
+		return result
+
+	def segment_count(self, message: str) -> int:
+		return len(self._encode_user_data(message)[1])
+
+	# --- 编码 ---
+
+	def encode_parts(self, phone: str, message: str) -> List[str]:
+		"""编码为一条或多条 (级联) SMS-SUBMIT PDU，按发送顺序返回"""
+		sca = self._encode_sms_center(self.sms_center)
+		da = self._encode_phone_number(phone)
+		dcs, parts = self._encode_user_data(message)
+		if len(parts) == 1:
+			udl, user_data = parts[0]
+			return [f"{sca}1100{da}00{dcs:02X}AA{udl:02X}{user_data}"]
+
+		self._reference = (self._reference + 1) % 256
+		total = len(parts)
+		pdus = []
+		for sequence, (udl, user_data) in enumerate(parts, 1):
+			udh = f"050003{self._reference:02X}{total:02X}{sequence:02X}"
+			# 0x51: SMS-SUBMIT + 相对有效期 + UDHI (用户数据带头部)
+			pdus.append(f"{sca}5100{da}00{dcs:02X}AA{udl:02X}{udh}{user_data}")
+		return pdus
+
+	def encode_sms(self, phone: str, message: str) -> str:
+		"""编码为单条 PDU；需要拆分的长短信请使用 encode_parts"""
+		pdus = self.encode_parts(phone, message)
+		if len(pdus) > 1:
+			raise SMSPDUError(f"短信过长，需要拆分为 {len(pdus)} 段，请使用 encode_parts")
+		return pdus[0]
+
+	def get_pdu_length(self, pdu: str) -> int:
+		sca_length = int(pdu[0:2], 16)
+		return (len(pdu) - (sca_length + 1) * 2) // 2
+
+	# --- 解码 ---
+
+	@staticmethod
+	def _decode_address(digits_count: int, address_type: int, encoded: str) -> str:
+		digits = "".join(encoded[i + 1] + encoded[i] for i in range(0, len(encoded), 2))[:digits_count]
+		return ("+" if address_type == 0x91 else "") + digits
+
+	def decode_pdu(self, pdu: str) -> DecodedPDU:
+		"""解析 SMS-SUBMIT (本机发出) 或 SMS-DELIVER (收到的短信) PDU"""
+		try:
+			data = bytes.fromhex(pdu)
+			sca_length = data[0]
+			sms_center = ""
+			if sca_length:
+				sms_center = self._decode_address((sca_length - 1) * 2, data[1], data[2:1 + sca_length].hex().upper())
+				sms_center = sms_center.rstrip("F")
+			pos = 1 + sca_length
+			first_octet = data[pos]
+			pos += 1
+			message_type = first_octet & 0x03
+			if message_type == 0x01:
+				pos += 1  # MR
+			elif message_type != 0x00:
+				raise SMSPDUError(f"不支持的 PDU 类型: {message_type}")
+			digits_count, address_type = data[pos], data[pos + 1]
+			address_octets = (digits_count + 1) // 2
+			phone = self._decode_address(digits_count, address_type, data[pos + 2:pos + 2 + address_octets].hex().upper())
+			pos += 2 + address_octets
+			pos += 1  # PID
+			dcs = data[pos]
+			pos += 1
+			if message_type == 0x00:
+				pos += 7  # SCTS
+			else:
+				validity_format = (first_octet >> 3) & 0x03
+				pos += {0: 0, 2: 1}.get(validity_format, 7)
+			udl = data[pos]
+			user_data = data[pos + 1:]
+		except (ValueError, IndexError) as e:
+			raise SMSPDUError(f"PDU 格式错误: {e}") from e
+
+		reference, total, sequence = None, 1, 1
+		header_octets = 0
+		if first_octet & 0x40:
+			header_octets = user_data[0] + 1
+			header = user_data[1:header_octets]
+			i = 0
+			while i + 1 < len(header):
+				iei, length = header[i], header[i + 1]
+				value = header[i + 2:i + 2 + length]
+				if iei == 0x00 and length == 3:
+					reference, total, sequence = value[0], value[1], value[2]
+				elif iei == 0x08 and length == 4:
+					reference, total, sequence = (value[0] << 8) | value[1], value[2], value[3]
+				i += 2 + length
+
+		alphabet = (dcs >> 2) & 0x03 if dcs & 0xC0 == 0 else 0
+		if alphabet == 0:
+			header_septets = (header_octets * 8 + 6) // 7
+			septets = unpack_septets(user_data, udl)
+			text = gsm7_decode(septets[header_septets:])
+		elif alphabet == 2:
+			text = user_data[header_octets:udl].decode("utf-16-be", "replace")
+		else:
+			text = user_data[header_octets:udl].hex().upper()
+		return DecodedPDU(phone, text, dcs, reference, total, sequence, sms_center)
+
+	def decode_message(self, pdus: Iterable[str]) -> str:
+		"""把同一条短信的各段 (顺序任意) 拼回原文"""
+		decoded = sorted((self.decode_pdu(pdu) for pdu in pdus), key=lambda part: part.sequence)
+		if decoded and len(decoded) != decoded[0].total:
+			raise SMSPDUError(f"级联短信不完整: 收到 {len(decoded)}/{decoded[0].total} 段")
+		return "".join(part.text for part in decoded)
+
+
+# --- 基准测试：编码方式与分段数、模板缓存、往返校验 ---
+
+def main():
+	parser = argparse.ArgumentParser(description="短信 PDU 编码: 原 UCS2 实现 vs 7 位打包 + 级联分段 + 缓存")
+	parser.add_argument("--iterations", type=int, default=20000, help="编码吞吐测试的次数")
+	parser.add_argument("--roundtrip", type=int, default=2000, help="随机文本往返校验的条数")
+	args = parser.parse_args()
+
+	phone = "17712689742"
+	alarms = {
+		"ASCII 报警": "ALARM LN2 separator P=1.2E-5 Pa > limit 1.0E-5 Pa, valve V3 Closed",
+		"中文报警": "真空度报警: 1.2E-5 Pa，液氮分离器阀门 V3 已关闭",
+		"ASCII 长报警": "; ".join(f"CH{i:02d} temp={20 + i:.1f}C [WARN]" for i in range(12)),
+		"中文长报警": "，".join(f"通道{i}温度超限" for i in range(20)),
+	}
+	codec = SMSPDUCodec()
+	header = codec.get_pdu_length(codec.encode_sms(phone, ""))  # 不含用户数据的 PDU 长度
+	print("分段数 (每段一次 AT+CMGS 往返):")
+	for label, message in alarms.items():
+		legacy_octets = header + len(message.encode("utf-16-be"))
+		legacy = "溢出" if legacy_octets - header > MAX_UCS2_OCTETS else "1 段"
+		pdus = codec.encode_parts(phone, message)
+		dcs = "7 位" if codec.decode_pdu(pdus[0]).dcs == DCS_GSM7 else "UCS2"
+		assert codec.decode_message(pdus) == message
+		print(f"  {label:10s} {len(message):4d} 字符: 原实现 UCS2 {legacy_octets:4d} 字节 ({legacy}) | "
+			  f"现在 {dcs} {len(pdus)} 段, 共 {sum(codec.get_pdu_length(p) for p in pdus)} 字节")
+
+	message = alarms["ASCII 报警"]
+	for label, cache_size in (("不缓存", 0), ("模板缓存", 256)):
+		bench = SMSPDUCodec(cache_size=cache_size)
+		start_time = time.perf_counter()
+		for _ in range(args.iterations):
+			bench.encode_parts(phone, message)
+		elapsed = time.perf_counter() - start_time
+		print(f"编码 ({label}): {elapsed / args.iterations * 1e6:6.2f} us/条")
+
+	rng = random.Random(0)
+	alphabet = GSM7_BASIC.replace("\x1b", "") + "".join(GSM7_EXTENSION) + "报警阀门温度😀"
+	for _ in range(args.roundtrip):
+		text = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 400)))
+		if rng.random() < 0.5:
+			text = "".join(c for c in text if gsm7_septets(c) is not None)
+		if not text:
+			continue
+		assert codec.decode_message(codec.encode_parts(phone, text)) == text, text
+	print(f"往返校验: {args.roundtrip} 条随机文本全部一致")
+
+
+if __name__ == "__main__":
+	main()
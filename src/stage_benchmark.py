@@ -0,0 +1,162 @@
+# stage_benchmark.py
+
+"""
+分阶段延迟基准测试：在录制 (或合成) 的会话上回放阶段 2，报告每个阶段的 p50/p95/p99 延迟。
+
+阶段划分:
+	crop       - 逐区域 PIL crop (原来逐区域 OCR 的第一步)
+	preprocess - 逐区域 convert('L') + ImageEnhance，或整帧一次查表 (--preprocess frame)
+	ocr        - 字形模板匹配 (默认) 或 Tesseract 引擎池 (--ocr tesseract)
+	color      - 指示灯颜色识别 (IndicatorTable)
+
+不需要 GUI，可以在 Linux 上运行；用同一个会话文件比较改动前后的各阶段延迟:
+	python stage_benchmark.py --synthetic 200                 # 生成合成会话并测试
+	python stage_benchmark.py --session logs/molly_session.zip # 测试录制的真实会话
+	python stage_benchmark.py --session ... --analyze          # 把会话送入 read_Lbar5.analyze_frame
+"""
+
+import argparse
+import math
+import os
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Sequence
+
+from PIL import ImageEnhance
+
+from frame_preprocess import FramePreprocessor
+from glyph_matcher import GlyphAtlas, GlyphRecognizer, render_corpus
+from indicator_classifier import Indicator, IndicatorTable
+from panel_frame import FrameReplayer, build_synthetic_session
+from region_cache import region_box
+
+READINGS = (("vacuum", '0123456789.E-'), ("temp", '0123456789Kk.'))
+
+
+def percentile(sorted_samples: Sequence[float], q: float) -> float:
+	"""最近秩法百分位数，sorted_samples 必须已排序"""
+	if not sorted_samples:
+		return 0.0
+	k = max(0, math.ceil(q / 100 * len(sorted_samples)) - 1)
+	return sorted_samples[min(k, len(sorted_samples) - 1)]
+
+
+def latency_summary(samples: Sequence[float]) -> Dict[str, float]:
+	"""返回 {"n", "p50_ms", "p95_ms", "p99_ms", "max_ms"}"""
+	ordered = sorted(samples)
+	return {
+		"n": len(ordered),
+		"p50_ms": percentile(ordered, 50) * 1000,
+		"p95_ms": percentile(ordered, 95) * 1000,
+		"p99_ms": percentile(ordered, 99) * 1000,
+		"max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+	}
+
+
+def _build_recognizers(preprocessor, atlas_dir):
+	"""每种读数一个字形识别器；没有图集目录时用合成语料生成 (与合成会话的字体一致)"""
+	recognizers = {}
+	for name, whitelist in READINGS:
+		path = os.path.join(atlas_dir, f"{name}.npz") if atlas_dir else None
+		if path and os.path.exists(path):
+			atlas = GlyphAtlas.load(path)
+		else:
+			samples = render_corpus(40, name, seed=100)
+			if preprocessor is not None:
+				samples = [(preprocessor.process(img, [(0, 0) + img.size]).gray, text) for img, text in samples]
+			else:
+				samples = [(ImageEnhance.Contrast(img).enhance(2.0), text) for img, text in samples]
+			atlas = GlyphAtlas.from_labeled_crops(samples)
+		recognizers[name] = GlyphRecognizer(atlas)
+	return recognizers
+
+
+def run_stages(replayer: FrameReplayer, preprocess_mode: str = "frame", ocr_mode: str = "glyph",
+			   atlas_dir: str = None) -> Dict[str, List[float]]:
+	"""逐帧执行各阶段并记录耗时，返回 {阶段名: [每帧耗时]}"""
+	preprocessor = FramePreprocessor(contrast=2.0, per_region=True) if preprocess_mode == "frame" else None
+	recognizers = _build_recognizers(preprocessor, atlas_dir)
+	indicators = IndicatorTable([Indicator("shutter", "shutter", (20, 15))])
+	pool = None
+	if ocr_mode == "tesseract":
+		from ocr_engine import get_default_pool
+
+		pool = get_default_pool()
+
+	timings: Dict[str, List[float]] = defaultdict(list)
+	for frame in replayer.frames():
+		image = frame.main_screenshot_pil
+		boxes = {name: region_box(frame.main_win_coords, frame.control_coords[name]) for name, _ in READINGS}
+
+		t0 = time.perf_counter()
+		if preprocessor is None:
+			crops = {name: image.crop(box) for name, box in boxes.items()}
+			t1 = time.perf_counter()
+			regions = {name: ImageEnhance.Contrast(crop.convert('L')).enhance(2.0) for name, crop in crops.items()}
+		else:
+			t1 = t0  # 整帧模式没有单独的裁剪步骤，区域是预处理结果的视图
+			pre = preprocessor.process(image, list(boxes.values()))
+			regions = {name: pre.region(box) for name, box in boxes.items()}
+		t2 = time.perf_counter()
+		for name, whitelist in READINGS:
+			if pool is not None:
+				pool.recognize(regions[name], whitelist)
+			else:
+				recognizers[name].match(regions[name], whitelist)
+		t3 = time.perf_counter()
+		indicators.classify(image, frame.main_win_coords, frame.control_coords)
+		t4 = time.perf_counter()
+
+		timings["crop"].append(t1 - t0)
+		timings["preprocess"].append(t2 - t1)
+		timings["ocr"].append(t3 - t2)
+		timings["color"].append(t4 - t3)
+		timings["total"].append(t4 - t0)
+	return timings
+
+
+def main():
+	parser = argparse.ArgumentParser(description="阶段 2 分阶段延迟基准测试 (回放录制会话，无需GUI)")
+	parser.add_argument("--session", type=str, default=None, help="录制的会话文件 (panel_frame.FrameRecorder)")
+	parser.add_argument("--synthetic", type=int, default=100, help="未指定会话时生成的合成帧数")
+	parser.add_argument("--preprocess", choices=("region", "frame"), default="frame",
+						help="region: 逐区域 crop+convert+enhance；frame: 外接矩形一次查表")
+	parser.add_argument("--ocr", choices=("glyph", "tesseract"), default="glyph", help="读数识别方式")
+	parser.add_argument("--atlas-dir", type=str, default=None, help="字形图集目录 (vacuum.npz / temp.npz)")
+	parser.add_argument("--analyze", action="store_true", help="另外把会话整体送入 read_Lbar5.analyze_frame")
+	args = parser.parse_args()
+
+	session = args.session
+	if session is None:
+		session = os.path.join(tempfile.gettempdir(), "molly_synthetic_session.zip")
+		build_synthetic_session(session, frames=args.synthetic)
+		print(f"已生成合成会话: {session} ({args.synthetic} 帧)")
+
+	replayer = FrameReplayer(session)
+	timings = run_stages(replayer, args.preprocess, args.ocr, args.atlas_dir)
+	print(f"\n--- 分阶段延迟 ({len(replayer)} 帧, preprocess={args.preprocess}, ocr={args.ocr}) ---")
+	for stage in ("crop", "preprocess", "ocr", "color", "total"):
+		s = latency_summary(timings[stage])
+		print(f"  {stage:10s} p50 {s['p50_ms']:8.3f} ms | p95 {s['p95_ms']:8.3f} ms | "
+			  f"p99 {s['p99_ms']:8.3f} ms | max {s['max_ms']:8.3f} ms")
+
+	if args.analyze:
+		import read_Lbar5
+
+		latencies = []
+		for _ in replayer.replay(lambda f: latencies.append(_timed(read_Lbar5.analyze_frame, f))):
+			pass
+		s = latency_summary(latencies)
+		print(f"  {'analyze':10s} p50 {s['p50_ms']:8.3f} ms | p95 {s['p95_ms']:8.3f} ms | "
+			  f"p99 {s['p99_ms']:8.3f} ms | max {s['max_ms']:8.3f} ms")
+
+
+def _timed(func, *args) -> float:
+	start_time = time.perf_counter()
+	func(*args)
+	return time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+	main()
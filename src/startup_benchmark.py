@@ -0,0 +1,133 @@
+# startup_benchmark.py
+
+"""
+启动 (导入) 耗时基准测试: 每个模块在一个新的解释器里用 python -X importtime 导入，报告
+模块自身及其依赖的累计导入耗时、最重的几个依赖，以及导入后是否已经加载了只应在首次使用时
+才加载的后端 (Qt、pywinauto、pyautogui、Tesseract 等)。
+
+在 Linux 上也能运行 (不需要 GUI / COM 口)，超出预算或导入失败时以非零状态码退出，
+可以放进 run.bat / CI:
+	python startup_benchmark.py                  # 默认模块列表，每个模块预算 150 ms
+	python startup_benchmark.py --budget-ms 80 tools light_rtu
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# 不需要 GUI 的核心模块: 读取器、报警、传输、存储、守护进程
+CORE_MODULES = (
+	"tools", "log_pipeline", "metrics", "process_watcher", "alarm_rules",
+	"sms_pdu", "at_transport", "serial_port_manager", "sms_dispatcher", "debug_gsm_send",
+	"light_rtu", "debug_light_rod", "modbus_registers", "modbus_session", "debug_LN2_reader",
+	"timeseries_store", "ocr_engine", "control_locator", "screen_capture", "read_Lbar5", "polling_engine", "inspection_daemon",
+)
+
+# 图像模块离不开 numpy + Pillow (冷导入合计约 150 ms)，单独给预算 (毫秒)
+IMAGE_BUDGETS_MS = {"ocr_engine": 250.0, "read_Lbar5": 250.0}
+
+# 只应在首次使用时加载的后端 (重量级或只能在 Windows 上使用)
+LAZY_BACKENDS = ("PySide6", "pywinauto", "pyautogui", "pytesseract", "tesserocr", "pymodbus", "http.server",
+				 "win32api", "comtypes")
+
+# 用 __import__ 而不是 importlib.import_module: 后者走纯 Python 路径，-X importtime 不记录该模块本身
+_PROBE = (
+	"import sys\n"
+	"__import__(sys.argv[1])\n"
+	"print('LOADED=' + ','.join(m for m in sys.argv[2].split(',') if m in sys.modules))\n"
+)
+
+
+@dataclass
+class ImportReport:
+	module: str
+	total_us: int = 0  # 模块本身及其全部依赖的累计耗时
+	error: Optional[str] = None
+	heaviest: List[Tuple[str, int]] = field(default_factory=list)  # 最重的直接依赖 (模块名, 累计微秒)
+	loaded_backends: List[str] = field(default_factory=list)
+
+
+def _importtime_lines(stderr: str) -> List[Tuple[int, str, int, int]]:
+	"""解析 -X importtime 的输出: [(缩进, 模块名, 自身微秒, 累计微秒)]"""
+	entries = []
+	for line in stderr.splitlines():
+		if not line.startswith("import time:") or "|" not in line:
+			continue
+		parts = line[len("import time:"):].split("|")
+		try:
+			self_us, cumulative_us = int(parts[0]), int(parts[1])
+		except ValueError:
+			continue  # 表头
+		name = parts[2].rstrip()
+		entries.append((len(name) - len(name.lstrip()), name.strip(), self_us, cumulative_us))
+	return entries
+
+
+def measure(module: str, cwd: str, env: Dict[str, str]) -> ImportReport:
+	report = ImportReport(module)
+	completed = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE, module, ",".join(LAZY_BACKENDS)],
+							   cwd=cwd, env=env, capture_output=True, text=True, encoding="utf-8", errors="replace")
+	if completed.returncode != 0:
+		lines = [line for line in completed.stderr.splitlines() if not line.startswith("import time:")]
+		report.error = lines[-1] if lines else f"退出码 {completed.returncode}"
+		return report
+	entries = _importtime_lines(completed.stderr)
+	index = next((i for i, (indent, name, _, _) in enumerate(entries) if name == module and indent == 1), None)
+	if index is not None:
+		report.total_us = entries[index][3]
+		# -X importtime 先输出依赖再输出模块本身: 紧挨在它前面、缩进更深的行就是它的导入树
+		start = index
+		while start > 0 and entries[start - 1][0] > 1:
+			start -= 1
+		direct = [(name, us) for indent, name, _, us in entries[start:index] if indent == 3]
+		report.heaviest = sorted(direct, key=lambda item: -item[1])[:3]
+	for line in completed.stdout.splitlines():
+		if line.startswith("LOADED="):
+			report.loaded_backends = [m for m in line[len("LOADED="):].split(",") if m]
+	return report
+
+
+def main():
+	parser = argparse.ArgumentParser(description="每个模块在新解释器中的导入耗时 (-X importtime) 与预算检查")
+	parser.add_argument("modules", nargs="*", help="要测试的模块，默认为核心模块列表")
+	parser.add_argument("--budget-ms", type=float, default=150.0,
+						help="每个模块的累计导入耗时预算 (毫秒)，图像模块见 IMAGE_BUDGETS_MS")
+	parser.add_argument("--repeat", type=int, default=3, help="每个模块测试次数，取最小值 (排除首次编译 .pyc 等干扰)")
+	parser.add_argument("--allow-backends", action="store_true", help="导入时加载了延迟后端不算失败")
+	args = parser.parse_args()
+
+	modules = args.modules or list(CORE_MODULES)
+	here = os.path.dirname(os.path.abspath(__file__))
+	env = dict(os.environ)
+	env["PYTHONPATH"] = here + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+
+	failures = 0
+	total = 0
+	print(f"{'模块':22s} {'导入耗时':>10s}  最重的依赖 / 已加载的延迟后端")
+	for module in modules:
+		reports = [measure(module, here, env) for _ in range(max(1, args.repeat))]
+		report = min(reports, key=lambda r: (r.error is not None, r.total_us))
+		if report.error is not None:
+			failures += 1
+			print(f"{module:22s} {'失败':>10s}  {report.error}")
+			continue
+		total += report.total_us
+		budget_ms = IMAGE_BUDGETS_MS.get(module, args.budget_ms)
+		over = report.total_us > budget_ms * 1000
+		backends = report.loaded_backends if not args.allow_backends else []
+		if over or backends:
+			failures += 1
+		heaviest = ", ".join(f"{name} {us / 1000:.0f}" for name, us in report.heaviest)
+		flag = f" 超出预算 ({budget_ms:g} ms)" if over else ""
+		loaded = f" | 已加载: {', '.join(report.loaded_backends)}" if report.loaded_backends else ""
+		print(f"{module:22s} {report.total_us / 1000:8.1f} ms  [{heaviest}]{loaded}{flag}")
+	print(f"\n合计 {total / 1000:.0f} ms (各模块分别在新解释器中导入)，预算 {args.budget_ms:g} ms/模块，"
+		  f"{'全部通过' if not failures else f'{failures} 个模块未通过'}")
+	sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,413 @@
+# timeseries_store.py
+
+"""
+巡检读数的嵌入式时序存储 (SQLite, WAL 模式)。
+
+read_Lbar5 (真空、冷泵温度、快门) 和 LN2SeparatorReader (液位、压力) 的读数原来只打印出来，
+这里把它们写进一个 SQLite 文件，供趋势分析使用:
+
+- 写入: append() 只把样本放进内存缓冲区，后台写线程按批 (batch_size 条或 flush_interval 秒)
+  在一个事务里写入，轮询循环不会被磁盘 IO 阻塞；
+- 原始样本表以 (series_id, ts) 为聚簇主键 (WITHOUT ROWID)，按时间范围扫描是连续读取；
+- 写入时同步维护分钟级和小时级汇总表 (count/sum/min/max)，按小时~按月的降采样查询
+  只读汇总表，不扫描原始样本；
+- range() 是游标迭代器，分批取行，不会把整段数据读进内存。
+
+时间戳统一为 Unix 毫秒整数；数值为 REAL，无法解析的读数记为 NULL (降采样时忽略)。
+WAL 模式下读写互不阻塞，可以在轮询进程写入的同时用另一个进程查询。
+"""
+
+import argparse
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from tools import LoggerMixin
+
+# 汇总表的桶宽 (秒)。降采样的桶宽是其中某一级的整数倍时直接读汇总表
+ROLLUP_LEVELS = (60, 3600)
+
+# 快门/阀门状态按数值存储，便于和其它读数一起降采样 (mean 即开启时间占比)
+STATE_VALUES = {"Open": 1.0, "Closed": 0.0}
+SCALAR_TYPES = (bool, int, float, str)  # append_readings 只存这些类型 (和 None) 的值
+
+_NUMBER_PATTERN = re.compile(r'[-+]?\d+(?:\.\d*)?(?:[Ee][-+]?\d+)?')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+	id INTEGER PRIMARY KEY,
+	name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS samples (
+	series_id INTEGER NOT NULL,
+	ts INTEGER NOT NULL,
+	value REAL,
+	PRIMARY KEY (series_id, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+	level INTEGER NOT NULL,
+	series_id INTEGER NOT NULL,
+	bucket INTEGER NOT NULL,
+	count INTEGER NOT NULL,
+	sum REAL NOT NULL,
+	min REAL,
+	max REAL,
+	PRIMARY KEY (level, series_id, bucket)
+) WITHOUT ROWID;
+"""
+
+Sample = Tuple[str, int, Optional[float]]  # (序列名, 时间戳 ms, 数值)
+
+
+def now_ms() -> int:
+	return int(time.time() * 1000)
+
+
+def parse_reading(value) -> Optional[float]:
+	"""
+	把读数转换为数值: 数字原样返回；"Open"/"Closed" 转为 1/0；
+	OCR 文本 (如 "1.23E-9"、"15.2K") 取开头的数；其它 (识别失败、Unknown) 返回 None
+	"""
+	if value is None or isinstance(value, bool):
+		return None if value is None else float(value)
+	if isinstance(value, (int, float)):
+		return None if math.isnan(value) else float(value)
+	text = str(value).strip()
+	if text in STATE_VALUES:
+		return STATE_VALUES[text]
+	match = _NUMBER_PATTERN.match(text)
+	if match is None:
+		return None
+	try:
+		return float(match.group())
+	except ValueError:
+		return None
+
+
+class TimeSeriesStore(LoggerMixin):
+	"""
+	一个 SQLite 文件中的多条时间序列。
+
+	写入方法线程安全；查询方法在调用线程自己的只读连接上执行 (WAL 下不会阻塞写入)。
+	background=False 时不启动写线程，缓冲区只在写满或手动 flush() 时落盘 (批量导入用)。
+	写入失败的批次放回缓冲区下次重试；缓冲区超过 max_buffer 条时丢弃最旧的样本，计入 rows_lost。
+	"""
+
+	def __init__(self, path: str, batch_size: int = 500, flush_interval: float = 1.0, background: bool = True,
+				 max_buffer: int = 100_000):
+		self.path = path
+		self.batch_size = max(1, batch_size)
+		self.flush_interval = flush_interval
+		self.max_buffer = max(self.batch_size, max_buffer)
+
+		self._write_lock = threading.Lock()  # 保护写连接和 series 缓存
+		self._buffer_lock = threading.Lock()
+		self._buffer: List[Sample] = []
+		self._wakeup = threading.Event()
+		self._closed = False
+		self._local = threading.local()
+		self._series: Dict[str, int] = {}
+		self.rows_written = 0
+		self.rows_lost = 0
+		self.flushes = 0
+
+		self._conn = self._connect()
+		self._conn.executescript(_SCHEMA)
+		self._series.update({name: sid for sid, name in self._conn.execute("SELECT id, name FROM series")})
+
+		self._writer = None
+		if background:
+			self._writer = threading.Thread(target=self._writer_loop, name="TimeSeriesWriter", daemon=True)
+			self._writer.start()
+
+	def _connect(self) -> sqlite3.Connection:
+		conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+		conn.execute("PRAGMA journal_mode=WAL")
+		# WAL 下 NORMAL 只在检查点时 fsync，掉电最多丢失最近几个事务，不会损坏数据库
+		conn.execute("PRAGMA synchronous=NORMAL")
+		conn.execute("PRAGMA temp_store=MEMORY")
+		return conn
+
+	def _reader(self) -> sqlite3.Connection:
+		conn = getattr(self._local, "conn", None)
+		if conn is None:
+			conn = self._connect()
+			self._local.conn = conn
+		return conn
+
+	# --- 写入 ---
+
+	def append(self, name: str, value, ts: Optional[int] = None) -> None:
+		"""缓冲一个样本，value 会经过 parse_reading 转换"""
+		self._enqueue([(name, now_ms() if ts is None else int(ts), parse_reading(value))])
+
+	def append_readings(self, readings: Mapping[str, object], ts: Optional[int] = None,
+						prefix: str = "") -> None:
+		"""
+		缓冲一次巡检的全部读数 (例如 analyze_frame 或 read_current_data 的结果)，共用一个时间戳。
+		非标量的值 (如 analyze_frame 的 reactor_texts 列表) 不是读数，直接跳过，不会产生全为 NULL 的序列
+		"""
+		ts = now_ms() if ts is None else int(ts)
+		self._enqueue([(prefix + name, ts, parse_reading(value)) for name, value in readings.items()
+					   if value is None or isinstance(value, SCALAR_TYPES)])
+
+	def append_many(self, samples: Iterable[Sample]) -> None:
+		"""缓冲多个已转换好的 (序列名, 时间戳 ms, 数值) 样本"""
+		self._enqueue(list(samples))
+
+	def _enqueue(self, samples: List[Sample]) -> None:
+		if self._closed:
+			raise RuntimeError("时序存储已关闭")
+		with self._buffer_lock:
+			self._buffer.extend(samples)
+			full = len(self._buffer) >= self.batch_size
+		if full:
+			if self._writer is None:
+				self.flush()
+			else:
+				self._wakeup.set()
+
+	def _writer_loop(self) -> None:
+		while not self._closed:
+			self._wakeup.wait(self.flush_interval)
+			self._wakeup.clear()
+			try:
+				self.flush()
+			except Exception as e:
+				self.logger.error(f"写入时序数据失败: {e}", exc_info=True)
+
+	def _series_id(self, name: str, created: Dict[str, int]) -> int:
+		"""
+		序列名 -> id。本事务中新建的序列先记在 created 里，提交后才并入 self._series：
+		事务回滚时这些 id 会被撤销，缓存里不能留下它们
+		"""
+		sid = self._series.get(name)
+		if sid is None:
+			sid = created.get(name)
+		if sid is None:
+			self._conn.execute("INSERT OR IGNORE INTO series (name) VALUES (?)", (name,))
+			sid = self._conn.execute("SELECT id FROM series WHERE name = ?", (name,)).fetchone()[0]
+			created[name] = sid
+		return sid
+
+	def _requeue(self, batch: List[Sample]) -> None:
+		"""把写入失败的批次放回缓冲区最前面，超出 max_buffer 的最旧样本丢弃"""
+		with self._buffer_lock:
+			self._buffer[:0] = batch
+			excess = len(self._buffer) - self.max_buffer
+			if excess > 0:
+				del self._buffer[:excess]
+				self.rows_lost += excess
+		if excess > 0:
+			self.logger.error(f"时序数据持续写入失败，缓冲区已满，丢弃了 {excess} 个最旧的样本")
+
+	def flush(self) -> int:
+		"""把缓冲区中的样本在一个事务中写入，返回写入的行数"""
+		with self._buffer_lock:
+			batch, self._buffer = self._buffer, []
+		if not batch:
+			return 0
+		with self._write_lock:
+			conn = self._conn
+			created: Dict[str, int] = {}
+			conn.execute("BEGIN")
+			try:
+				rows = [(self._series_id(name, created), ts, value) for name, ts, value in batch]
+				before = conn.total_changes
+				conn.executemany("INSERT OR IGNORE INTO samples (series_id, ts, value) VALUES (?, ?, ?)", rows)
+				inserted = conn.total_changes - before
+				if inserted == len(rows):
+					self._update_rollups(rows)
+				else:
+					# 有重复时间戳被忽略，增量汇总会重复计数，改为从原始样本重算受影响的桶
+					self._rebuild_rollups(rows)
+				conn.execute("COMMIT")
+			except BaseException:
+				conn.execute("ROLLBACK")
+				self._requeue(batch)
+				raise
+			self._series.update(created)
+		self.rows_written += inserted
+		self.flushes += 1
+		return inserted
+
+	def _update_rollups(self, rows: Sequence[Tuple[int, int, Optional[float]]]) -> None:
+		for level in ROLLUP_LEVELS:
+			width = level * 1000
+			acc: Dict[Tuple[int, int], List] = {}
+			for sid, ts, value in rows:
+				if value is None:
+					continue
+				key = (sid, ts - ts % width)
+				a = acc.get(key)
+				if a is None:
+					acc[key] = [1, value, value, value]
+				else:
+					a[0] += 1
+					a[1] += value
+					if value < a[2]:
+						a[2] = value
+					if value > a[3]:
+						a[3] = value
+			self._conn.executemany(
+				"INSERT INTO rollups (level, series_id, bucket, count, sum, min, max) VALUES (?, ?, ?, ?, ?, ?, ?) "
+				"ON CONFLICT (level, series_id, bucket) DO UPDATE SET "
+				"count = count + excluded.count, sum = sum + excluded.sum, "
+				"min = min(min, excluded.min), max = max(max, excluded.max)",
+				[(level, sid, bucket, c, s, lo, hi) for (sid, bucket), (c, s, lo, hi) in acc.items()])
+
+	def _rebuild_rollups(self, rows: Sequence[Tuple[int, int, Optional[float]]]) -> None:
+		for level in ROLLUP_LEVELS:
+			width = level * 1000
+			buckets = {(sid, ts - ts % width) for sid, ts, _ in rows}
+			for sid, bucket in buckets:
+				self._conn.execute("DELETE FROM rollups WHERE level = ? AND series_id = ? AND bucket = ?",
+								   (level, sid, bucket))
+				self._conn.execute(
+					"INSERT INTO rollups (level, series_id, bucket, count, sum, min, max) "
+					"SELECT ?, ?, ?, count(value), total(value), min(value), max(value) FROM samples "
+					"WHERE series_id = ? AND ts >= ? AND ts < ? HAVING count(value) > 0",
+					(level, sid, bucket, sid, bucket, bucket + width))
+
+	def close(self) -> None:
+		if self._closed:
+			return
+		self._closed = True
+		if self._writer is not None:
+			self._wakeup.set()
+			self._writer.join()
+		self.flush()
+		with self._write_lock:
+			self._conn.execute("PRAGMA optimize")
+			self._conn.close()
+		conn = getattr(self._local, "conn", None)
+		if conn is not None:
+			conn.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+	# --- 查询 ---
+
+	def series_names(self) -> List[str]:
+		return [name for (name,) in self._reader().execute("SELECT name FROM series ORDER BY name")]
+
+	def _lookup(self, name: str) -> Optional[int]:
+		row = self._reader().execute("SELECT id FROM series WHERE name = ?", (name,)).fetchone()
+		return row[0] if row else None
+
+	def range(self, name: str, start: int, end: int, chunk_size: int = 10000) -> Iterator[Tuple[int, Optional[float]]]:
+		"""按时间顺序逐条产出 [start, end) 内的 (时间戳 ms, 数值)，每次从数据库取 chunk_size 行"""
+		sid = self._lookup(name)
+		if sid is None:
+			return
+		cursor = self._reader().execute(
+			"SELECT ts, value FROM samples WHERE series_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+			(sid, int(start), int(end)))
+		while True:
+			rows = cursor.fetchmany(chunk_size)
+			if not rows:
+				break
+			yield from rows
+
+	def latest(self, name: str) -> Optional[Tuple[int, Optional[float]]]:
+		sid = self._lookup(name)
+		if sid is None:
+			return None
+		return self._reader().execute(
+			"SELECT ts, value FROM samples WHERE series_id = ? ORDER BY ts DESC LIMIT 1", (sid,)).fetchone()
+
+	def downsample(self, name: str, start: int, end: int,
+				   bucket_seconds: int) -> List[Tuple[int, Optional[float], Optional[float], Optional[float], int]]:
+		"""
+		按 bucket_seconds 分桶，返回 [(桶起点 ms, min, max, mean, 有效样本数)]。
+		桶按 Unix 时间的整数倍对齐，首尾两个桶按整桶统计 (start/end 会扩展到所在桶的边界)。
+		桶宽是汇总级别的整数倍时只读汇总表，否则在原始样本上 GROUP BY。
+		"""
+		sid = self._lookup(name)
+		if sid is None:
+			return []
+		width = int(bucket_seconds * 1000)
+		start = int(start) - int(start) % width
+		end = -(-int(end) // width) * width
+		level = next((lv for lv in sorted(ROLLUP_LEVELS, reverse=True) if bucket_seconds % lv == 0), None)
+		if level is not None:
+			rows = self._reader().execute(
+				"SELECT bucket / :w * :w AS b, min(min), max(max), total(sum), sum(count) FROM rollups "
+				"WHERE level = :level AND series_id = :sid AND bucket >= :start AND bucket < :end "
+				"GROUP BY b ORDER BY b",
+				{"w": width, "level": level, "sid": sid, "start": start, "end": end}).fetchall()
+		else:
+			rows = self._reader().execute(
+				"SELECT ts / :w * :w AS b, min(value), max(value), total(value), count(value) FROM samples "
+				"WHERE series_id = :sid AND ts >= :start AND ts < :end "
+				"GROUP BY b HAVING count(value) > 0 ORDER BY b",
+				{"w": width, "sid": sid, "start": start, "end": end}).fetchall()
+		return [(b, lo, hi, total / count if count else None, count) for b, lo, hi, total, count in rows]
+
+
+# --- 基准测试：批量写入吞吐 + 不同时间跨度的查询延迟 ---
+
+def main():
+	parser = argparse.ArgumentParser(description="时序存储写入吞吐与查询延迟基准测试")
+	parser.add_argument("--db", type=str, default="logs/timeseries_bench.db", help="测试数据库文件 (会被覆盖)")
+	parser.add_argument("--rows", type=int, default=10_000_000, help="写入的总行数")
+	parser.add_argument("--series", type=int, default=5, help="序列数 (每条序列 1 Hz)")
+	parser.add_argument("--batch-size", type=int, default=5000)
+	parser.add_argument("--queries", type=int, default=20, help="每种查询的重复次数")
+	args = parser.parse_args()
+
+	os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
+	for suffix in ("", "-wal", "-shm"):
+		if os.path.exists(args.db + suffix):
+			os.remove(args.db + suffix)
+
+	names = [f"series_{i}" for i in range(args.series)]
+	seconds = args.rows // args.series
+	t0 = 1_700_000_000_000
+	with TimeSeriesStore(args.db, batch_size=args.batch_size, background=False) as store:
+		start_time = time.perf_counter()
+		for s in range(seconds):
+			ts = t0 + s * 1000
+			store.append_many([(name, ts, math.sin(s / 600 + i) * 10 + i) for i, name in enumerate(names)])
+		store.flush()
+		elapsed = time.perf_counter() - start_time
+		print(f"写入 {store.rows_written} 行 ({args.series} 条序列 x {seconds / 86400:.1f} 天 1 Hz): "
+			  f"{elapsed:.1f} s, {store.rows_written / elapsed:,.0f} 行/秒, {store.flushes} 个事务")
+		print(f"数据库大小: {os.path.getsize(args.db) / 2 ** 20:.0f} MiB")
+
+		span_end = t0 + seconds * 1000
+		cases = [
+			("原始 1 小时", 3600, None),
+			("1 天 / 1 分钟桶", 86400, 60),
+			("1 天 / 5 分钟桶", 86400, 300),
+			("7 天 / 1 小时桶", 7 * 86400, 3600),
+			("30 天 / 1 小时桶", 30 * 86400, 3600),
+			("全部 / 1 天桶", seconds, 86400),
+			("1 小时 / 10 秒桶 (原始表)", 3600, 10),
+		]
+		for label, span, bucket in cases:
+			span_ms = min(span, seconds) * 1000
+			latencies = []
+			for q in range(args.queries):
+				begin = t0 + (q * 7919 * 1000) % max(1, span_end - span_ms - t0 + 1)
+				start_time = time.perf_counter()
+				if bucket is None:
+					n = sum(1 for _ in store.range(names[q % len(names)], begin, begin + span_ms))
+				else:
+					n = len(store.downsample(names[q % len(names)], begin, begin + span_ms, bucket))
+				latencies.append(time.perf_counter() - start_time)
+			latencies.sort()
+			print(f"  {label:24s} {n:6d} 行 | p50 {latencies[len(latencies) // 2] * 1000:8.2f} ms | "
+				  f"max {latencies[-1] * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+	main()
@@ -1,12 +1,19 @@
 import sys
-import psutil
+import atexit
 import ctypes
 import functools
 import logging
 import logging.handlers
 from pathlib import Path
+from typing import Optional
 
-BlockInput = ctypes.windll.user32.BlockInput
+from log_pipeline import SAMPLE_LOGGER, LogPipeline, SampleFormatter
+from metrics import stage_timer
+
+
+def BlockInput(block: bool) -> bool:
+	"""user32.BlockInput；ctypes.windll 只在 Windows 上存在，调用时才取，模块本身在 Linux 上也能导入"""
+	return ctypes.windll.user32.BlockInput(block)
 
 
 def run_as_admin():
@@ -30,12 +37,10 @@ def run_as_admin():
 
 
 def get_pids_by_name(process_name):
-	"""根据进程名获取所有匹配的PID列表"""
-	pids = []
-	for proc in psutil.process_iter(['pid', 'name']):
-		if proc.info['name'].lower() == process_name.lower():
-			pids.append(proc.info['pid'])
-	return pids
+	"""根据进程名获取所有匹配的PID列表 (按启动时间排序)；查询的是后台增量维护的进程索引，见 process_watcher.py"""
+	from process_watcher import default_watcher
+
+	return default_watcher().pids(process_name)
 
 
 def block_input(func):
@@ -71,10 +76,35 @@ def block_input(func):
 
 	return wrapper
 
-def setup_logger(log_level: int = logging.INFO) -> None:
+
+# setup_logger(queued=True) 启动的日志管线；重复调用 setup_logger 时先停止旧的
+_pipeline: Optional[LogPipeline] = None
+
+
+def _stop_pipeline() -> None:
+	"""写完并停止当前的日志管线，关闭它的文件句柄"""
+	global _pipeline
+	if _pipeline is None:
+		return
+	_pipeline.stop()
+	for handler in _pipeline.handlers:
+		handler.close()
+	_pipeline = None
+
+
+def setup_logger(log_level: int = logging.INFO, queued: bool = False, queue_size: int = 10000,
+				 overflow: str = "drop_new", sample_log: Optional[str] = None) -> Optional[LogPipeline]:
 	"""
 	为控制台程序设置一个简单的日志记录器
+
+	queued=True 时根日志器上只挂一个有界队列 (见 log_pipeline.py)，文件和控制台写入都在后台线程
+	完成，调用 logger.info() 的轮询线程不再等待磁盘、控制台和日志轮转；返回 LogPipeline
+	(stats() 给出丢弃条数)，程序退出时自动写完剩余的记录。重复调用时先停止上一次的管线。
+	sample_log 为采样日志 (JSON lines) 的文件名，见 log_pipeline.log_sample。
 	"""
+	global _pipeline
+	_stop_pipeline()
+
 	log_dir = Path("logs")
 	log_dir.mkdir(exist_ok=True)
 	log_file = log_dir / "debug_console.log"
@@ -94,14 +124,42 @@ def setup_logger(log_level: int = logging.INFO) -> None:
 		log_file, maxBytes=5 * 1024 * 1024, backupCount=2, encoding='utf-8'
 	)
 	file_handler.setFormatter(formatter)
-	root_logger.addHandler(file_handler)
 
 	# 控制台处理器
 	console_handler = logging.StreamHandler()
 	console_handler.setFormatter(formatter)
-	root_logger.addHandler(console_handler)
+	handlers = [file_handler, console_handler]
+
+	# 采样日志: 单独的日志器，不向根日志器传播；按名字筛选，只写入采样文件
+	sample_logger = logging.getLogger(SAMPLE_LOGGER)
+	sample_logger.handlers.clear()
+	sample_logger.propagate = False
+	sample_logger.setLevel(logging.INFO if sample_log else logging.CRITICAL + 1)
+	if sample_log:
+		sample_handler = logging.handlers.RotatingFileHandler(
+			log_dir / sample_log, maxBytes=50 * 1024 * 1024, backupCount=5, encoding='utf-8'
+		)
+		sample_handler.setFormatter(SampleFormatter())
+		sample_handler.addFilter(logging.Filter(SAMPLE_LOGGER))
+		for handler in handlers:
+			handler.addFilter(lambda record: record.name != SAMPLE_LOGGER)
+		handlers.append(sample_handler)
+
+	if queued:
+		_pipeline = LogPipeline(handlers, queue_size, overflow).start()
+		atexit.unregister(_stop_pipeline)  # 只保留一个退出钩子
+		atexit.register(_stop_pipeline)
+		root_logger.addHandler(_pipeline.handler)
+		if sample_log:
+			sample_logger.addHandler(_pipeline.handler)
+	else:
+		root_logger.addHandler(file_handler)
+		root_logger.addHandler(console_handler)
+		if sample_log:
+			sample_logger.addHandler(sample_handler)
 
 	logging.info("=" * 20 + " Logger Initialized " + "=" * 20)
+	return _pipeline
 
 
 class LoggerMixin:
@@ -113,6 +171,10 @@ class LoggerMixin:
 	def logger(self) -> logging.Logger:
 		return logging.getLogger(self.__class__.__name__)
 
+	def timed(self, stage: str):
+		"""with self.timed("ocr"): ... 把耗时记入 stage_seconds{component=类名, stage} (见 metrics.py)"""
+		return stage_timer(self.__class__.__name__, stage).time()
+
 
 if __name__ == "__main__":
 	molly_pids = get_pids_by_name("Clash for Windows.exe")